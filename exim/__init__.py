@@ -1 +1,5 @@
 from .exchange import Exchange
+from .archive import Retention
+from .sharding import ShardedExchange
+from .clock import VirtualClock
+from .simulation import Scheduler
@@ -0,0 +1,91 @@
+from .tape import TradeTape
+import numpy as np
+import os
+
+STATUSES = ("OPEN", "FILLED", "CANCELED")
+ORDER_DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("time", np.int64),
+        ("owner", np.int64),
+        ("side", np.int8),
+        ("quantity", np.int64),
+        ("price", np.int64),
+        ("status", np.int8),
+    ]
+)
+TRADE_DTYPE = np.dtype(list(TradeTape.columns))
+
+
+class Retention:
+    def __init__(
+        self,
+        max_closed_orders: int = None,
+        max_trades: int = None,
+        max_age: int = None,
+        path: str = None,
+        chunk: int = 1024,
+    ):
+        # limits of the in-memory history of a market, max_age is in nanoseconds
+        # evicted history is appended to files under path, or dropped when path is None, closed orders
+        # are evicted by the time they were filled or canceled
+        # limits are enforced once every chunk operations, so memory may exceed them by one chunk
+        assert chunk > 0
+        self.max_closed_orders = max_closed_orders
+        self.max_trades = max_trades
+        self.max_age = max_age
+        self.path = path
+        self.chunk = chunk
+
+    def __repr__(self):
+        return (
+            f"Retention(max_closed_orders={self.max_closed_orders}, max_trades={self.max_trades}, "
+            f"max_age={self.max_age}, path={self.path})"
+        )
+
+
+class Archive:
+    # append-only binary files of the orders and trades evicted from one market
+    def __init__(self, path: str, symbol: str):
+        os.makedirs(path, exist_ok=True)
+        self.orders_path = os.path.join(path, f"{symbol}-orders.bin")
+        self.trades_path = os.path.join(path, f"{symbol}-trades.bin")
+        for path in (self.orders_path, self.trades_path):
+            if not os.path.exists(path):
+                open(path, "wb").close()
+
+    def empty(self) -> bool:
+        return os.path.getsize(self.orders_path) == 0 and os.path.getsize(self.trades_path) == 0
+
+    def truncate(self, orders: int = 0, trades: int = 0):
+        # keep only the first orders and trades records
+        with open(self.orders_path, "r+b") as f:
+            f.truncate(orders * ORDER_DTYPE.itemsize)
+        with open(self.trades_path, "r+b") as f:
+            f.truncate(trades * TRADE_DTYPE.itemsize)
+
+    @staticmethod
+    def _append(path: str, records: np.ndarray):
+        with open(path, "ab") as f:
+            records.tofile(f)
+
+    @staticmethod
+    def _read(path: str, dtype: np.dtype):
+        if os.path.getsize(path) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r")
+
+    def append_orders(self, records: np.ndarray):
+        self._append(self.orders_path, records)
+
+    def append_trades(self, records: np.ndarray):
+        self._append(self.trades_path, records)
+
+    def orders(self):
+        return self._read(self.orders_path, ORDER_DTYPE)
+
+    def trades(self):
+        return self._read(self.trades_path, TRADE_DTYPE)
+
+    def __repr__(self):
+        return f"Archive(orders={self.orders_path}, trades={self.trades_path})"
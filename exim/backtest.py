@@ -0,0 +1,298 @@
+from .codes import Code
+from .clock import VirtualClock
+from .events import REJECTED
+from .tape import SIDES
+from .units import from_units, to_units_array, in_range_array
+from .sharding import ShardedExchange
+import numpy as np
+import pandas as pd
+import itertools
+import struct
+import os
+
+# recorded order flow of one market, NEW messages add orders and CANCEL messages remove them by external id
+# account_id is optional, messages without one (or with a negative one) trade for the replay account
+# price is 0 or missing for market orders, quantities and prices that are not finite are rejected
+MESSAGE_COLUMNS = ("time", "action", "order_id", "account_id", "side", "quantity", "price")
+ACTIONS = ("NEW", "CANCEL")
+
+# binary message files are a header followed by fixed size records
+MAGIC = b"EXIMMSGS"
+VERSION = 1
+HEADER = struct.Struct("<8sH6x")
+MESSAGE_DTYPE = np.dtype(
+    [
+        ("time", "<i8"),
+        ("order_id", "<i8"),
+        ("account_id", "<i8"),
+        ("quantity", "<f8"),
+        ("price", "<f8"),
+        ("action", "u1"),
+        ("side", "u1"),
+    ]
+)
+
+
+def _codes(values, names: tuple):
+    # index of each value in names, strings in any case or integer codes, -1 for anything else
+    values = np.asarray(values)
+    if values.dtype.kind in "iub":
+        values = values.astype(np.int64)
+        return np.where((values >= 0) & (values < len(names)), values, -1)
+    values = np.char.upper(values.astype(str))
+    codes = np.full(len(values), -1, dtype=np.int64)
+    for code, name in enumerate(names):
+        codes[values == name] = code
+    return codes
+
+
+def _missing_as_zero(prices):
+    # a missing price (nan) is a market order, infinities are kept to be rejected
+    return np.where(np.isnan(prices), 0.0, prices)
+
+
+def _normalize(columns) -> dict:
+    # message columns as numpy arrays: time, cancel, order_id, account_id, side (index in SIDES), quantity, price
+    if isinstance(columns, pd.DataFrame):
+        columns = {name: columns[name].to_numpy() for name in columns.columns}
+    size = len(columns["time"])
+    account_ids = columns.get("account_id")
+    sides = columns.get("side")
+    quantities = columns.get("quantity")
+    prices = columns.get("price")
+    return dict(
+        time=np.asarray(columns["time"], dtype=np.int64),
+        cancel=_codes(columns["action"], ACTIONS) == 1,
+        invalid=_codes(columns["action"], ACTIONS) < 0,
+        order_id=np.asarray(columns["order_id"], dtype=np.int64),
+        account_id=np.full(size, -1, dtype=np.int64) if account_ids is None else np.asarray(account_ids, dtype=np.int64),
+        side=np.full(size, -1, dtype=np.int64) if sides is None else _codes(sides, SIDES),
+        quantity=np.zeros(size) if quantities is None else np.asarray(quantities, dtype=np.float64),
+        price=np.zeros(size) if prices is None else _missing_as_zero(np.asarray(prices, dtype=np.float64)),
+    )
+
+
+def read_csv(path: str, chunksize: int = 65536):
+    for frame in pd.read_csv(path, chunksize=chunksize, usecols=lambda name: name in MESSAGE_COLUMNS):
+        yield frame
+
+
+def read_parquet(path: str, chunksize: int = 65536):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("reading parquet files needs pyarrow") from None
+    parquet = pq.ParquetFile(path)
+    names = [name for name in parquet.schema_arrow.names if name in MESSAGE_COLUMNS]
+    for batch in parquet.iter_batches(batch_size=chunksize, columns=names):
+        yield {name: batch.column(name).to_numpy(zero_copy_only=False) for name in names}
+
+
+def read_binary(path: str, chunksize: int = 65536):
+    with open(path, "rb") as f:
+        magic, version = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a message file")
+        while True:
+            records = np.fromfile(f, dtype=MESSAGE_DTYPE, count=chunksize)
+            if not len(records):
+                return
+            yield {name: records[name] for name in MESSAGE_DTYPE.names}
+
+
+def read_messages(path: str, chunksize: int = 65536):
+    # chunks of at most chunksize messages of a csv, parquet or binary file, chosen by extension
+    name = path.lower()
+    if name.endswith((".csv", ".csv.gz", ".csv.bz2", ".csv.zip", ".csv.xz")):
+        return read_csv(path, chunksize)
+    if name.endswith((".parquet", ".pq")):
+        return read_parquet(path, chunksize)
+    return read_binary(path, chunksize)
+
+
+def write_messages(path: str, chunks) -> int:
+    # write chunks of messages, column dicts or dataframes, to a binary message file and return their number
+    count = 0
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION))
+        for chunk in chunks:
+            columns = _normalize(chunk)
+            records = np.empty(len(columns["time"]), dtype=MESSAGE_DTYPE)
+            for name in ("time", "order_id", "account_id", "quantity", "price"):
+                records[name] = columns[name]
+            records["action"] = np.where(columns["invalid"], 255, columns["cancel"])
+            records["side"] = np.where(columns["side"] < 0, 255, columns["side"])
+            records.tofile(f)
+            count += len(records)
+    return count
+
+
+class ReplayChunk:
+    # what a chunk of messages did: its trades with external order ids and the top of the book after it
+    def __init__(self, time: int, messages: int, rejected: int, trades: pd.DataFrame, book: pd.DataFrame = None):
+        # time of the last message
+        self.time = time
+        self.messages = messages
+        self.rejected = rejected
+        self.trades = trades
+        self.book = book
+
+    def __repr__(self):
+        return f"ReplayChunk(time={self.time}, messages={self.messages}, rejected={self.rejected}, trades={len(self.trades)})"
+
+
+class Replay:
+    # streams recorded order flow of one market through an exchange chunk by chunk
+    # memory stays bounded by the chunk size and the resting orders, as long as the market is registered
+    # with a Retention that bounds its history and a chunk does not trade more than it keeps
+    def __init__(self, exchange, market: str, account_id: int = None, funding: float = 1e12, depth: int = 10):
+        # the replay follows the orders, trades and book of the market in this process
+        if isinstance(exchange, ShardedExchange):
+            raise TypeError("a replay needs an Exchange, the books of a ShardedExchange live in its shard processes")
+        self.exchange = exchange
+        self.market = exchange.markets[market.upper()]
+        # messages without an account trade for this account, funded with both symbols when it is created
+        if account_id is None:
+            exchange.register_account(name="replay")
+            account_id = max(exchange.accounts.keys())
+            for symbol in (self.market.base, self.market.qoute):
+                exchange.deposit(account_id, symbol, funding)
+        self.account_id = account_id
+        # levels per side of the book after each chunk, None for no book
+        self.depth = depth
+        # resting orders by external id and external ids by internal id
+        self.orders = dict()
+        self.external = dict()
+        self.last_trade = int(self.market.trades.last("id")) if len(self.market.trades) else -1
+        self.messages = 0
+
+    def run(self, source, chunksize: int = 65536):
+        # replay a message file or an iterable of message chunks, yields a ReplayChunk per chunk
+        chunks = read_messages(source, chunksize) if isinstance(source, (str, os.PathLike)) else source
+        for chunk in chunks:
+            yield self.process(chunk)
+
+    def process(self, chunk) -> ReplayChunk:
+        # replay one chunk of messages, column dicts or a dataframe
+        exchange, market = self.exchange, self.market
+        columns = _normalize(chunk)
+        size = len(columns["time"])
+        account_ids = np.where(columns["account_id"] < 0, self.account_id, columns["account_id"])
+        cancel = columns["cancel"]
+        # validate like process_orders, the first failing check of a message decides its code
+        codes = np.zeros(size, dtype=np.int8)
+        # values that are not finite or whose units do not fit 64 bits are rejected before they are converted
+        quantity_valid = in_range_array(columns["quantity"], market.base_decimals)
+        price_valid = in_range_array(columns["price"], market.qoute_decimals)
+        quantity_units = to_units_array(np.where(quantity_valid, columns["quantity"], 0.0), market.base_decimals)
+        price_units = to_units_array(np.where(price_valid, columns["price"], 0.0), market.qoute_decimals)
+        checks = (
+            (columns["invalid"], Code.INVALID_SIDE),
+            (~np.isin(account_ids, np.fromiter(exchange.accounts.keys(), dtype=np.int64)), Code.INVALID_ACCOUNT),
+            (~cancel & (columns["side"] < 0), Code.INVALID_SIDE),
+            (~cancel & (~quantity_valid | (quantity_units <= 0)), Code.INVALID_QUANTITY),
+            (~cancel & (~price_valid | (price_units < 0)), Code.INVALID_PRICE),
+        )
+        for failed, code in checks:
+            codes[(codes == 0) & failed] = code
+        clock = exchange.clock if isinstance(exchange.clock, VirtualClock) else None
+        observed = bool(exchange.observers)
+        orders, external = self.orders, self.external
+        accounts = exchange.accounts
+        rows = zip(
+            codes.tolist(),
+            columns["time"].tolist(),
+            cancel.tolist(),
+            columns["order_id"].tolist(),
+            account_ids.tolist(),
+            columns["side"].tolist(),
+            quantity_units.tolist(),
+            price_units.tolist(),
+        )
+        rejected = 0
+        for code, created, is_cancel, order_id, account_id, side, quantity, price in rows:
+            if clock is not None and created > clock.time:
+                clock.set(created)
+            if code:
+                rejected += 1
+                if observed:
+                    exchange._emit(REJECTED, Code(code), account_id=account_id, market=market.symbol)
+                continue
+            if is_cancel:
+                order = orders.pop(order_id, None)
+                if order is None:
+                    code = Code.ORDER_NOT_FOUND
+                    command = ("cancel", accounts[account_id], market, None)
+                else:
+                    command = ("cancel", accounts[order.owner], market, order.id)
+                    code = exchange._cancel(*command[1:])
+                internal = None
+            else:
+                if not self.exchange.fixed_point:
+                    quantity = from_units(quantity, market.base_decimals)
+                    price = from_units(price, market.qoute_decimals)
+                command = ("place", accounts[account_id], market, SIDES[side], quantity, price or None, created)
+                code, order = exchange._place(*command[1:])
+                internal = None if order is None else order.id
+                if order is not None:
+                    external[order.id] = order_id
+                    if order.status == "OPEN":
+                        orders[order_id] = order
+            if code:
+                rejected += 1
+            if observed:
+                exchange._executed(command, code, internal)
+        self.messages += size
+        trades = self._trades()
+        # forget orders that were filled while resting
+        for order_id in [order_id for order_id, order in orders.items() if order.status != "OPEN"]:
+            del orders[order_id]
+        self.external = {order.id: order_id for order_id, order in orders.items()}
+        book = None if self.depth is None else self._book()
+        return ReplayChunk(int(columns["time"][-1]) if size else None, size, rejected, trades, book)
+
+    def _trades(self) -> pd.DataFrame:
+        # trades since the last chunk, order ids are mapped back to external ids
+        tape = self.market.trades
+        start = int(np.searchsorted(tape.column("id"), self.last_trade, side="right"))
+        columns = {name: tape.column(name, start).copy() for name, _ in tape.columns}
+        if len(columns["id"]):
+            self.last_trade = int(columns["id"][-1])
+        external = self.external
+        for name in ("maker_order", "taker_order"):
+            columns[name] = np.fromiter(
+                (external.get(order_id, -1) for order_id in columns[name].tolist()), dtype=np.int64, count=len(columns[name])
+            )
+        trades = pd.DataFrame(
+            {
+                "time": columns["time"],
+                "price": columns["price"],
+                "quantity": columns["quantity"],
+                "side": pd.Categorical.from_codes(columns["side"], categories=SIDES),
+                "maker": columns["maker"],
+                "taker": columns["taker"],
+                "maker_order": columns["maker_order"],
+                "taker_order": columns["taker_order"],
+            },
+            index=pd.Index(columns["id"], name="id"),
+        )
+        return trades
+
+    def _book(self) -> pd.DataFrame:
+        # best depth levels of each side in price order, like get_orderbook
+        market = self.market
+        bids, asks = market.orderbook.bids.depth, market.orderbook.asks.depth
+        levels = [
+            (market.price_value(price), market.quantity_value(bids[price]), "BID")
+            for price in itertools.islice(reversed(bids.keys()), self.depth)
+        ][::-1]
+        levels += [
+            (market.price_value(price), market.quantity_value(asks[price]), "ASK")
+            for price in itertools.islice(asks.keys(), self.depth)
+        ]
+        book = pd.DataFrame(levels, columns=["price", "volume", "type"])
+        book.set_index("price", inplace=True)
+        return book
+
+    def __repr__(self):
+        return f"Replay(market={self.market.symbol}, messages={self.messages}, resting={len(self.orders)})"
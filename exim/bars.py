@@ -0,0 +1,134 @@
+from collections import deque
+import numpy as np
+
+
+class BarSeries:
+    # ohlcv bars of one interval in nanoseconds, the open bar is kept in attributes and written
+    # to a ring buffer of the last capacity closed bars when the first trade of a later interval arrives
+    columns = (
+        ("time", np.int64),
+        ("open", np.float64),
+        ("high", np.float64),
+        ("low", np.float64),
+        ("close", np.float64),
+        ("volume", np.float64),
+        ("notional", np.float64),
+        ("trades", np.int64),
+    )
+
+    def __init__(self, interval: int, capacity: int = 1024):
+        assert interval > 0 and capacity > 0
+        self.interval = interval
+        self.capacity = capacity
+        self.arrays = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.columns}
+        # closed bars written so far
+        self.count = 0
+        self.start = None
+        self.open = self.high = self.low = self.close = 0.0
+        self.volume = self.notional = 0.0
+        self.trades = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity) + (self.start is not None)
+
+    def update(self, time: int, price: float, quantity: float):
+        start = time - time % self.interval
+        if self.start is None or start > self.start:
+            if self.start is not None:
+                self._close()
+            self.start = start
+            self.open = self.high = self.low = price
+            self.volume = self.notional = 0.0
+            self.trades = 0
+        elif price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += quantity
+        self.notional += price * quantity
+        self.trades += 1
+
+    def _close(self):
+        i = self.count % self.capacity
+        arrays = self.arrays
+        arrays["time"][i] = self.start
+        arrays["open"][i] = self.open
+        arrays["high"][i] = self.high
+        arrays["low"][i] = self.low
+        arrays["close"][i] = self.close
+        arrays["volume"][i] = self.volume
+        arrays["notional"][i] = self.notional
+        arrays["trades"][i] = self.trades
+        self.count += 1
+
+    def last(self, n: int = None):
+        # columns of the last n bars in time order, the open bar last
+        n = len(self) if n is None else min(n, len(self))
+        taken = max(0, n - (self.start is not None))
+        rows = np.arange(self.count - taken, self.count) % self.capacity
+        columns = dict()
+        for name, dtype in self.columns:
+            column = np.empty(n, dtype=dtype)
+            column[:taken] = self.arrays[name][rows]
+            if n > taken:
+                column[taken] = self.start if name == "time" else getattr(self, name)
+            columns[name] = column
+        return columns
+
+    def __repr__(self):
+        return f"BarSeries(interval={self.interval}, bars={len(self)})"
+
+
+class RollingVWAP:
+    # volume and notional of the trades of the last window nanoseconds
+    def __init__(self, window: int):
+        assert window > 0
+        self.window = window
+        self.trades = deque()
+        self.volume = 0.0
+        self.notional = 0.0
+        self.time = None
+
+    def update(self, time: int, price: float, quantity: float):
+        self.trades.append((time, quantity, price * quantity))
+        self.volume += quantity
+        self.notional += price * quantity
+        self.time = time
+        self.evict(time)
+
+    def evict(self, now: int):
+        trades = self.trades
+        while trades and trades[0][0] <= now - self.window:
+            _, quantity, notional = trades.popleft()
+            self.volume -= quantity
+            self.notional -= notional
+        if not trades:
+            # start again from exact zeros once the window is empty
+            self.volume = self.notional = 0.0
+
+    def value(self, now: int = None):
+        # volume and vwap of the window ending at now or at the last trade, vwap is None without trades
+        if now is not None:
+            self.evict(now)
+        elif self.time is not None:
+            self.evict(self.time)
+        return self.volume, self.notional / self.volume if self.trades else None
+
+    def __repr__(self):
+        return f"RollingVWAP(window={self.window}, trades={len(self.trades)})"
+
+
+class Bars:
+    # bar series and rolling vwap windows of one market, updated with every trade
+    def __init__(self, intervals=(10**9, 60 * 10**9, 300 * 10**9), capacity: int = 1024, windows=(60 * 10**9,)):
+        self.series = {interval: BarSeries(interval, capacity) for interval in intervals}
+        self.windows = {window: RollingVWAP(window) for window in windows}
+        self.accumulators = list(self.series.values()) + list(self.windows.values())
+
+    def update(self, time: int, price: float, quantity: float):
+        for accumulator in self.accumulators:
+            accumulator.update(time, price, quantity)
+
+    def __repr__(self):
+        return f"Bars(intervals={list(self.series)}, windows={list(self.windows)})"
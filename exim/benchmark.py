@@ -0,0 +1,301 @@
+from .exchange import Exchange
+from collections import defaultdict
+import numpy as np
+import tracemalloc
+import platform
+import argparse
+import random
+import math
+import json
+import time
+import sys
+
+# scenarios are generators of timed calls, they yield (operation, function, args) and receive the result of the call
+# everything they do between two yields, including their setup, is not timed
+
+QUERIES = ("get_orderbook", "get_trades", "get_orders", "get_wallet")
+
+
+def _setup(exchange: Exchange, markets: list, accounts: int):
+    # usd quoted markets of symbols with 8 decimals, every account funded with every symbol
+    exchange.register_symbol("usd", unit_decimals=2)
+    for base in markets:
+        exchange.register_symbol(base, unit_decimals=8)
+        exchange.register_market(base=base, qoute="usd")
+    for i in range(accounts):
+        exchange.register_account(name=f"trader{i}")
+    account_ids = list(range(accounts))
+    exchange.deposit_many(account_ids, "usd", [1e12] * accounts)
+    for base in markets:
+        exchange.deposit_many(account_ids, base, [1e8] * accounts)
+
+
+def _order(exchange: Exchange, ids: dict, account_id: int, market: str, side: str, quantity: float, price: float = None):
+    # place an order and return the id the exchange gave it, None when it was rejected
+    function = exchange.buy if side == "BUY" else exchange.sell
+    accepted = yield side.lower(), function, (account_id, market, quantity, price)
+    if not accepted:
+        return None
+    # order ids of a market count accepted orders from zero
+    order_id = ids[market]
+    ids[market] += 1
+    return order_id
+
+
+def _query(exchange: Exchange, rng: random.Random, account_id: int, market: str):
+    # one of the read calls a client of the exchange makes between orders
+    operation = rng.choice(QUERIES)
+    if operation == "get_orderbook":
+        yield operation, exchange.get_orderbook, (market,)
+    elif operation == "get_trades":
+        yield operation, exchange.get_trades, (market, None, 100)
+    elif operation == "get_orders":
+        yield operation, exchange.get_orders, (account_id, market, "open")
+    else:
+        yield operation, exchange.get_wallet, (account_id,)
+
+
+def _random_walk(exchange: Exchange, rng: random.Random, orders: int, markets: list, accounts: int, mid: float):
+    # limit and market orders around a random walk mid price of each market, some canceled later
+    ids = defaultdict(int)
+    mids = dict.fromkeys(markets, mid)
+    resting = defaultdict(list)
+    for _ in range(orders):
+        market = rng.choice(markets)
+        account_id = rng.randrange(accounts)
+        mids[market] *= math.exp(rng.gauss(0, 0.0005))
+        action = rng.random()
+        if action < 0.02:
+            yield from _query(exchange, rng, account_id, market)
+        elif action < 0.12 and resting[account_id, market]:
+            pending = resting[account_id, market]
+            order_id = pending.pop(rng.randrange(len(pending)))
+            yield "cancel", exchange.cancel, (account_id, market, order_id)
+        else:
+            side = rng.choice(("BUY", "SELL"))
+            quantity = round(rng.uniform(0.001, 1), 8)
+            if action < 0.27:
+                yield from _order(exchange, ids, account_id, market, side, quantity)
+                continue
+            # mostly passive with a third of the orders crossing the mid price
+            offset = rng.uniform(0, 0.005) if rng.random() < 0.67 else -rng.uniform(0, 0.002)
+            price = round(mids[market] * (1 - offset if side == "BUY" else 1 + offset), 2)
+            order_id = yield from _order(exchange, ids, account_id, market, side, quantity, price)
+            if order_id is not None:
+                resting[account_id, market].append(order_id)
+
+
+def random_walk(exchange: Exchange, rng: random.Random, orders: int):
+    # the btcusd flow of the readme with a handful of traders
+    _setup(exchange, ["btc"], 10)
+    yield from _random_walk(exchange, rng, orders, ["BTCUSD"], 10, 16000.0)
+
+
+def deep_sweep(exchange: Exchange, rng: random.Random, orders: int, depth: int = 500):
+    # books rebuilt over many price levels and swept by large market orders
+    _setup(exchange, ["btc"], 10)
+    ids = defaultdict(int)
+    placed = 0
+    while placed < orders:
+        for side, sign in (("SELL", 1), ("BUY", -1)):
+            for level in range(depth):
+                price = round(16000.0 + sign * (1 + level) * 0.5, 2)
+                yield from _order(exchange, ids, rng.randrange(10), "BTCUSD", side, round(rng.uniform(0.01, 0.1), 8), price)
+            # take most of the side just built
+            taker = "BUY" if side == "SELL" else "SELL"
+            volume = depth * 0.05
+            yield from _order(exchange, ids, rng.randrange(10), "BTCUSD", taker, round(volume, 8))
+            placed += depth + 1
+            if rng.random() < 0.05:
+                yield from _query(exchange, rng, rng.randrange(10), "BTCUSD")
+
+
+def market_making(exchange: Exchange, rng: random.Random, orders: int, makers: int = 8, quotes: int = 20):
+    # makers keep a ladder of quotes and replace the oldest one as the mid price moves, takers trade now and then
+    _setup(exchange, ["btc"], makers + 4)
+    ids = defaultdict(int)
+    mid = 16000.0
+    ladders = [[] for _ in range(makers)]
+    count = 0
+    while count < orders:
+        mid *= math.exp(rng.gauss(0, 0.0002))
+        maker = rng.randrange(makers)
+        ladder = ladders[maker]
+        if len(ladder) >= quotes:
+            yield "cancel", exchange.cancel, (maker, "BTCUSD", ladder.pop(0))
+            count += 1
+        side = rng.choice(("BUY", "SELL"))
+        offset = rng.uniform(0.0001, 0.002)
+        price = round(mid * (1 - offset if side == "BUY" else 1 + offset), 2)
+        order_id = yield from _order(exchange, ids, maker, "BTCUSD", side, round(rng.uniform(0.01, 0.5), 8), price)
+        if order_id is not None:
+            ladder.append(order_id)
+        count += 1
+        if rng.random() < 0.05:
+            taker = makers + rng.randrange(4)
+            yield from _order(exchange, ids, taker, "BTCUSD", rng.choice(("BUY", "SELL")), round(rng.uniform(0.01, 1), 8))
+            count += 1
+        if rng.random() < 0.02:
+            yield from _query(exchange, rng, maker, "BTCUSD")
+
+
+def many_accounts(exchange: Exchange, rng: random.Random, orders: int, accounts: int = 10000):
+    # the random walk flow spread over many accounts
+    _setup(exchange, ["btc"], accounts)
+    yield from _random_walk(exchange, rng, orders, ["BTCUSD"], accounts, 16000.0)
+
+
+def many_markets(exchange: Exchange, rng: random.Random, orders: int, markets: int = 50):
+    # the random walk flow spread over many markets
+    bases = [f"s{i}" for i in range(markets)]
+    _setup(exchange, bases, 100)
+    yield from _random_walk(exchange, rng, orders, [f"{base.upper()}USD" for base in bases], 100, 100.0)
+
+
+SCENARIOS = {
+    "random_walk": random_walk,
+    "deep_sweep": deep_sweep,
+    "market_making": market_making,
+    "many_accounts": many_accounts,
+    "many_markets": many_markets,
+}
+
+
+def _drive(scenario, exchange: Exchange, seed: int, orders: int, clock=None):
+    # run a scenario, timing every call with clock when one is given
+    calls = scenario(exchange, random.Random(seed), orders)
+    latencies = defaultdict(list)
+    result = None
+    while True:
+        try:
+            operation, function, args = calls.send(result)
+        except StopIteration:
+            return latencies
+        if clock is None:
+            result = function(*args)
+            continue
+        start = clock()
+        result = function(*args)
+        latencies[operation].append(clock() - start)
+
+
+def run_scenario(name: str, orders: int = 20000, seed: int = 0, fixed_point: bool = False, memory: bool = True):
+    # throughput, latency percentiles in microseconds and peak traced memory of one scenario
+    scenario = SCENARIOS[name]
+    exchange = Exchange(verbose=False, fixed_point=fixed_point)
+    start = time.perf_counter()
+    latencies = _drive(scenario, exchange, seed, orders, time.perf_counter_ns)
+    wall = time.perf_counter() - start
+    result = dict(operations=sum(len(values) for values in latencies.values()), wall_seconds=wall)
+    busy = sum(sum(values) for values in latencies.values()) / 1e9
+    placed = sum(len(latencies.get(operation, ())) for operation in ("buy", "sell", "cancel"))
+    result["seconds"] = busy
+    result["orders"] = placed
+    result["orders_per_sec"] = placed / busy if busy else 0.0
+    result["trades"] = sum(len(market.trades) for market in exchange.markets.values())
+    result["latency"] = dict()
+    for operation, values in sorted(latencies.items()):
+        values = np.array(values, dtype=np.float64) / 1e3
+        p50, p99, p999 = np.percentile(values, [50, 99, 99.9])
+        result["latency"][operation] = dict(
+            count=len(values), mean=float(values.mean()), p50=float(p50), p99=float(p99), p999=float(p999)
+        )
+    if memory:
+        # the same flow again on a fresh exchange, tracing is too slow to share a run with the timings
+        del exchange
+        tracemalloc.start()
+        _drive(scenario, Exchange(verbose=False, fixed_point=fixed_point), seed, orders)
+        result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def run(scenarios=None, orders: int = 20000, seed: int = 0, fixed_point: bool = False, memory: bool = True):
+    # results of the given scenarios, all of them by default, with the environment they ran in
+    results = dict(
+        version=1,
+        python=platform.python_version(),
+        numpy=np.__version__,
+        machine=platform.machine(),
+        orders=orders,
+        seed=seed,
+        fixed_point=fixed_point,
+        scenarios=dict(),
+    )
+    for name in scenarios or SCENARIOS:
+        results["scenarios"][name] = run_scenario(name, orders, seed, fixed_point, memory)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.1):
+    # rows of (scenario, metric, baseline, current, change) and whether any change is a regression beyond tolerance
+    rows = []
+    regressed = False
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", dict()).get(name)
+        if previous is None:
+            continue
+        metrics = [("orders_per_sec", current["orders_per_sec"], previous["orders_per_sec"], True)]
+        for operation, latency in current["latency"].items():
+            if operation in previous["latency"]:
+                metrics.append((f"{operation} p99", latency["p99"], previous["latency"][operation]["p99"], False))
+        if "peak_memory" in current and "peak_memory" in previous:
+            metrics.append(("peak_memory", current["peak_memory"], previous["peak_memory"], False))
+        for metric, value, reference, higher_is_better in metrics:
+            change = value / reference - 1 if reference else 0.0
+            worse = -change if higher_is_better else change
+            regressed = regressed or worse > tolerance
+            rows.append((name, metric, reference, value, change))
+    return rows, regressed
+
+
+def _report(results: dict, out=sys.stdout):
+    for name, result in results["scenarios"].items():
+        print(
+            f"{name}: {result['orders']} orders in {result['seconds']:.3f}s "
+            f"({result['orders_per_sec']:.0f} orders/s), {result['trades']} trades",
+            file=out,
+        )
+        for operation, latency in result["latency"].items():
+            print(
+                f"  {operation:<14}{latency['count']:>8}  p50 {latency['p50']:>9.1f}us  "
+                f"p99 {latency['p99']:>9.1f}us  p999 {latency['p999']:>9.1f}us",
+                file=out,
+            )
+        if "peak_memory" in result:
+            print(f"  peak memory {result['peak_memory'] / 2**20:.1f} MiB", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m exim.benchmark", description="benchmark exim with seeded order flow")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run, all by default ({', '.join(SCENARIOS)})")
+    parser.add_argument("--orders", type=int, default=20000, help="orders per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixed-point", action="store_true", help="run the exchange in fixed point mode")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced run measuring peak memory")
+    parser.add_argument("--output", help="write the results as json to this path")
+    parser.add_argument("--baseline", help="compare against results written earlier with --output")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}")
+    results = run(args.scenarios, args.orders, args.seed, args.fixed_point, not args.no_memory)
+    _report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressed = compare(results, baseline, args.tolerance)
+        for name, metric, reference, value, change in rows:
+            print(f"{name:<14} {metric:<20} {reference:>14.1f} -> {value:>14.1f}  {change:+.1%}")
+        if regressed:
+            print(f"Failed: regression beyond {args.tolerance:.0%} of the baseline")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+import time
+
+
+class WallClock:
+    # nanoseconds since the epoch
+    def now(self) -> int:
+        return time.time_ns()
+
+    def __repr__(self):
+        return "WallClock()"
+
+
+class VirtualClock:
+    # nanoseconds of simulated time, moved forward by a scheduler or by hand
+    def __init__(self, start: int = 0):
+        self.time = start
+
+    def now(self) -> int:
+        return self.time
+
+    def set(self, time: int):
+        assert time >= self.time, "virtual time can not go back"
+        self.time = time
+
+    def advance(self, delay: int):
+        self.set(self.time + delay)
+
+    def __repr__(self):
+        return f"VirtualClock(time={self.time})"
@@ -0,0 +1,36 @@
+from enum import IntEnum
+
+
+class Code(IntEnum):
+    # result codes of exchange operations
+    OK = 0
+    INVALID_ACCOUNT = 1
+    INVALID_MARKET = 2
+    INVALID_SIDE = 3
+    INVALID_QUANTITY = 4
+    INVALID_PRICE = 5
+    NOT_ENOUGH_ORDERS = 6
+    NOT_ENOUGH_BALANCE = 7
+    ORDER_NOT_FOUND = 8
+    INVALID_SYMBOL = 9
+    NOT_TRACKED = 10
+    INVALID_TIME_IN_FORCE = 11
+    NOT_SUPPORTED = 12
+    INTERNAL_ERROR = 13
+
+
+MESSAGES = {
+    Code.INVALID_ACCOUNT: "Failed: invalid account id",
+    Code.INVALID_MARKET: "Failed: invalid market",
+    Code.INVALID_SIDE: "Failed: invalid side",
+    Code.INVALID_QUANTITY: "Failed: invalid quantity",
+    Code.INVALID_PRICE: "Failed: invalid price",
+    Code.NOT_ENOUGH_ORDERS: "Failed: not enough orders to trade",
+    Code.NOT_ENOUGH_BALANCE: "Failed: not enough balance",
+    Code.ORDER_NOT_FOUND: "Failed: order not found",
+    Code.INVALID_SYMBOL: "Register failed: symbol not listed",
+    Code.NOT_TRACKED: "Failed: not tracked",
+    Code.INVALID_TIME_IN_FORCE: "Failed: invalid time in force",
+    Code.NOT_SUPPORTED: "Failed: not supported",
+    Code.INTERNAL_ERROR: "Failed: internal error",
+}
@@ -0,0 +1,108 @@
+from .codes import Code
+
+# event kinds, every event carries a reason code, OK unless it is REJECTED
+REGISTERED = "REGISTERED"
+DEPOSITED = "DEPOSITED"
+WITHDRAWN = "WITHDRAWN"
+ACCEPTED = "ACCEPTED"
+REJECTED = "REJECTED"
+FILLED = "FILLED"
+CANCELED = "CANCELED"
+AMENDED = "AMENDED"
+TRIGGERED = "TRIGGERED"
+BATCH = "BATCH"
+
+
+class Event:
+    __slots__ = (
+        "kind",
+        "code",
+        "message",
+        "account_id",
+        "market",
+        "symbol",
+        "order_id",
+        "side",
+        "price",
+        "quantity",
+        "trade_id",
+        "liquidity",
+    )
+
+    def __init__(
+        self,
+        kind: str,
+        code: Code = Code.OK,
+        message: str = None,
+        account_id: int = None,
+        market: str = None,
+        symbol: str = None,
+        order_id: int = None,
+        side: str = None,
+        price=None,
+        quantity=None,
+        trade_id: int = None,
+        liquidity: str = None,
+    ):
+        # message is what a verbose exchange prints for the event, None for events it never printed
+        # symbol is the asset of deposits and withdrawals, liquidity is MAKER or TAKER for fills
+        # and every fill is reported once to each side
+        self.kind = kind
+        self.code = code
+        self.message = message
+        self.account_id = account_id
+        self.market = market
+        self.symbol = symbol
+        self.order_id = order_id
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+        self.trade_id = trade_id
+        self.liquidity = liquidity
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)}" for name in self.__slots__[3:] if getattr(self, name) is not None)
+        return f"Event(kind={self.kind}, code={self.code.name}{', ' if fields else ''}{fields})"
+
+
+class Observer:
+    # receives every event of an exchange, dispatched to the on_<kind> method of its kind
+    def __call__(self, event: Event):
+        getattr(self, f"on_{event.kind.lower()}")(event)
+
+    def on_registered(self, event: Event):
+        pass
+
+    def on_deposited(self, event: Event):
+        pass
+
+    def on_withdrawn(self, event: Event):
+        pass
+
+    def on_accepted(self, event: Event):
+        pass
+
+    def on_rejected(self, event: Event):
+        pass
+
+    def on_filled(self, event: Event):
+        pass
+
+    def on_canceled(self, event: Event):
+        pass
+
+    def on_amended(self, event: Event):
+        pass
+
+    def on_triggered(self, event: Event):
+        pass
+
+    def on_batch(self, event: Event):
+        pass
+
+
+class PrintObserver(Observer):
+    # the output of a verbose exchange
+    def __call__(self, event: Event):
+        if event.message is not None:
+            print(event.message)
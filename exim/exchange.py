@@ -1,376 +1,1379 @@
-from .models import Asset, Account, Order
+from .models import Account, Order, OrderRegistry, TIME_IN_FORCE
+from .ledger import Ledger
 from .market import Market
+from .archive import Archive, Retention, STATUSES
+from .tape import SIDES
+from .codes import Code, MESSAGES
+from .events import (
+    Event,
+    PrintObserver,
+    REGISTERED,
+    DEPOSITED,
+    WITHDRAWN,
+    ACCEPTED,
+    REJECTED,
+    FILLED,
+    CANCELED,
+    AMENDED,
+    TRIGGERED,
+    BATCH,
+)
+from .stats import Stats, timed
+from .clock import WallClock, VirtualClock
+from .journal import (
+    Journal,
+    read_journal,
+    record_time,
+    REGISTER_SYMBOL,
+    REGISTER_MARKET,
+    REGISTER_ACCOUNT,
+    DEPOSIT,
+    WITHDRAW,
+    ORDER,
+    STOP,
+    TIMED_ORDER,
+    EXPIRE,
+    CANCEL_ALL,
+    AMEND,
+)
+from .snapshot import save_snapshot, load_snapshot, market_state
+from .frames import FORMATS, pandas, is_frame, table
+from .units import to_decimal, to_units, from_units, to_units_array, in_range, in_range_array
 from decimal import Decimal
-import pandas as pd
+import numpy as np
 import itertools
-import time
+import heapq
 
 
 class Exchange:
-    def __init__(self, verbose=True):
+    def __init__(self, verbose=True, fixed_point=False, journal=None, stats=False, clock=None):
         self.symbols = []
         self.unit_decimals = dict()
+        # decimals of the integer balances kept per symbol in fixed point mode
+        self.ledger_decimals = dict()
+        self.fixed_point = fixed_point
         self.markets = dict()
         self.accounts = dict()
+        # balances of every account and symbol, wallets of accounts are views of it
+        self.ledger = Ledger(self._zero())
         self.account_id_counter = itertools.count()
-        self.verbose = verbose
+        # time of orders and trades, read once per order, a VirtualClock makes runs reproducible
+        self.clock = WallClock() if clock is None else clock
+        # callables receiving every event (exim.events), a verbose exchange prints through a PrintObserver
+        self.observers = [PrintObserver()] if verbose else []
+        # event counters and latency histograms, kept while stats are enabled
+        self.stats = None
+        if stats:
+            self.enable_stats()
+        # accepted commands are appended to the journal when one is given (a path or a Journal)
+        self.journal = Journal(journal) if isinstance(journal, str) else journal
+        if self.journal is not None:
+            self.journal.open(fixed_point)
 
+    @property
+    def verbose(self) -> bool:
+        return any(isinstance(observer, PrintObserver) for observer in self.observers)
+
+    @verbose.setter
+    def verbose(self, verbose: bool):
+        self.observers = [observer for observer in self.observers if not isinstance(observer, PrintObserver)]
+        if verbose:
+            self.observers.insert(0, PrintObserver())
+
+    def add_observer(self, observer):
+        # observer is called with every event from now on, an exim.events.Observer or any callable
+        self.observers.append(observer)
+        return True
+
+    def remove_observer(self, observer):
+        if observer in self.observers:
+            self.observers.remove(observer)
+        return True
+
+    def close(self):
+        # flush and close the journal, nothing can be journaled after it
+        if self.journal is not None:
+            self.journal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _emit(self, kind: str, code: Code = Code.OK, message: str = None, **fields):
+        if self.observers:
+            event = Event(kind, code, message, **fields)
+            for observer in self.observers:
+                observer(event)
+
+    def enable_stats(self):
+        # count events and record the latency of public methods and of matching
+        if self.stats is None:
+            self.stats = Stats()
+            self.observers.append(self.stats)
+            for market in self.markets.values():
+                market.stats = self.stats
+        return True
+
+    def disable_stats(self):
+        if self.stats is not None:
+            self.observers.remove(self.stats)
+            self.stats = None
+            for market in self.markets.values():
+                market.stats = None
+        return True
+
+    def get_stats(self):
+        # counters by event kind (rejections by reason code) and latency percentiles in microseconds
+        if self.stats is None:
+            self._failed(Code.NOT_TRACKED, "Failed: stats not enabled")
+            return None
+        return self.stats.snapshot()
+
+    def _zero(self):
+        return 0 if self.fixed_point else Decimal("0.0")
+
+    def _unit_in(self, value: float, symbol: str):
+        # convert a quantity or price of symbol to its internal representation
+        if self.fixed_point:
+            return to_units(value, self.unit_decimals[symbol])
+        return to_decimal(value, self.unit_decimals[symbol])
+
+    def _amount_in(self, value: float, symbol: str):
+        # convert a wallet amount of symbol to its ledger representation
+        if self.fixed_point:
+            shift = self.ledger_decimals[symbol] - self.unit_decimals[symbol]
+            return to_units(value, self.unit_decimals[symbol]) * 10**shift
+        return to_decimal(value, self.unit_decimals[symbol])
+
+    def _amount_out(self, value, symbol: str):
+        # convert a ledger amount of symbol to decimal
+        if self.fixed_point:
+            return from_units(value, self.ledger_decimals[symbol])
+        return value
+
+    def _amount_units(self, amount, symbol: str) -> int:
+        # integer units of symbol in a ledger amount
+        if self.fixed_point:
+            return amount // 10 ** (self.ledger_decimals[symbol] - self.unit_decimals[symbol])
+        return int(amount.scaleb(self.unit_decimals[symbol]))
+
+    def _amount_from_units(self, units: int, symbol: str):
+        # ledger amount of integer units of symbol
+        if self.fixed_point:
+            return units * 10 ** (self.ledger_decimals[symbol] - self.unit_decimals[symbol])
+        return from_units(units, self.unit_decimals[symbol])
+
+    def _rescale_ledger(self, symbol: str, decimals: int):
+        # widen the ledger of symbol so notional amounts of its markets stay exact integers
+        if decimals > self.ledger_decimals[symbol]:
+            self.ledger.scale(symbol, 10 ** (decimals - self.ledger_decimals[symbol]))
+            self.ledger_decimals[symbol] = decimals
+        self._update_factors()
+
+    def _update_factors(self):
+        for market in self.markets.values():
+            market.base_factor = 10 ** (self.ledger_decimals[market.base] - market.base_decimals)
+            market.qoute_factor = 10 ** (
+                self.ledger_decimals[market.qoute] - market.base_decimals - market.qoute_decimals
+            )
+
+    @timed()
     def register_symbol(self, symbol: str, unit_decimals: int = 0):
         symbol = symbol.upper()
         self.symbols.append(symbol)
         self.unit_decimals[symbol] = unit_decimals
-        if self.verbose:
-            print(f"Symbol registered: {symbol}")
+        self.ledger_decimals[symbol] = unit_decimals
+        self.ledger.add_symbol(symbol)
+        for account in self.accounts.values():
+            account.wallet[symbol] = self.ledger.asset(account.id, symbol)
+        if self.journal is not None:
+            self.journal.register_symbol(symbol, unit_decimals)
+        self._emit(REGISTERED, message=f"Symbol registered: {symbol}", symbol=symbol)
         return True
 
-    def register_market(self, base: str, qoute: str):
+    @timed()
+    def register_market(self, base: str, qoute: str, retention: Retention = None):
+        # the archive files of a market with a retention path must be empty, history of an earlier exchange
+        # is never overwritten nor mixed with this one
         base = base.upper()
         qoute = qoute.upper()
         if base in self.symbols and qoute in self.symbols:
-            market = Market(base, qoute)
+            if retention is not None and retention.path is not None and not Archive(retention.path, base + qoute).empty():
+                raise ValueError(f"archive of {base}{qoute} under {retention.path} is not empty")
+            market = Market(
+                base,
+                qoute,
+                base_decimals=self.unit_decimals[base],
+                qoute_decimals=self.unit_decimals[qoute],
+                fixed_point=self.fixed_point,
+                retention=retention,
+            )
+            market.stats = self.stats
             self.markets[market.symbol] = market
-            if self.verbose:
-                print(f"Market registered: {market.symbol}")
+            for account in self.accounts.values():
+                account.orders[market.symbol] = OrderRegistry()
+            if self.fixed_point:
+                self._rescale_ledger(qoute, self.unit_decimals[base] + self.unit_decimals[qoute])
+            if self.journal is not None:
+                self.journal.register_market(base, qoute, retention)
+            self._emit(REGISTERED, message=f"Market registered: {market.symbol}", market=market.symbol)
             return True
-        if self.verbose:
-            print("Register failed: symbol not listed")
-        return False
+        return self._failed(Code.INVALID_SYMBOL, market=f"{base}{qoute}")
 
+    @timed()
     def register_account(self, name: str):
         account = Account(name=name)
         account.id = next(self.account_id_counter)
+        self._add_account(account)
+        if self.journal is not None:
+            self.journal.register_account(name)
+        self._emit(REGISTERED, message=f"Account registered with id: {account.id}", account_id=account.id)
+        return True
+
+    def _add_account(self, account: Account):
+        # give an account its row of the ledger, a wallet view per symbol and a registry per market
+        self.ledger.reserve(account.id)
         for symbol in self.symbols:
-            account.wallet[symbol] = Asset(Decimal("0.0"))
+            account.wallet[symbol] = self.ledger.asset(account.id, symbol)
         for symbol in self.markets.keys():
-            account.orders[symbol] = dict(open=[], closed=[])
+            account.orders[symbol] = OrderRegistry()
         self.accounts[account.id] = account
-        if self.verbose:
-            print(f"Account registered with id: {account.id}")
-        return True
 
+    @timed()
     def deposit(self, account_id: int, symbol: str, quantity: float):
         symbol = symbol.upper()
-        quantity = Decimal(str(round(quantity, self.unit_decimals[symbol])))
-        self.accounts[account_id].wallet[symbol].unlocked += quantity
-        if self.verbose:
-            print("Deposit successful")
+        code = self._deposit_code([account_id], symbol, [quantity])
+        if code != Code.OK:
+            return self._failed(code, "Deposit failed", account_id=account_id, symbol=symbol)
+        amount = self._amount_in(quantity, symbol)
+        self._deposit(self.accounts[account_id], symbol, amount)
+        self._emit(
+            DEPOSITED,
+            message="Deposit successful",
+            account_id=account_id,
+            symbol=symbol,
+            quantity=self._amount_out(amount, symbol),
+        )
         return True
 
+    def _deposit(self, account: Account, symbol: str, amount):
+        account.wallet[symbol].unlocked += amount
+        if self.journal is not None:
+            self.journal.deposit(account.id, symbol, self._amount_units(amount, symbol))
+
+    @timed()
+    def deposit_many(self, account_ids, symbol: str, quantities):
+        # deposit quantities of symbol to many accounts in one ledger update, repeated accounts get every deposit
+        symbol = symbol.upper()
+        account_ids = np.asarray(account_ids, dtype=np.int64)
+        quantities = np.asarray(quantities, dtype=np.float64)
+        code = self._deposit_code(account_ids, symbol, quantities)
+        if code != Code.OK:
+            return self._failed(code, "Deposit failed", symbol=symbol)
+        if self.fixed_point:
+            shift = self.ledger_decimals[symbol] - self.unit_decimals[symbol]
+            amounts = to_units_array(quantities, self.unit_decimals[symbol]).astype(object) * 10**shift
+        else:
+            amounts = np.empty(len(quantities), dtype=object)
+            amounts[:] = [to_decimal(quantity, self.unit_decimals[symbol]) for quantity in quantities.tolist()]
+        self.ledger.credit(account_ids, symbol, amounts)
+        if self.journal is not None:
+            for account_id, amount in zip(account_ids.tolist(), amounts.tolist()):
+                self.journal.deposit(account_id, symbol, self._amount_units(amount, symbol))
+        # one event for the whole deposit with the total amount
+        if self.observers:
+            total = self._amount_out(amounts.sum(initial=self._zero()), symbol)
+            self._emit(DEPOSITED, message="Deposit successful", symbol=symbol, quantity=total)
+        return True
+
+    def _deposit_code(self, account_ids, symbol: str, quantities) -> Code:
+        # checks shared by deposit and deposit_many, quantities must be finite and not negative
+        if symbol not in self.unit_decimals:
+            return Code.INVALID_SYMBOL
+        known = np.fromiter(self.accounts.keys(), dtype=np.int64)
+        if not np.isin(np.asarray(account_ids, dtype=np.int64), known).all():
+            return Code.INVALID_ACCOUNT
+        quantities = np.asarray(quantities, dtype=np.float64)
+        if not (np.isfinite(quantities) & (quantities >= 0)).all():
+            return Code.INVALID_QUANTITY
+        return Code.OK
+
+    @timed()
     def withdraw(self, account_id: int, symbol: str, quantity: float):
         symbol = symbol.upper()
-        quantity = Decimal(str(round(quantity, self.unit_decimals[symbol])))
-        if 0 < quantity <= self.accounts[account_id].wallet[symbol].unlocked:
-            self.accounts[account_id].wallet[symbol].unlocked += quantity
-            if self.verbose:
-                print("Withdraw successful")
+        amount = self._amount_in(quantity, symbol)
+        if self._withdraw(self.accounts[account_id], symbol, amount):
+            self._emit(
+                WITHDRAWN,
+                message="Withdraw successful",
+                account_id=account_id,
+                symbol=symbol,
+                quantity=self._amount_out(amount, symbol),
+            )
+            return True
+        return self._failed(Code.NOT_ENOUGH_BALANCE, "Withdraw failed", account_id=account_id, symbol=symbol)
+
+    def _withdraw(self, account: Account, symbol: str, amount):
+        if 0 < amount <= account.wallet[symbol].unlocked:
+            account.wallet[symbol].unlocked -= amount
+            if self.journal is not None:
+                self.journal.withdraw(account.id, symbol, self._amount_units(amount, symbol))
             return True
-        if self.verbose:
-            print("Withdraw failed")
         return False
 
-    def buy(self, account_id: int, market: str, quantity: Decimal, price: Decimal = None):
-        def _calculate_buy_cost(market: str, quantity: Decimal, price: Decimal):
-            # calculate buy cost according to existing ask orders
-            cost = 0
-            quantity_to_trade = quantity
-            depth = self.markets[market].orderbook.asks.depth.copy()
-            if price is not None:
-                while depth:
-                    ask_price, ask_volume = depth.popitem(0)
-                    if price <= ask_price:
-                        cost += quantity_to_trade * price
-                        return cost
-                    else:
-                        if quantity_to_trade <= ask_volume:
-                            cost += quantity_to_trade * ask_price
-                            quantity_to_trade = 0
-                            return cost
-                        else:
-                            cost += ask_volume * ask_price
-                            quantity_to_trade -= ask_volume
-                cost += quantity_to_trade * price
-                quantity_to_trade = 0
-                return cost
-            else:
-                while depth:
-                    ask_price, ask_volume = depth.popitem(0)
-                    if quantity_to_trade <= ask_volume:
-                        cost += quantity_to_trade * ask_price
-                        quantity_to_trade = 0
-                        return cost
-                    else:
-                        cost += ask_volume * ask_price
-                        quantity_to_trade -= ask_volume
-                if quantity_to_trade:
-                    return None
-                return cost
+    def _failed(self, code: Code, message: str = None, **fields):
+        # report a rejection to the observers, with the message of its code unless one is given
+        self._emit(REJECTED, code, MESSAGES[code] if message is None else message, **fields)
+        return False
 
+    @timed()
+    def buy(
+        self,
+        account_id: int,
+        market: str,
+        quantity: Decimal,
+        price: Decimal = None,
+        stop: Decimal = None,
+        time_in_force: str = "GTC",
+        expires: int = None,
+    ):
+        # with a stop price the order waits until a trade at or above it, then buys at price or at market
+        return self._order(account_id, market, "BUY", quantity, price, stop, time_in_force, expires)
+
+    @timed()
+    def sell(
+        self,
+        account_id: int,
+        market: str,
+        quantity: Decimal,
+        price: Decimal = None,
+        stop: Decimal = None,
+        time_in_force: str = "GTC",
+        expires: int = None,
+    ):
+        # with a stop price the order waits until a trade at or below it, then sells at price or at market
+        return self._order(account_id, market, "SELL", quantity, price, stop, time_in_force, expires)
+
+    def _order(
+        self,
+        account_id: int,
+        market: str,
+        side: str,
+        quantity: Decimal,
+        price: Decimal = None,
+        stop: Decimal = None,
+        time_in_force: str = "GTC",
+        expires: int = None,
+    ):
+        # IOC cancels what a limit order can not fill at once, FOK only trades when the whole quantity fills at once
+        # and GTT rests until the expires time in nanoseconds, market orders fill at once or not at all
+        # stop orders are good till canceled
         # fetch market and account
         if account_id not in self.accounts.keys():
-            if self.verbose:
-                print("Failed: invalid account id")
-            return False
+            return self._failed(Code.INVALID_ACCOUNT, account_id=account_id, market=market, side=side)
         if market not in self.markets.keys():
-            if self.verbose:
-                print("Failed: invalid market")
-            return False
+            return self._failed(Code.INVALID_MARKET, account_id=account_id, market=market, side=side)
         market = self.markets[market.upper()]
         account = self.accounts[account_id]
-        # convert to decimal
-        quantity = Decimal(str(round(quantity, self.unit_decimals[market.base])))
-        price = Decimal(str(round(price, self.unit_decimals[market.qoute]))) if price else None
+        if not in_range(quantity, market.base_decimals):
+            return self._failed(Code.INVALID_QUANTITY, account_id=account_id, market=market.symbol, side=side)
+        if (price and not in_range(price, market.qoute_decimals)) or (stop and not in_range(stop, market.qoute_decimals)):
+            return self._failed(Code.INVALID_PRICE, account_id=account_id, market=market.symbol, side=side)
+        # convert to internal units
+        quantity = self._unit_in(quantity, market.base)
+        price = self._unit_in(price, market.qoute) if price else None
+        stop = self._unit_in(stop, market.qoute) if stop else None
         if quantity <= 0:
-            if self.verbose:
-                print("Failed: invalid quantity")
-            return False
-        if price is not None and price <= 0:
-            if self.verbose:
-                print("Failed: invalid price")
-            return False
-        # detemine cost
-        cost = _calculate_buy_cost(market.symbol, quantity, price)
-        # validate
-        if cost is None:
-            # not enough orders to trade
-            if self.verbose:
-                print("Failed: not enough orders to trade")
-            return False
-        if account.wallet[market.qoute].unlocked < cost:
-            if self.verbose:
-                print("Failed: not enough balance")
-            return False
-        # lock balance
-        account.wallet[market.qoute].unlocked -= cost
-        account.wallet[market.qoute].locked += cost
-        # create order
+            return self._failed(Code.INVALID_QUANTITY, account_id=account_id, market=market.symbol, side=side)
+        if (price is not None and price <= 0) or (stop is not None and stop <= 0):
+            return self._failed(Code.INVALID_PRICE, account_id=account_id, market=market.symbol, side=side)
+        time_in_force = str(time_in_force).upper()
+        if (
+            time_in_force not in TIME_IN_FORCE
+            or (time_in_force == "GTT") != (expires is not None)
+            or (time_in_force == "GTT" and price is None)
+            or (time_in_force != "GTC" and stop is not None)
+        ):
+            return self._failed(Code.INVALID_TIME_IN_FORCE, account_id=account_id, market=market.symbol, side=side)
+        if stop is not None:
+            code, order = self._place_stop(account, market, side, quantity, price, stop)
+        else:
+            code, order = self._place(account, market, side, quantity, price, None, time_in_force, expires)
+        if code:
+            return self._failed(code, account_id=account_id, market=market.symbol, side=side)
+        if self.observers:
+            self._accepted(market, order)
+        return True
+
+    def _accepted(self, market: Market, order: Order, message: bool = True):
+        # an order was processed, after the fills it took part in as taker
+        self._emit(
+            ACCEPTED,
+            message=f"Order executed with id: {order.id}" if message else None,
+            account_id=order.owner,
+            market=market.symbol,
+            order_id=order.id,
+            side=order.side,
+            price=market.price_value(order.price),
+            quantity=market.quantity_value(order.initial_quantity),
+        )
+
+    def _lock(self, account: Account, market: Market, side: str, quantity, price) -> Code:
+        # lock the funds a validated order in internal units needs against the current book
+        if side == "BUY":
+            cost = market.orderbook.asks.sweep(quantity, price)
+            if cost is None:
+                return Code.NOT_ENOUGH_ORDERS
+            cost *= market.qoute_factor
+            asset = account.wallet[market.qoute]
+        else:
+            if price is None and quantity > market.orderbook.bids.volume:
+                return Code.NOT_ENOUGH_ORDERS
+            cost = quantity * market.base_factor
+            asset = account.wallet[market.base]
+        if asset.unlocked < cost:
+            return Code.NOT_ENOUGH_BALANCE
+        asset.unlocked -= cost
+        asset.locked += cost
+        return Code.OK
+
+    def _register(self, account: Account, market: Market, side: str, quantity, price, created: int = None, stop=None):
         order = Order(
-            time=time.time_ns(),
+            time=self.clock.now() if created is None else created,
             owner=account.id,
-            side="BUY",
+            side=side,
             quantity=quantity,
             price=price,
         )
-        # register order
+        order.stop = stop
         order.id = next(market.order_id_counter)
         order.status = "OPEN"
         market.orders[order.id] = order
-        account.orders[market.symbol]["open"].append(order.id)
-        # process order
-        trades, filled_orders = market.process_order(order=order)
-        # review trades and apply transactions
-        for tid in trades:
-            # fetch trade
-            trade = market.trades[tid]
-            # fetch maker and taker and adjust assets
-            maker = self.accounts[trade.maker]  # seller
-            taker = self.accounts[trade.taker]  # buyer
-            maker.wallet[market.base].locked -= trade.quantity
-            maker.wallet[market.qoute].unlocked += trade.quantity * trade.price
-            taker.wallet[market.qoute].locked -= trade.quantity * trade.price
-            taker.wallet[market.base].unlocked += trade.quantity
+        account.orders[market.symbol].add(order)
+        return order
+
+    def _place(
+        self,
+        account: Account,
+        market: Market,
+        side: str,
+        quantity,
+        price,
+        created: int = None,
+        time_in_force: str = "GTC",
+        expires: int = None,
+    ):
+        # lock funds for a validated order in internal units, match it and settle the trades
+        now = self.clock.now() if created is None else created
+        # orders that expired by now leave the book before anything trades against them
+        if market.expiries and market.expiries[0][0] <= now:
+            self._expire(market, now)
+        if expires is not None and expires <= now:
+            return Code.INVALID_TIME_IN_FORCE, None
+        # fill or kill is checked against the depth index before the book is touched
+        if time_in_force == "FOK":
+            opposite = market.orderbook.asks if side == "BUY" else market.orderbook.bids
+            if opposite.available(price) < quantity:
+                return Code.NOT_ENOUGH_ORDERS, None
+        code = self._lock(account, market, side, quantity, price)
+        if code:
+            return code, None
+        order = self._register(account, market, side, quantity, price, now)
+        if self.journal is not None:
+            self.journal.order(
+                account.id,
+                market.symbol,
+                side,
+                market.to_units(quantity, market.base_decimals),
+                market.to_units(price, market.qoute_decimals),
+                order.time,
+                TIME_IN_FORCE.index(time_in_force),
+                expires or 0,
+            )
+        self._match(account, market, order, rest=time_in_force not in ("IOC", "FOK"))
+        if expires is not None and order.status == "OPEN":
+            order.expires = expires
+            heapq.heappush(market.expiries, (expires, order.id, order))
+        return Code.OK, order
+
+    def _match(self, account: Account, market: Market, order: Order, now: int = None, rest: bool = True):
+        # match an order whose funds are locked, settle its trades and run the stops they reach
+        trades, filled_orders = market.process_order(order=order, now=now, rest=rest)
+        if trades:
+            self._settle(account, market, order.side, trades)
+        if not rest and order.status == "OPEN":
+            # the unfilled quantity of an immediate order is canceled instead of resting
+            order.status = "CANCELED"
+            self._unlock(account, market, order)
+            filled_orders.append(order.id)
         # handle account orders
+        now = order.time if now is None else now
         for order_id in filled_orders:
-            owner = self.accounts[market.orders[order_id].owner]
-            owner.orders[market.symbol]["open"].remove(order_id)
-            owner.orders[market.symbol]["closed"].append(order_id)
-        if self.verbose:
-            print(f"Order executed with id: {order.id}")
-        return True
+            self._close(market, market.orders[order_id], now)
+        if market.retention is not None:
+            self._retain(market, now)
+        if trades and market.stops.count:
+            self._trigger(market, trades)
 
-    def sell(self, account_id: int, market: str, quantity: Decimal, price: Decimal = None):
-        # fetch market and account
+    def _place_stop(self, account: Account, market: Market, side: str, quantity, price, stop, created: int = None):
+        # a stop order holds no funds while it waits for a trade to reach its stop price
+        order = self._register(account, market, side, quantity, price, created, stop)
+        market.stops.push(order)
+        if self.journal is not None:
+            self.journal.stop(
+                account.id,
+                market.symbol,
+                side,
+                market.to_units(quantity, market.base_decimals),
+                market.to_units(price, market.qoute_decimals),
+                market.to_units(stop, market.qoute_decimals),
+                order.time,
+            )
+        return Code.OK, order
+
+    def _trigger(self, market: Market, trades: list):
+        # match the stops reached by trades in time order, stops reached by their own trades join the queue
+        # triggered stops trade at the time of the trades that reached them
+        stops = market.stops
+        prices = [trade.price for trade in trades]
+        stops.trigger(min(prices), max(prices))
+        if stops.draining:
+            return
+        stops.draining = True
+        now = trades[-1].time
+        try:
+            while stops.pending:
+                _, _, order = heapq.heappop(stops.pending)
+                self._activate(market, order, now)
+        finally:
+            stops.draining = False
+
+    def _activate(self, market: Market, order: Order, now: int):
+        # a triggered stop becomes a market or limit order, it is canceled when its funds are not available
+        account = self.accounts[order.owner]
+        code = self._lock(account, market, order.side, order.quantity, order.price)
+        if code:
+            order.status = "CANCELED"
+            self._close(market, order, now)
+            if self.observers:
+                self._emit(REJECTED, code, account_id=order.owner, market=market.symbol, order_id=order.id, side=order.side)
+            return code
+        if self.observers:
+            self._emit(
+                TRIGGERED,
+                account_id=order.owner,
+                market=market.symbol,
+                order_id=order.id,
+                side=order.side,
+                price=market.price_value(order.price),
+                quantity=market.quantity_value(order.quantity),
+            )
+        self._match(account, market, order, now)
+        return Code.OK
+
+    def _close(self, market: Market, order: Order, now: int):
+        self.accounts[order.owner].orders[market.symbol].close(order)
+        market.close(order, now)
+
+    def _retain(self, market: Market, now: int):
+        # evict by the time of the command, so a replay evicts the same orders
+        for order in market.enforce_retention(now):
+            self.accounts[order.owner].orders[market.symbol].forget(order)
+
+    def _settle(self, taker: Account, market: Market, side: str, trades: list):
+        # apply transactions to makers and settle the taker once for the whole batch
+        base, qoute = market.base, market.qoute
+        quantity = notional = 0
+        if side == "BUY":
+            for trade in trades:
+                maker = self.accounts[trade.maker]  # seller
+                maker.wallet[base].locked -= trade.quantity * market.base_factor
+                maker.wallet[qoute].unlocked += trade.quantity * trade.price * market.qoute_factor
+                quantity += trade.quantity
+                notional += trade.quantity * trade.price
+            taker.wallet[qoute].locked -= notional * market.qoute_factor
+            taker.wallet[base].unlocked += quantity * market.base_factor
+        else:
+            for trade in trades:
+                maker = self.accounts[trade.maker]  # buyer
+                maker.wallet[qoute].locked -= trade.quantity * trade.price * market.qoute_factor
+                maker.wallet[base].unlocked += trade.quantity * market.base_factor
+                quantity += trade.quantity
+                notional += trade.quantity * trade.price
+            taker.wallet[base].locked -= quantity * market.base_factor
+            taker.wallet[qoute].unlocked += notional * market.qoute_factor
+        if self.observers:
+            self._filled(market, trades)
+
+    def _filled(self, market: Market, trades: list):
+        # one fill event per trade for each of its maker and taker
+        for trade in trades:
+            price, quantity = market.price_value(trade.price), market.quantity_value(trade.quantity)
+            taker_side = "SELL" if trade.side == "BUY" else "BUY"
+            for account_id, order_id, side, liquidity in (
+                (trade.maker, trade.maker_order, trade.side, "MAKER"),
+                (trade.taker, trade.taker_order, taker_side, "TAKER"),
+            ):
+                self._emit(
+                    FILLED,
+                    account_id=account_id,
+                    market=market.symbol,
+                    order_id=order_id,
+                    side=side,
+                    price=price,
+                    quantity=quantity,
+                    trade_id=trade.id,
+                    liquidity=liquidity,
+                )
+
+    @timed()
+    def cancel(self, account_id: int, market: str, order_id: int):
         if account_id not in self.accounts.keys():
-            if self.verbose:
-                print("Failed: invalid account id")
-            return False
+            return self._failed(Code.INVALID_ACCOUNT, account_id=account_id, market=market, order_id=order_id)
         if market not in self.markets.keys():
-            if self.verbose:
-                print("Failed: invalid market")
-            return False
+            return self._failed(Code.INVALID_MARKET, account_id=account_id, market=market, order_id=order_id)
+        # fetch market and account
         market = self.markets[market.upper()]
         account = self.accounts[account_id]
-        # convert to decimal
-        quantity = Decimal(str(round(quantity, self.unit_decimals[market.base])))
-        price = Decimal(str(round(price, self.unit_decimals[market.qoute]))) if price else None
-        if quantity <= 0:
-            if self.verbose:
-                print("Failed: invalid quantity")
-            return False
-        if price is not None and price <= 0:
-            if self.verbose:
-                print("Failed: invalid price")
-            return False
-        # detemine cost
-        cost = quantity
-        # validate
-        if price is None and cost > market.orderbook.bids.volume:
-            # not enough orders to trade
-            if self.verbose:
-                print("Failed: not enough orders to trade")
-            return False
-        if account.wallet[market.base].unlocked < cost:
-            if self.verbose:
-                print("Failed: not enough balance")
-            return False
-        # lock shares
-        account.wallet[market.base].unlocked -= cost
-        account.wallet[market.base].locked += cost
-        # create order
-        order = Order(
-            time=time.time_ns(),
-            owner=account.id,
-            side="SELL",
-            quantity=quantity,
-            price=price,
+        code = self._cancel(account, market, order_id)
+        if code:
+            return self._failed(code, account_id=account_id, market=market.symbol, order_id=order_id)
+        self._emit(
+            CANCELED, message=f"Order canceled with id: {order_id}", account_id=account_id, market=market.symbol, order_id=order_id
         )
-        # register order
-        order.id = next(market.order_id_counter)
-        order.status = "OPEN"
-        market.orders[order.id] = order
-        account.orders[market.symbol]["open"].append(order.id)
-        # process order
-        trades, filled_orders = market.process_order(order=order)
-        # review trades and apply transactions
-        for tid in trades:
-            # fetch trade
-            trade = market.trades[tid]
-            # fetch maker and taker and adjust assets
-            maker = self.accounts[trade.maker]  # buyer
-            taker = self.accounts[trade.taker]  # seller
-            maker.wallet[market.qoute].locked -= trade.quantity * trade.price
-            maker.wallet[market.base].unlocked += trade.quantity
-            taker.wallet[market.base].locked -= trade.quantity
-            taker.wallet[market.qoute].unlocked += trade.quantity * trade.price
-        # handle account orders
-        for order_id in filled_orders:
-            owner = self.accounts[market.orders[order_id].owner]
-            owner.orders[market.symbol]["open"].remove(order_id)
-            owner.orders[market.symbol]["closed"].append(order_id)
-        if self.verbose:
-            print(f"Order executed with id: {order.id}")
         return True
 
-    def cancel(self, account_id: int, market: str, order_id: int):
+    def _cancel(self, account: Account, market: Market, order_id: int, created: int = None):
+        now = self.clock.now() if created is None else created
+        # fetch order
+        order = market.orders.get(order_id, None)
+        # validate
+        if not order or order.owner != account.id or order.status != "OPEN":
+            return Code.ORDER_NOT_FOUND
+        # pop order from orderbook and return values, waiting stops hold no funds
+        if order.stop is None or not market.stops.remove(order):
+            (market.orderbook.bids if order.side == "BUY" else market.orderbook.asks).pop(order)
+            self._unlock(account, market, order)
+        order.status = "CANCELED"
+        self._close(market, order, now)
+        if market.retention is not None:
+            self._retain(market, now)
+        if self.journal is not None:
+            self.journal.cancel(account.id, market.symbol, order.id, now)
+        return Code.OK
+
+    @timed()
+    def amend(self, account_id: int, market: str, order_id: int, quantity: Decimal = None, price: Decimal = None):
+        # change the open quantity or the price of an open order, a smaller quantity at the same price keeps
+        # the queue position of the order, anything else requeues it and it may trade at its new price
         if account_id not in self.accounts.keys():
-            if self.verbose:
-                print("Failed: invalid account id")
-            return False
+            return self._failed(Code.INVALID_ACCOUNT, account_id=account_id, market=market, order_id=order_id)
         if market not in self.markets.keys():
-            if self.verbose:
-                print("Failed: invalid market")
-            return False
-        # fetch market and account
+            return self._failed(Code.INVALID_MARKET, account_id=account_id, market=market, order_id=order_id)
         market = self.markets[market.upper()]
         account = self.accounts[account_id]
-        # fetch order
+        if quantity is not None and not in_range(quantity, market.base_decimals):
+            return self._failed(Code.INVALID_QUANTITY, account_id=account_id, market=market.symbol, order_id=order_id)
+        if price is not None and not in_range(price, market.qoute_decimals):
+            return self._failed(Code.INVALID_PRICE, account_id=account_id, market=market.symbol, order_id=order_id)
+        quantity = self._unit_in(quantity, market.base) if quantity is not None else None
+        price = self._unit_in(price, market.qoute) if price is not None else None
+        if quantity is not None and quantity <= 0:
+            return self._failed(Code.INVALID_QUANTITY, account_id=account_id, market=market.symbol, order_id=order_id)
+        if price is not None and price <= 0:
+            return self._failed(Code.INVALID_PRICE, account_id=account_id, market=market.symbol, order_id=order_id)
+        code, order = self._amend(account, market, order_id, quantity, price)
+        if code:
+            return self._failed(code, account_id=account_id, market=market.symbol, order_id=order_id)
+        if self.observers:
+            self._emit(
+                AMENDED,
+                message=f"Order amended with id: {order_id}",
+                account_id=account_id,
+                market=market.symbol,
+                order_id=order_id,
+                side=order.side,
+                price=market.price_value(order.price),
+                quantity=market.quantity_value(order.quantity),
+            )
+        return True
+
+    def _amend(self, account: Account, market: Market, order_id: int, quantity=None, price=None, created: int = None):
+        now = self.clock.now() if created is None else created
+        if market.expiries and market.expiries[0][0] <= now:
+            self._expire(market, now)
         order = market.orders.get(order_id, None)
-        # validate
-        if order and order.owner == account_id and order.status == "OPEN":
-            # pop order from orderbook and return values
+        if not order or order.owner != account.id or order.status != "OPEN":
+            return Code.ORDER_NOT_FOUND, None
+        quantity = order.quantity if quantity is None else quantity
+        price = order.price if price is None else price
+        if quantity == order.quantity and price == order.price:
+            return Code.OK, order
+        requeue = False
+        if order.stop is not None and market.stops.remove(order):
+            # a waiting stop holds no funds and keeps its place by id
+            order.initial_quantity += quantity - order.quantity
+            order.quantity = quantity
+            order.price = price
+            market.stops.push(order)
+        elif price == order.price and quantity < order.quantity:
+            # a reduction keeps the queue position and releases the funds of the reduced quantity
+            amount = order.quantity - quantity
             if order.side == "BUY":
-                market.orderbook.bids.pop(order)
-                market.orders[order.id].status = "CANCELED"
-                account.wallet[market.qoute].locked -= order.quantity * order.price
-                account.wallet[market.qoute].unlocked += order.quantity * order.price
-                account.orders[market.symbol]["open"].remove(order.id)
-                account.orders[market.symbol]["closed"].append(order.id)
-                if self.verbose:
-                    print(f"Order canceled with id: {order.id}")
-                return True
-            if order.side == "SELL":
-                market.orderbook.asks.pop(order)
-                market.orders[order.id].status = "CANCELED"
-                account.wallet[market.base].locked -= order.quantity
-                account.wallet[market.base].unlocked += order.quantity
-                account.orders[market.symbol]["open"].remove(order.id)
-                account.orders[market.symbol]["closed"].append(order.id)
-                if self.verbose:
-                    print(f"Order canceled with id: {order.id}")
-                return True
-        if self.verbose:
-            print("Failed: order not found")
-        return False
+                market.orderbook.bids.reduce(order, amount)
+                released = amount * order.price * market.qoute_factor
+                asset = account.wallet[market.qoute]
+            else:
+                market.orderbook.asks.reduce(order, amount)
+                released = amount * market.base_factor
+                asset = account.wallet[market.base]
+            order.initial_quantity -= amount
+            asset.locked -= released
+            asset.unlocked += released
+        else:
+            # a requeue swaps the locked funds for those of the new order in one update, before the book is touched
+            if order.side == "BUY":
+                cost = market.orderbook.asks.sweep(quantity, price) * market.qoute_factor
+                locked = order.quantity * order.price * market.qoute_factor
+                asset = account.wallet[market.qoute]
+                tree = market.orderbook.bids
+            else:
+                cost = quantity * market.base_factor
+                locked = order.quantity * market.base_factor
+                asset = account.wallet[market.base]
+                tree = market.orderbook.asks
+            if asset.unlocked + locked < cost:
+                return Code.NOT_ENOUGH_BALANCE, None
+            tree.pop(order)
+            asset.unlocked -= cost - locked
+            asset.locked += cost - locked
+            order.initial_quantity += quantity - order.quantity
+            order.quantity = quantity
+            order.price = price
+            requeue = True
+        if self.journal is not None:
+            self.journal.amend(
+                account.id,
+                market.symbol,
+                order.id,
+                market.to_units(quantity, market.base_decimals),
+                market.to_units(price, market.qoute_decimals),
+                now,
+            )
+        if requeue:
+            self._match(account, market, order, now=now)
+        return Code.OK, order
+
+    @timed()
+    def cancel_all(self, account_id: int, market: str = None, side: str = None, price_range: tuple = None):
+        # cancel the open orders of an account, of every market unless one is given, optionally of one side
+        # and with prices within price_range (low, high) where either bound may be None, returns a code and
+        # their number, the number is 0 when the code is a rejection
+        if account_id not in self.accounts.keys():
+            code = Code.INVALID_ACCOUNT
+        elif market is not None and market not in self.markets.keys():
+            code = Code.INVALID_MARKET
+        elif side is not None and str(side).upper() not in SIDES:
+            code = Code.INVALID_SIDE
+        else:
+            code = Code.OK
+        if code:
+            self._failed(code, account_id=account_id, market=market)
+            return code, 0
+        side = None if side is None else side.upper()
+        low, high = price_range if price_range is not None else (None, None)
+        account = self.accounts[account_id]
+        markets = self.markets.values() if market is None else (self.markets[market.upper()],)
+        ranges = [
+            (
+                _market,
+                None if low is None else self._unit_in(low, _market.qoute),
+                None if high is None else self._unit_in(high, _market.qoute),
+            )
+            for _market in markets
+        ]
+        count = 0
+        for (_market, _, _), orders in zip(ranges, self._cancel_markets(account, side, ranges)):
+            count += len(orders)
+            for order in orders:
+                self._emit(
+                    CANCELED,
+                    message=f"Order canceled with id: {order.id}",
+                    account_id=account_id,
+                    market=_market.symbol,
+                    order_id=order.id,
+                )
+        return Code.OK, count
 
+    def _cancel_markets(self, account: Account, side: str, ranges: list) -> list:
+        # orders canceled in each market of ranges, given as (market, low, high) with bounds in internal units
+        return [self._cancel_all(account, market, side, low, high) for market, low, high in ranges]
+
+    def _cancel_all(
+        self, account: Account, market: Market, side: str = None, low=None, high=None, created: int = None
+    ) -> list:
+        # the open orders of the account come from its per side index, resting ones are unlinked from their
+        # queues per tree at once and the funds of each symbol are released in one update
+        registry = account.orders.get(market.symbol)
+        if registry is None or not registry.open:
+            return []
+        orders = [
+            order
+            for _side in (SIDES if side is None else (side,))
+            for order in registry.side[_side].values()
+            if (low is None or (order.price is not None and order.price >= low))
+            and (high is None or (order.price is not None and order.price <= high))
+        ]
+        if not orders:
+            return []
+        resting = dict(BUY=[], SELL=[])
+        for order in orders:
+            # waiting stops hold no funds
+            if order.stop is None or not market.stops.remove(order):
+                resting[order.side].append(order)
+        bids, asks = resting["BUY"], resting["SELL"]
+        if bids:
+            market.orderbook.bids.pop_many(bids)
+            amount = sum(order.quantity * order.price for order in bids) * market.qoute_factor
+            account.wallet[market.qoute].locked -= amount
+            account.wallet[market.qoute].unlocked += amount
+        if asks:
+            market.orderbook.asks.pop_many(asks)
+            amount = sum(order.quantity for order in asks) * market.base_factor
+            account.wallet[market.base].locked -= amount
+            account.wallet[market.base].unlocked += amount
+        now = self.clock.now() if created is None else created
+        for order in orders:
+            order.status = "CANCELED"
+            self._close(market, order, now)
+        if market.retention is not None:
+            self._retain(market, now)
+        if self.journal is not None:
+            self.journal.cancel_all(
+                account.id,
+                market.symbol,
+                2 if side is None else SIDES.index(side),
+                -1 if low is None else market.to_units(low, market.qoute_decimals),
+                -1 if high is None else market.to_units(high, market.qoute_decimals),
+                now,
+            )
+        return orders
+
+    def _unlock(self, account: Account, market: Market, order: Order):
+        # return the funds locked for the unfilled quantity of a limit order
+        if order.side == "BUY":
+            amount = order.quantity * order.price * market.qoute_factor
+            asset = account.wallet[market.qoute]
+        else:
+            amount = order.quantity * market.base_factor
+            asset = account.wallet[market.base]
+        asset.locked -= amount
+        asset.unlocked += amount
+
+    @timed()
+    def expire(self, market: str = None) -> int:
+        # cancel the good till time orders of a market, or of every market, that expired by now
+        # orders also expire as new orders reach their market, returns the number canceled
+        if market is not None and market not in self.markets.keys():
+            return self._failed(Code.INVALID_MARKET, market=market)
+        now = self.clock.now()
+        count = 0
+        for _market in self.markets.values() if market is None else (self.markets[market.upper()],):
+            if _market.expiries and _market.expiries[0][0] <= now:
+                count += len(self._expire(_market, now))
+        return count
+
+    def _expire(self, market: Market, now: int) -> list:
+        # pop due entries off the expiry heap, entries of orders closed since they were placed are skipped
+        # so the work depends on the number of due entries and not on the size of the book, returns the
+        # expired orders
+        expiries = market.expiries
+        expired = []
+        while expiries and expiries[0][0] <= now:
+            _, _, order = heapq.heappop(expiries)
+            if order.status != "OPEN":
+                continue
+            (market.orderbook.bids if order.side == "BUY" else market.orderbook.asks).pop(order)
+            self._unlock(self.accounts[order.owner], market, order)
+            order.status = "CANCELED"
+            self._close(market, order, now)
+            expired.append(order)
+        if not expired:
+            return expired
+        if market.retention is not None:
+            self._retain(market, now)
+        if self.journal is not None:
+            self.journal.expire(market.symbol, now)
+        if self.observers:
+            for order in expired:
+                self._emit(CANCELED, account_id=order.owner, market=market.symbol, order_id=order.id, side=order.side)
+        return expired
+
+    @classmethod
+    def replay(cls, path: str):
+        # rebuild an exchange from a journal without printing, order and trade ids are reproduced
+        # its clock follows the times of the records, so nothing depends on when the journal is replayed
+        fixed_point, records = read_journal(path)
+        exchange = cls(verbose=False, fixed_point=fixed_point, clock=VirtualClock())
+        for record in records:
+            created = record_time(record)
+            if created is not None and created > exchange.clock.time:
+                exchange.clock.set(created)
+            exchange._apply(record)
+        return exchange
+
+    def _apply(self, record: tuple):
+        # apply one journal record
+        opcode = record[0]
+        if opcode == ORDER:
+            _, account_id, symbol, side, quantity, price, created = record
+            market = self.markets[symbol]
+            if not self.fixed_point:
+                quantity = from_units(quantity, market.base_decimals)
+                price = from_units(price, market.qoute_decimals)
+            self._place(self.accounts[account_id], market, side, quantity, price or None, created)
+        elif opcode == TIMED_ORDER:
+            _, account_id, symbol, side, quantity, price, created, time_in_force, expires = record
+            market = self.markets[symbol]
+            if not self.fixed_point:
+                quantity = from_units(quantity, market.base_decimals)
+                price = from_units(price, market.qoute_decimals)
+            time_in_force = TIME_IN_FORCE[time_in_force]
+            self._place(
+                self.accounts[account_id], market, side, quantity, price or None, created, time_in_force, expires or None
+            )
+        elif opcode == CANCEL_ALL:
+            _, account_id, symbol, side, low, high, created = record
+            market = self.markets[symbol]
+            low, high = (None if units < 0 else units for units in (low, high))
+            if not self.fixed_point:
+                low, high = (None if units is None else from_units(units, market.qoute_decimals) for units in (low, high))
+            self._cancel_all(self.accounts[account_id], market, None if side == 2 else SIDES[side], low, high, created)
+        elif opcode == AMEND:
+            _, account_id, symbol, order_id, quantity, price, created = record
+            market = self.markets[symbol]
+            if not self.fixed_point:
+                quantity = from_units(quantity, market.base_decimals)
+                price = from_units(price, market.qoute_decimals)
+            self._amend(self.accounts[account_id], market, order_id, quantity, price or None, created)
+        elif opcode == EXPIRE:
+            self._expire(self.markets[record[1]], record[2])
+        elif opcode == STOP:
+            _, account_id, symbol, side, quantity, price, stop, created = record
+            market = self.markets[symbol]
+            if not self.fixed_point:
+                quantity = from_units(quantity, market.base_decimals)
+                price = from_units(price, market.qoute_decimals)
+                stop = from_units(stop, market.qoute_decimals)
+            self._place_stop(self.accounts[account_id], market, side, quantity, price or None, stop, created)
+        elif opcode == REGISTER_SYMBOL:
+            self.register_symbol(record[1], record[2])
+        elif opcode == REGISTER_MARKET:
+            _, base, qoute, limits, path = record
+            max_closed_orders, max_trades, max_age, chunk = (None if value < 0 else value for value in limits)
+            retention = None
+            if chunk:
+                retention = Retention(max_closed_orders, max_trades, max_age, path or None, chunk)
+                # a replay writes the archive of the market again
+                if path:
+                    Archive(path, base.upper() + qoute.upper()).truncate()
+            self.register_market(base, qoute, retention)
+        elif opcode == REGISTER_ACCOUNT:
+            self.register_account(record[1])
+        elif opcode == DEPOSIT:
+            _, account_id, symbol, units = record
+            self._deposit(self.accounts[account_id], symbol, self._amount_from_units(units, symbol))
+        elif opcode == WITHDRAW:
+            _, account_id, symbol, units = record
+            self._withdraw(self.accounts[account_id], symbol, self._amount_from_units(units, symbol))
+        else:
+            _, account_id, symbol, order_id, created = record
+            self._cancel(self.accounts[account_id], self.markets[symbol], order_id, created)
+
+    def save_snapshot(self, path: str):
+        # write the full state to a flat binary snapshot
+        save_snapshot(self, path)
+
+    def _market_states(self):
+        # spec and arrays of every market for a snapshot
+        return [market_state(market) for market in self.markets.values()]
+
+    @classmethod
+    def load_snapshot(cls, path: str):
+        # restore an exchange from a snapshot, resting orders keep their queue priority
+        return load_snapshot(cls, path)
+
+    @timed()
     def process_order_qoute(self, qoute: dict):
-        if qoute.get("order_id"):
+        # a qoute with an order id, 0 included, is a cancel like in process_orders
+        if qoute.get("order_id") is not None:
             self.cancel(qoute["account_id"], qoute["market"], qoute["order_id"])
         else:
+            fields = dict(
+                price=qoute.get("price"),
+                stop=qoute.get("stop"),
+                time_in_force=qoute.get("time_in_force", "GTC"),
+                expires=qoute.get("expires"),
+            )
             if qoute["side"].upper() == "BUY":
-                self.buy(qoute["account_id"], qoute["market"], qoute["quantity"], qoute.get("price"))
+                self.buy(qoute["account_id"], qoute["market"], qoute["quantity"], **fields)
             if qoute["side"].upper() == "SELL":
-                self.sell(qoute["account_id"], qoute["market"], qoute["quantity"], qoute.get("price"))
+                self.sell(qoute["account_id"], qoute["market"], qoute["quantity"], **fields)
+
+    @timed()
+    def process_orders(self, batch, out: tuple = None):
+        # process a batch of order qoutes in sequence, given as a list of qoute dicts, a dataframe
+        # or a dict of parallel arrays with account_id, market, side, quantity, price and order_id
+        # returns arrays of result codes and order ids (-1 for rejected qoutes)
+        # out is an optional pair of code and order id arrays the results are written to as they are known,
+        # rejected qoutes after validation and the others as each runs, so when a qoute raises the qoutes
+        # that ran before it keep their results and the others keep what out held
+        # validation and rounding are vectorized but every valid qoute is still locked, matched and settled
+        # one at a time: a qoute may spend what the fills of the qoutes before it paid. the vectorized part is
+        # 5% to 7% of the time of a batch, so the gain over looping process_order_qoute is about 1.1x to 1.2x
+        columns = self._batch_columns(batch)
+        size = len(columns["account_id"])
+        account_ids = np.asarray(columns["account_id"], dtype=np.int64)
+        quantities = np.asarray(self._batch_column(columns, "quantity", size), dtype=np.float64)
+        prices = np.asarray(self._batch_column(columns, "price", size), dtype=np.float64)
+        cancel_ids = np.asarray(self._batch_column(columns, "order_id", size), dtype=np.float64)
+        # normalize names once per distinct value
+        names, market_index = np.unique(np.asarray(columns["market"], dtype=str), return_inverse=True)
+        markets = [self.markets.get(name.upper()) for name in names]
+        sides, side_index = np.unique(np.asarray(self._batch_column(columns, "side", size), dtype=str), return_inverse=True)
+        sides = np.char.upper(sides)
+        side_valid = np.isin(sides, ("BUY", "SELL"))[side_index]
+        # validate, the first failing check of a qoute decides its code
+        is_cancel = ~np.isnan(cancel_ids)
+        has_price = ~np.isnan(prices) & (prices != 0)
+        codes = np.zeros(size, dtype=np.int8)
+        checks = (
+            (~np.isin(account_ids, np.fromiter(self.accounts.keys(), dtype=np.int64)), Code.INVALID_ACCOUNT),
+            (~np.array([market is not None for market in markets], dtype=bool)[market_index], Code.INVALID_MARKET),
+            (~is_cancel & ~side_valid, Code.INVALID_SIDE),
+        )
+        for failed, code in checks:
+            codes[(codes == 0) & failed] = code
+        # round quantities and prices to internal units per market, values that are not finite or whose units
+        # do not fit 64 bits are rejected before they are converted
+        quantity_units = np.zeros(size, dtype=np.int64)
+        price_units = np.zeros(size, dtype=np.int64)
+        for i, market in enumerate(markets):
+            rows = np.flatnonzero((market_index == i) & (codes == 0) & ~is_cancel)
+            if market is None or not len(rows):
+                continue
+            valid = in_range_array(quantities[rows], market.base_decimals)
+            codes[rows[~valid]] = Code.INVALID_QUANTITY
+            rows = rows[valid]
+            valid = ~has_price[rows] | in_range_array(prices[rows], market.qoute_decimals)
+            codes[rows[~valid]] = Code.INVALID_PRICE
+            rows = rows[valid]
+            quantity_units[rows] = to_units_array(quantities[rows], market.base_decimals)
+            priced = rows[has_price[rows]]
+            price_units[priced] = to_units_array(prices[priced], market.qoute_decimals)
+        codes[(codes == 0) & ~is_cancel & (quantity_units <= 0)] = Code.INVALID_QUANTITY
+        codes[(codes == 0) & ~is_cancel & has_price & (price_units <= 0)] = Code.INVALID_PRICE
+        if self.observers:
+            names_list = names[market_index].tolist()
+            for i in np.flatnonzero(codes).tolist():
+                self._emit(
+                    REJECTED,
+                    Code(codes[i]),
+                    account_id=int(account_ids[i]),
+                    market=names_list[i],
+                    order_id=int(cancel_ids[i]) if is_cancel[i] else None,
+                    side=None if is_cancel[i] else str(sides[side_index[i]]),
+                )
+        # run valid qoutes through the matching engine in order
+        order_ids = np.where(is_cancel, np.nan_to_num(cancel_ids, nan=-1), -1).astype(np.int64)
+        pending = np.flatnonzero(codes == 0)
+        account_list = account_ids[pending].tolist()
+        market_list = market_index[pending].tolist()
+        cancel_list = is_cancel[pending].tolist()
+        side_list = sides[side_index[pending]].tolist()
+        quantity_list = quantity_units[pending].tolist()
+        price_list = np.where(has_price[pending], price_units[pending], 0).tolist()
+        order_id_list = order_ids[pending].tolist()
+        commands = []
+        for k in range(len(pending)):
+            account = self.accounts[account_list[k]]
+            market = markets[market_list[k]]
+            if cancel_list[k]:
+                commands.append(("cancel", account, market, order_id_list[k]))
+                continue
+            quantity = quantity_list[k]
+            price = price_list[k] or None
+            if not self.fixed_point:
+                quantity = from_units(quantity, market.base_decimals)
+                price = from_units(price, market.qoute_decimals) if price else None
+            commands.append(("place", account, market, side_list[k], quantity, price, None))
+        if out is not None:
+            rejected = codes != 0
+            out[0][rejected], out[1][rejected] = codes[rejected], order_ids[rejected]
+        for i, command, (code, order_id) in zip(pending.tolist(), commands, self._execute(commands)):
+            codes[i] = code
+            if order_id is not None:
+                order_ids[i] = order_id
+            if out is not None:
+                out[0][i], out[1][i] = code, order_ids[i]
+            if self.observers:
+                self._executed(command, code, order_id)
+        accepted = int((codes == 0).sum())
+        self._emit(BATCH, message=f"Batch processed: {accepted} accepted, {size - accepted} rejected")
+        return codes, order_ids
+
+    def _executed(self, command: tuple, code: Code, order_id: int):
+        # events of a batch command, verbose exchanges only print the summary of the batch
+        account, market = command[1], command[2]
+        if command[0] == "cancel":
+            kind = CANCELED if code == Code.OK else REJECTED
+            self._emit(kind, Code(code), account_id=account.id, market=market.symbol, order_id=command[3])
+            return
+        side, quantity, price = command[3:6]
+        if code != Code.OK:
+            self._emit(REJECTED, Code(code), account_id=account.id, market=market.symbol, side=side)
+            return
+        self._emit(
+            ACCEPTED,
+            account_id=account.id,
+            market=market.symbol,
+            order_id=order_id,
+            side=side,
+            price=market.price_value(price),
+            quantity=market.quantity_value(quantity),
+        )
 
-    def get_trades(self, market: str):
+    def _execute(self, commands: list):
+        # run validated place and cancel commands in order, yields a code and the placed order id per command
+        for command in commands:
+            if command[0] == "cancel":
+                yield self._cancel(*command[1:]), None
+            else:
+                code, order = self._place(*command[1:])
+                yield code, None if order is None else order.id
+
+    @staticmethod
+    def _batch_columns(batch):
+        names = ("account_id", "market", "side", "quantity", "price", "order_id")
+        if is_frame(batch):
+            return {name: batch[name].to_numpy() for name in names if name in batch.columns}
+        if isinstance(batch, dict):
+            return batch
+        return {name: [qoute.get(name) for qoute in batch] for name in names}
+
+    @staticmethod
+    def _batch_column(columns: dict, name: str, size: int):
+        column = columns.get(name)
+        return [None] * size if column is None else column
+
+    @timed()
+    def get_trades(self, market: str, since: int = None, last_n: int = None, as_: str = "frame"):
+        # queries return a dataframe, or with as_="arrays" a dict of numpy arrays keyed by column name,
+        # index column first, which needs no pandas
+        assert as_ in FORMATS
         if market not in self.markets.keys():
-            if self.verbose:
-                print("Failed: invalid market")
+            self._failed(Code.INVALID_MARKET, market=market)
             return None
-        trades = self.markets[market.upper()].trades_history
-        trades = pd.DataFrame(trades, columns=["time", "price", "quantity"])
+        # wrap the tape columns without copying unless archived trades are included
+        columns = self.markets[market.upper()].trade_columns(since=since, last_n=last_n)
+        if as_ == "arrays":
+            names = ("id", "time", "price", "quantity", "side", "maker", "taker")
+            trades = {name: columns[name] for name in names}
+            trades["side"] = np.asarray(SIDES)[columns["side"]]
+            return trades
+        pd = pandas()
+        trades = pd.DataFrame(
+            {
+                "time": columns["time"],
+                "price": columns["price"],
+                "quantity": columns["quantity"],
+                "side": pd.Categorical.from_codes(columns["side"], categories=SIDES),
+                "maker": columns["maker"],
+                "taker": columns["taker"],
+            },
+            index=pd.Index(columns["id"], name="id", copy=False),
+            copy=False,
+        )
         return trades
 
-    def get_orderbook(self, market: str):
+    def track_bars(
+        self,
+        market: str,
+        intervals=(10**9, 60 * 10**9, 300 * 10**9),
+        capacity: int = 1024,
+        windows=(60 * 10**9,),
+    ):
+        # keep the last capacity ohlcv bars per interval and rolling vwap windows of a market, in nanoseconds
         if market not in self.markets.keys():
-            if self.verbose:
-                print("Failed: invalid market")
+            return self._failed(Code.INVALID_MARKET, market=market)
+        self.markets[market.upper()].track_bars(intervals, capacity, windows)
+        return True
+
+    @timed()
+    def get_bars(self, market: str, interval: int, last_n: int = None, as_: str = "frame"):
+        assert as_ in FORMATS
+        if market not in self.markets.keys():
+            self._failed(Code.INVALID_MARKET, market=market)
             return None
-        bids = list(self.markets[market.upper()].orderbook.bids.depth.items())
-        asks = list(self.markets[market.upper()].orderbook.asks.depth.items())
-        bids = pd.DataFrame(bids, columns=["price", "volume"])
-        asks = pd.DataFrame(asks, columns=["price", "volume"])
-        bids["type"] = "BID"
-        asks["type"] = "ASK"
-        orderbook = bids.append(asks).sort_values("price")
-        orderbook.set_index("price", inplace=True)
-        return orderbook
-
-    def get_orders(self, account_id: int, market: str, status: str = None):
-        if account_id not in self.accounts.keys():
-            if self.verbose:
-                print("Failed: invalid account id")
+        bars = self.markets[market.upper()].bars
+        if bars is None or interval not in bars.series:
+            self._failed(Code.NOT_TRACKED, "Failed: interval not tracked", market=market)
             return None
+        columns = bars.series[interval].last(last_n)
+        columns["notional"] /= columns["volume"]
+        columns = {"vwap" if name == "notional" else name: values for name, values in columns.items()}
+        if as_ == "arrays":
+            return columns
+        pd = pandas()
+        index = pd.Index(columns.pop("time"), name="time", copy=False)
+        bars = pd.DataFrame(columns, index=index, copy=False)
+        return bars
+
+    @timed()
+    def get_vwap(self, market: str, window: int, now: int = None):
+        # volume and vwap of the trades in a tracked window ending at now or at the last trade
         if market not in self.markets.keys():
-            if self.verbose:
-                print("Failed: invalid market")
+            self._failed(Code.INVALID_MARKET, market=market)
             return None
-        open_order_ids = self.accounts[account_id].orders[market.upper()]["open"]
-        closed_order_ids = self.accounts[account_id].orders[market.upper()]["closed"]
-        orders = []
-        for id in open_order_ids + closed_order_ids:
-            order = self.markets[market.upper()].orders[id]
-            orders.append((order.id, order.time, order.side, order.initial_quantity, order.price, order.status))
-        orders = pd.DataFrame(orders, columns=["id", "time", "side", "quantity", "price", "status"])
-        orders.insert(2, "type", orders.price.map(lambda x: "MARKET" if x is None else "LIMIT"))
-        orders.sort_values(["id"], ascending=False, inplace=True)
-        orders.set_index("id", inplace=True)
-        if status:
-            return orders.loc[orders.status == status.upper()]
-        return orders
+        bars = self.markets[market.upper()].bars
+        if bars is None or window not in bars.windows:
+            self._failed(Code.NOT_TRACKED, "Failed: window not tracked", market=market)
+            return None
+        return bars.windows[window].value(now)
+
+    @timed()
+    def get_orderbook(self, market: str, as_: str = "frame"):
+        assert as_ in FORMATS
+        if market not in self.markets.keys():
+            self._failed(Code.INVALID_MARKET, market=market)
+            return None
+        _market = self.markets[market.upper()]
+        # bids are all below asks, so the levels of both sides in price order are already sorted
+        bids, asks = _market.orderbook.bids.depth, _market.orderbook.asks.depth
+        levels = dict(
+            price=[_market.price_value(price) for price in itertools.chain(bids.keys(), asks.keys())],
+            volume=[_market.quantity_value(volume) for volume in itertools.chain(bids.values(), asks.values())],
+            type=["BID"] * len(bids) + ["ASK"] * len(asks),
+        )
+        return table(levels, "price", as_)
+
+    def subscribe(self, market: str, callback, level: int = 2, snapshot_interval: int = None):
+        # stream book events of a market to callback, level 2 for price levels and level 3 for orders
+        if market not in self.markets.keys():
+            return self._failed(Code.INVALID_MARKET, market=market)
+        self.markets[market.upper()].subscribe(callback, level, snapshot_interval)
+        return True
 
-    def get_wallet(self, account_id: str):
+    def unsubscribe(self, market: str, callback):
+        if market not in self.markets.keys():
+            return self._failed(Code.INVALID_MARKET, market=market)
+        self.markets[market.upper()].unsubscribe(callback)
+        return True
+
+    @timed()
+    def get_orders(self, account_id: int, market: str, status: str = None, as_: str = "frame"):
+        assert as_ in FORMATS
         if account_id not in self.accounts.keys():
-            if self.verbose:
-                print("Failed: invalid account id")
+            self._failed(Code.INVALID_ACCOUNT, account_id=account_id)
             return None
-        account = self.accounts[account_id]
-        assets = []
-        for symbol in account.wallet.keys():
-            assets.append(
+        if market not in self.markets.keys():
+            self._failed(Code.INVALID_MARKET, market=market)
+            return None
+        _market = self.markets[market.upper()]
+        registry = self.accounts[account_id].orders[_market.symbol]
+        if status:
+            selected = registry.status.get(status.upper(), dict()).values()
+        else:
+            selected = itertools.chain(registry.open.values(), registry.closed.values())
+        orders = []
+        for order in selected:
+            orders.append(
                 (
-                    symbol,
-                    account.wallet[symbol].total,
-                    account.wallet[symbol].unlocked,
+                    order.id,
+                    order.time,
+                    order.side,
+                    _market.quantity_value(order.initial_quantity),
+                    _market.price_value(order.price),
+                    _market.price_value(order.stop),
+                    order.status,
                 )
             )
-        wallet = pd.DataFrame(assets, columns=["symbol", "total", "available"])
-        wallet.set_index("symbol", inplace=True)
-        return wallet
+        # orders evicted to the archive
+        archived = _market.archived_orders(account_id, status.upper() if status else None)
+        for id, created, _, side, quantity, price, state in archived.tolist():
+            orders.append(
+                (
+                    id,
+                    created,
+                    SIDES[side],
+                    from_units(quantity, _market.base_decimals),
+                    from_units(price, _market.qoute_decimals) if price else None,
+                    None,
+                    STATUSES[state],
+                )
+            )
+        orders.sort(key=lambda row: row[0], reverse=True)
+        names = ("id", "time", "side", "quantity", "price", "stop", "status")
+        columns = dict(zip(names, map(list, zip(*orders)))) if orders else {name: [] for name in names}
+        types = [
+            ("MARKET" if price is None else "LIMIT") if stop is None else ("STOP" if price is None else "STOP_LIMIT")
+            for price, stop in zip(columns["price"], columns["stop"])
+        ]
+        columns = dict(id=columns.pop("id"), time=columns.pop("time"), type=types, **columns)
+        return table(columns, "id", as_, dtypes=dict(id=np.int64, time=np.int64))
 
-    def get_accounts(self):
-        accounts = pd.DataFrame(columns=["Name"] + self.symbols, index=list(self.accounts.keys()))
-        for account in self.accounts.values():
-            wallet = self.get_wallet(account_id=account.id)
-            assets = [account.name] + list(wallet["total"].values)
-            accounts.loc[account.id] = assets
-        accounts.index.rename("id", inplace=True)
+    @timed()
+    def get_wallet(self, account_id: str, as_: str = "frame"):
+        assert as_ in FORMATS
+        if account_id not in self.accounts.keys():
+            self._failed(Code.INVALID_ACCOUNT, account_id=account_id)
+            return None
+        wallet = self.accounts[account_id].wallet
+        assets = dict(
+            symbol=list(wallet.keys()),
+            total=[self._amount_out(asset.total, symbol) for symbol, asset in wallet.items()],
+            available=[self._amount_out(asset.unlocked, symbol) for symbol, asset in wallet.items()],
+        )
+        return table(assets, "symbol", as_)
+
+    def _amounts_out(self, amounts, symbol: str):
+        # convert a column of ledger amounts of symbol to decimal
+        if self.fixed_point:
+            decimals = self.ledger_decimals[symbol]
+            return [from_units(amount, decimals) for amount in amounts]
+        return amounts
+
+    @timed()
+    def get_accounts(self, as_: str = "frame"):
+        assert as_ in FORMATS
+        ids = np.fromiter(self.accounts.keys(), dtype=np.int64, count=len(self.accounts))
+        totals = self.ledger.totals(ids)
+        if as_ == "arrays":
+            accounts = dict(id=ids, Name=np.array([account.name for account in self.accounts.values()], dtype=object))
+            for symbol in self.symbols:
+                column = self._amounts_out(totals[:, self.ledger.columns[symbol]], symbol)
+                accounts[symbol] = np.asarray(column, dtype=object)
+            return accounts
+        pd = pandas()
+        accounts = pd.DataFrame({"Name": [account.name for account in self.accounts.values()]}, dtype=object)
+        for symbol in self.symbols:
+            accounts[symbol] = pd.Series(self._amounts_out(totals[:, self.ledger.columns[symbol]], symbol), dtype=object)
+        accounts.index = pd.Index(ids, name="id")
         return accounts
+
+    @timed()
+    def get_supply(self, as_: str = "frame"):
+        # total, available and locked amount of every symbol over all accounts
+        rows = np.fromiter(self.accounts.keys(), dtype=np.int64, count=len(self.accounts))
+        unlocked = self.ledger.unlocked[rows].sum(axis=0, initial=self._zero())
+        locked = self.ledger.locked[rows].sum(axis=0, initial=self._zero())
+        supply = dict(symbol=list(self.symbols), total=[], available=[], locked=[])
+        for symbol in self.symbols:
+            column = self.ledger.columns[symbol]
+            available, held = self._amounts_out((unlocked[column], locked[column]), symbol)
+            supply["total"].append(available + held)
+            supply["available"].append(available)
+            supply["locked"].append(held)
+        return table(supply, "symbol", as_)
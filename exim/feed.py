@@ -0,0 +1,171 @@
+from .models import Order
+
+# event kinds, LEVEL is sent to level 2 subscribers, ADD, REMOVE, EXECUTE and REDUCE to level 3 subscribers
+# and TOP and SNAPSHOT to both
+ADD = "ADD"
+REMOVE = "REMOVE"
+EXECUTE = "EXECUTE"
+REDUCE = "REDUCE"
+LEVEL = "LEVEL"
+TOP = "TOP"
+SNAPSHOT = "SNAPSHOT"
+
+
+class BookEvent:
+    __slots__ = ("sequence", "kind", "side", "price", "quantity", "order_id", "remaining", "book")
+
+    def __init__(self, sequence: int, kind: str, side: str = None, price=None, quantity=None, order_id: int = None):
+        # quantity is the resting quantity of an order, the volume of a level or the executed amount
+        # remaining is the quantity an order keeps after an execution and book the content of a snapshot
+        self.sequence = sequence
+        self.kind = kind
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+        self.order_id = order_id
+        self.remaining = None
+        self.book = None
+
+    def __repr__(self):
+        if self.kind == SNAPSHOT:
+            return f"BookEvent(sequence={self.sequence}, kind={self.kind})"
+        return (
+            f"BookEvent(sequence={self.sequence}, kind={self.kind}, side={self.side}, price={self.price}, "
+            f"quantity={self.quantity}, order_id={self.order_id})"
+        )
+
+
+class Subscriber:
+    def __init__(self, callback, level: int, snapshot_interval: int = None):
+        self.callback = callback
+        self.level = level
+        # a snapshot follows every snapshot_interval events
+        self.snapshot_interval = snapshot_interval
+        self.countdown = snapshot_interval
+
+
+class Feed:
+    # incremental book events of one market, attached to its order trees while it has subscribers
+    # events of a level are built only when that level has subscribers and are numbered per level
+    def __init__(self, market):
+        self.market = market
+        self.subscribers = {2: [], 3: []}
+        self.sequence = {2: 0, 3: 0}
+        # last published top of each side in internal units
+        self.tops = dict(BUY=self._current_top(market.orderbook.bids), SELL=self._current_top(market.orderbook.asks))
+
+    def __bool__(self):
+        return bool(self.subscribers[2] or self.subscribers[3])
+
+    def subscribe(self, callback, level: int = 2, snapshot_interval: int = None):
+        assert level in (2, 3)
+        subscriber = Subscriber(callback, level, snapshot_interval)
+        self.subscribers[level].append(subscriber)
+        # new subscribers start from a snapshot
+        callback(self.snapshot(level))
+
+    def unsubscribe(self, callback):
+        for level, subscribers in self.subscribers.items():
+            self.subscribers[level] = [subscriber for subscriber in subscribers if subscriber.callback != callback]
+
+    def snapshot(self, level: int) -> BookEvent:
+        # levels (level 2) or orders in priority order (level 3) of each side, best first
+        market = self.market
+        event = BookEvent(self.sequence[level], SNAPSHOT)
+        event.book = dict()
+        for side, tree in (("BUY", market.orderbook.bids), ("SELL", market.orderbook.asks)):
+            prices = tree.depth.keys() if tree.ascending else reversed(tree.depth.keys())
+            if level == 2:
+                event.book[side] = [
+                    (market.price_value(price), market.quantity_value(tree.depth[price])) for price in prices
+                ]
+                continue
+            orders = []
+            for price in prices:
+                order = tree.tree[price].head
+                while order is not None:
+                    orders.append((order.id, market.price_value(price), market.quantity_value(order.quantity)))
+                    order = order.next
+            event.book[side] = orders
+        return event
+
+    def _publish(self, level: int, event: BookEvent):
+        for subscriber in self.subscribers[level]:
+            subscriber.callback(event)
+            if subscriber.snapshot_interval:
+                subscriber.countdown -= 1
+                if not subscriber.countdown:
+                    subscriber.countdown = subscriber.snapshot_interval
+                    subscriber.callback(self.snapshot(level))
+
+    def _event(self, level: int, kind: str, side: str, price, quantity, order_id: int = None) -> BookEvent:
+        self.sequence[level] += 1
+        market = self.market
+        return BookEvent(
+            self.sequence[level], kind, side, market.price_value(price), market.quantity_value(quantity), order_id
+        )
+
+    def _level(self, tree, price):
+        if self.subscribers[2]:
+            side = "SELL" if tree.ascending else "BUY"
+            self._publish(2, self._event(2, LEVEL, side, price, tree.depth.get(price, 0)))
+
+    @staticmethod
+    def _current_top(tree):
+        return tree.depth.peekitem(0 if tree.ascending else -1) if tree.depth else (None, 0)
+
+    def _top(self, tree):
+        side = "SELL" if tree.ascending else "BUY"
+        top = self._current_top(tree)
+        if top != self.tops[side]:
+            self.tops[side] = top
+            for level in (2, 3):
+                if self.subscribers[level]:
+                    self._publish(level, self._event(level, TOP, side, *top))
+
+    def added(self, tree, order: Order):
+        # an order was queued on tree
+        if self.subscribers[3]:
+            self._publish(3, self._event(3, ADD, order.side, order.price, order.quantity, order.id))
+        self._level(tree, order.price)
+        self._top(tree)
+
+    def removed(self, tree, order: Order):
+        # an order was taken off tree without trading
+        if self.subscribers[3]:
+            self._publish(3, self._event(3, REMOVE, order.side, order.price, order.quantity, order.id))
+        self._level(tree, order.price)
+        self._top(tree)
+
+    def removed_many(self, tree, orders: list, prices):
+        # orders were taken off tree at once, every changed level and the top are published once
+        if self.subscribers[3]:
+            for order in orders:
+                self._publish(3, self._event(3, REMOVE, order.side, order.price, order.quantity, order.id))
+        for price in prices:
+            self._level(tree, price)
+        self._top(tree)
+
+    def reduced(self, tree, order: Order, amount):
+        # the quantity of an order was reduced in place by amount, it keeps its queue position
+        if self.subscribers[3]:
+            event = self._event(3, REDUCE, order.side, order.price, amount, order.id)
+            event.remaining = self.market.quantity_value(order.quantity)
+            self._publish(3, event)
+        self._level(tree, order.price)
+        self._top(tree)
+
+    def executed(self, order: Order, amount):
+        # a resting order traded amount, the volume of its level changes once the level is settled
+        if self.subscribers[3]:
+            event = self._event(3, EXECUTE, order.side, order.price, amount, order.id)
+            event.remaining = self.market.quantity_value(order.quantity)
+            self._publish(3, event)
+
+    def changed(self, tree, price):
+        # the volume of a level changed after a match
+        self._level(tree, price)
+        self._top(tree)
+
+    def __repr__(self):
+        return f"Feed(market={self.market.symbol}, level2={len(self.subscribers[2])}, level3={len(self.subscribers[3])})"
@@ -0,0 +1,29 @@
+import numpy as np
+import sys
+
+# result formats of queries, a dataframe or a dict of numpy arrays keyed by column name
+FORMATS = ("frame", "arrays")
+
+
+def pandas():
+    # pandas is imported by the first query that returns a dataframe, importing exim does not import it
+    import pandas
+
+    return pandas
+
+
+def is_frame(value) -> bool:
+    # nothing is a dataframe before pandas was imported, so the check never imports it
+    module = sys.modules.get("pandas")
+    return module is not None and isinstance(value, module.DataFrame)
+
+
+def table(columns: dict, index: str, as_: str = "frame", dtypes: dict = None):
+    # a query result from its columns, as arrays the index is the first column and every column has the
+    # dtype given for it (object by default), so an empty result has the same dtypes as any other
+    if as_ == "arrays":
+        dtypes = dtypes or dict()
+        return {name: np.asarray(values, dtype=dtypes.get(name, object)) for name, values in columns.items()}
+    frame = pandas().DataFrame(columns)
+    frame.set_index(index, inplace=True)
+    return frame
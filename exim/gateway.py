@@ -0,0 +1,348 @@
+from .tape import SIDES
+from .codes import Code
+from .units import in_range
+import numpy as np
+import itertools
+import asyncio
+import struct
+
+# every frame is a header with the payload length and the message type, followed by the payload
+HEADER = struct.Struct("<IB")
+MAX_PAYLOAD = 1024
+
+# message types, LOGIN, NEW and CANCEL are sent by clients, ACK and FILL by the gateway
+NEW = 1
+CANCEL = 2
+ACK = 3
+FILL = 4
+LOGIN = 5
+
+# client reference, account id, side (0 buy, 1 sell), quantity and price (0 for market orders)
+NEW_FIELDS = struct.Struct("<qqBdd")
+# client reference, account id and order id
+CANCEL_FIELDS = struct.Struct("<qqq")
+# client reference and account id
+LOGIN_FIELDS = struct.Struct("<qq")
+# client reference, order id (-1 when rejected and for logins) and result code
+ACK_FIELDS = struct.Struct("<qqb")
+# trade id, time, order id, account id, side, liquidity (0 maker, 1 taker), price and quantity
+FILL_FIELDS = struct.Struct("<qqqqBBdd")
+# NEW, CANCEL and FILL payloads end with the market symbol
+LENGTH = struct.Struct("<B")
+
+LIQUIDITY = ("MAKER", "TAKER")
+
+
+def _frame(kind: int, payload: bytes) -> bytes:
+    return HEADER.pack(len(payload), kind) + payload
+
+
+def _pack_market(market: str) -> bytes:
+    encoded = market.encode()
+    return LENGTH.pack(len(encoded)) + encoded
+
+
+def _unpack_market(payload: bytes, offset: int) -> str:
+    (length,) = LENGTH.unpack_from(payload, offset)
+    offset += LENGTH.size
+    if offset + length != len(payload):
+        raise ValueError("malformed market symbol")
+    return payload[offset:].decode()
+
+
+def encode_new(ref: int, account_id: int, market: str, side: str, quantity: float, price: float = None) -> bytes:
+    side = {"BUY": 0, "SELL": 1}.get(side.upper(), 255)
+    return _frame(NEW, NEW_FIELDS.pack(ref, account_id, side, quantity, price or 0.0) + _pack_market(market))
+
+
+def encode_cancel(ref: int, account_id: int, market: str, order_id: int) -> bytes:
+    return _frame(CANCEL, CANCEL_FIELDS.pack(ref, account_id, order_id) + _pack_market(market))
+
+
+def encode_login(ref: int, account_id: int) -> bytes:
+    return _frame(LOGIN, LOGIN_FIELDS.pack(ref, account_id))
+
+
+def decode(kind: int, payload: bytes) -> tuple:
+    # fields of a message payload, in the order they are packed
+    if kind == NEW:
+        ref, account_id, side, quantity, price = NEW_FIELDS.unpack_from(payload)
+        side = SIDES[side] if side < 2 else ""
+        return ref, account_id, side, quantity, price, _unpack_market(payload, NEW_FIELDS.size)
+    if kind == CANCEL:
+        return CANCEL_FIELDS.unpack_from(payload) + (_unpack_market(payload, CANCEL_FIELDS.size),)
+    if kind == LOGIN:
+        return LOGIN_FIELDS.unpack(payload)
+    if kind == ACK:
+        return ACK_FIELDS.unpack(payload)
+    if kind == FILL:
+        trade_id, created, order_id, account_id, side, liquidity, price, quantity = FILL_FIELDS.unpack_from(payload)
+        market = _unpack_market(payload, FILL_FIELDS.size)
+        return trade_id, created, order_id, account_id, SIDES[side], LIQUIDITY[liquidity], price, quantity, market
+    raise ValueError(f"unknown message type {kind}")
+
+
+class Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, max_inflight: int):
+        self.reader = reader
+        self.writer = writer
+        # messages read but not acknowledged yet, reading resumes when ready is set
+        self.inflight = 0
+        self.max_inflight = max_inflight
+        self.ready = asyncio.Event()
+        # the account bound at login, the only one the connection can trade for and receive fills of
+        self.account = None
+        # frames collected while a batch is processed, written at once after it
+        self.buffer = bytearray()
+
+    def __repr__(self):
+        return f"Connection(peer={self.writer.get_extra_info('peername')}, account={self.account})"
+
+
+class Gateway:
+    # asyncio front end of an exchange, clients send NEW and CANCEL frames and receive ACK and FILL frames
+    # a connection first sends a LOGIN frame that binds it to one account, frames before it or for any
+    # other account are rejected with INVALID_ACCOUNT, as are orders with a quantity or price that is not
+    # finite or out of range of its market, without reaching the matcher
+    # a single matcher task owns the exchange and runs whatever is queued as one process_orders batch,
+    # so the exchange must not be used by anything else while the gateway runs
+    # a connection is not read while it has max_inflight unacknowledged messages or a full write buffer
+    def __init__(self, exchange, max_batch: int = 1024, queue_size: int = 65536, max_inflight: int = 1024):
+        self.exchange = exchange
+        self.max_batch = max_batch
+        self.queue_size = queue_size
+        self.max_inflight = max_inflight
+        self.queue = None
+        self.matcher = None
+        self.servers = []
+        self.connections = set()
+        # connections subscribed to the fills of each account
+        self.subscribers = dict()
+        # id of the last trade sent per market
+        self.last_trade = dict()
+        for symbol, market in exchange.markets.items():
+            self.last_trade[symbol] = int(market.trades.last("id")) if len(market.trades) else -1
+
+    async def start(self, host: str = None, port: int = None, path: str = None, backlog: int = 4096):
+        # listen on a unix socket when a path is given, on tcp otherwise
+        if self.matcher is None:
+            self.queue = asyncio.Queue(self.queue_size)
+            self.matcher = asyncio.create_task(self._match())
+        if path is not None:
+            server = await asyncio.start_unix_server(self._serve, path=path, backlog=backlog)
+        else:
+            server = await asyncio.start_server(self._serve, host, port, backlog=backlog)
+        self.servers.append(server)
+        return server
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+        for connection in list(self.connections):
+            connection.writer.close()
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers.clear()
+        if self.matcher is not None:
+            self.matcher.cancel()
+            try:
+                await self.matcher
+            except asyncio.CancelledError:
+                pass
+            self.matcher = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = Connection(reader, writer, self.max_inflight)
+        self.connections.add(connection)
+        buffer = bytearray()
+        # acks of frames answered without the matcher
+        rejected = bytearray()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+                # every complete frame read so far goes to the matcher as one queue item
+                messages = []
+                offset = 0
+                while len(buffer) - offset >= HEADER.size:
+                    length, kind = HEADER.unpack_from(buffer, offset)
+                    if length > MAX_PAYLOAD or kind not in (NEW, CANCEL, LOGIN):
+                        raise ValueError("invalid frame")
+                    end = offset + HEADER.size + length
+                    if end > len(buffer):
+                        break
+                    message = decode(kind, bytes(buffer[offset + HEADER.size : end]))
+                    offset = end
+                    code = self._login(connection, message) if kind == LOGIN else self._check(connection, kind, message)
+                    if code is not None:
+                        rejected += _frame(ACK, ACK_FIELDS.pack(message[0], -1, code))
+                        continue
+                    messages.append((connection, kind, message))
+                del buffer[:offset]
+                if rejected:
+                    writer.write(rejected)
+                    rejected.clear()
+                if messages:
+                    connection.inflight += len(messages)
+                    await self.queue.put(messages)
+                # stop reading while too many messages wait for their ack or the client does not read what was sent to it
+                while connection.inflight >= connection.max_inflight:
+                    connection.ready.clear()
+                    await connection.ready.wait()
+                await writer.drain()
+        except (ConnectionError, ValueError, struct.error):
+            pass
+        finally:
+            self.connections.discard(connection)
+            if connection.account is not None:
+                self.subscribers[connection.account].discard(connection)
+            writer.close()
+
+    def _login(self, connection: Connection, message: tuple):
+        # bind the connection to an account of the exchange, once, and subscribe it to the fills of the account
+        _, account_id = message
+        if account_id not in self.exchange.accounts or connection.account not in (None, account_id):
+            return Code.INVALID_ACCOUNT
+        if connection.account is None:
+            connection.account = account_id
+            self.subscribers.setdefault(account_id, set()).add(connection)
+        return Code.OK
+
+    def _check(self, connection: Connection, kind: int, message: tuple):
+        # code of a frame rejected before matching, None for frames that go to the matcher
+        if message[1] != connection.account:
+            return Code.INVALID_ACCOUNT
+        if kind == NEW:
+            _, _, _, quantity, price, market = message
+            market = self.exchange.markets.get(market.upper())
+            if market is None:
+                return None
+            if not in_range(quantity, market.base_decimals):
+                return Code.INVALID_QUANTITY
+            if not in_range(price, market.qoute_decimals):
+                return Code.INVALID_PRICE
+        return None
+
+    async def _match(self):
+        queue = self.queue
+        while True:
+            batch = await queue.get()
+            while len(batch) < self.max_batch and not queue.empty():
+                batch += queue.get_nowait()
+            self._process(batch)
+            # let connections read and write before the next batch
+            await asyncio.sleep(0)
+
+    def _process(self, batch: list):
+        columns = dict(account_id=[], market=[], side=[], quantity=[], price=[], order_id=[])
+        for connection, kind, message in batch:
+            if kind == NEW:
+                _, account_id, side, quantity, price, market = message
+                order_id = None
+            else:
+                _, account_id, order_id, market = message
+                side = quantity = price = None
+            columns["account_id"].append(account_id)
+            columns["market"].append(market)
+            columns["side"].append(side)
+            columns["quantity"].append(quantity)
+            columns["price"].append(price)
+            columns["order_id"].append(order_id)
+        # frames keep their own results when the exchange fails part way through a batch, those it did not
+        # get to are acked with INTERNAL_ERROR and the matcher goes on with the next batch
+        codes, order_ids = np.full(len(batch), Code.INTERNAL_ERROR, dtype=np.int8), np.full(len(batch), -1)
+        try:
+            self.exchange.process_orders(columns, out=(codes, order_ids))
+        except Exception:
+            pass
+        codes, order_ids = codes.tolist(), order_ids.tolist()
+        pending = set()
+        for (connection, _, message), code, order_id in zip(batch, codes, order_ids):
+            connection.buffer += _frame(ACK, ACK_FIELDS.pack(message[0], order_id, code))
+            connection.inflight -= 1
+            pending.add(connection)
+        self._fills(set(columns["market"]), pending)
+        for connection in pending:
+            if connection.inflight < connection.max_inflight:
+                connection.ready.set()
+            if not connection.writer.is_closing():
+                connection.writer.write(connection.buffer)
+            connection.buffer.clear()
+
+    def _fills(self, symbols: set, pending: set):
+        # send the trades of the batch to the connections of their maker and taker accounts
+        for symbol in symbols:
+            market = self.exchange.markets.get(symbol.upper())
+            if market is None:
+                continue
+            tape = market.trades
+            start = int(np.searchsorted(tape.column("id"), self.last_trade.get(market.symbol, -1), side="right"))
+            if start == len(tape):
+                continue
+            self.last_trade[market.symbol] = int(tape.last("id"))
+            rows = zip(
+                *(
+                    tape.column(name, start).tolist()
+                    for name in ("id", "time", "price", "quantity", "side", "maker", "taker", "maker_order", "taker_order")
+                )
+            )
+            encoded = _pack_market(market.symbol)
+            for trade_id, created, price, quantity, side, maker, taker, maker_order, taker_order in rows:
+                for account_id, order_id, order_side, liquidity in ((maker, maker_order, side, 0), (taker, taker_order, 1 - side, 1)):
+                    for connection in self.subscribers.get(account_id, ()):
+                        fields = FILL_FIELDS.pack(trade_id, created, order_id, account_id, order_side, liquidity, price, quantity)
+                        connection.buffer += _frame(FILL, fields + encoded)
+                        pending.add(connection)
+
+    def __repr__(self):
+        return f"Gateway(connections={len(self.connections)}, max_batch={self.max_batch})"
+
+
+class GatewayClient:
+    # minimal client of the wire format, a stand-in for agents in tests and simulations
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.ref_counter = itertools.count()
+
+    @classmethod
+    async def connect(cls, host: str = None, port: int = None, path: str = None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    def login(self, account_id: int) -> int:
+        # bind the connection to an account, the gateway acks it before any order of the account
+        ref = next(self.ref_counter)
+        self.writer.write(encode_login(ref, account_id))
+        return ref
+
+    def new_order(self, account_id: int, market: str, side: str, quantity: float, price: float = None) -> int:
+        # queue a new order and return its client reference, call drain to send it
+        ref = next(self.ref_counter)
+        self.writer.write(encode_new(ref, account_id, market, side, quantity, price))
+        return ref
+
+    def cancel(self, account_id: int, market: str, order_id: int) -> int:
+        ref = next(self.ref_counter)
+        self.writer.write(encode_cancel(ref, account_id, market, order_id))
+        return ref
+
+    async def drain(self):
+        await self.writer.drain()
+
+    async def receive(self):
+        # next message from the gateway as its type and fields
+        length, kind = HEADER.unpack(await self.reader.readexactly(HEADER.size))
+        return kind, decode(kind, await self.reader.readexactly(length))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    def __repr__(self):
+        return f"GatewayClient(peer={self.writer.get_extra_info('peername')})"
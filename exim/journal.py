@@ -0,0 +1,316 @@
+import threading
+import struct
+import time
+import os
+
+MAGIC = b"EXIMJRNL"
+# version 2 records the time of cancels, version 1 journals are still read
+VERSION = 2
+VERSIONS = (1, 2)
+HEADER = struct.Struct("<8sHB")
+
+# record opcodes
+REGISTER_SYMBOL = 1
+REGISTER_MARKET = 2
+REGISTER_ACCOUNT = 3
+DEPOSIT = 4
+WITHDRAW = 5
+ORDER = 6
+CANCEL = 7
+STOP = 8
+TIMED_ORDER = 9
+EXPIRE = 10
+CANCEL_ALL = 11
+AMEND = 12
+
+OPCODE = struct.Struct("<B")
+LENGTH = struct.Struct("<H")
+BYTE = struct.Struct("<B")
+INTEGER = struct.Struct("<q")
+RETENTION = struct.Struct("<qqqq")
+ORDER_FIELDS = struct.Struct("<Bqqq")
+STOP_FIELDS = struct.Struct("<Bqqqq")
+# side, quantity, price, created, time in force and expiry of orders that are not good till canceled
+TIMED_ORDER_FIELDS = struct.Struct("<BqqqBq")
+# order id, quantity, price and time of an amend
+AMEND_FIELDS = struct.Struct("<qqqq")
+# side (2 for both) and price bounds (-1 for none) of a mass cancel
+CANCEL_ALL_FIELDS = struct.Struct("<Bqq")
+
+
+def _pack_string(value: str) -> bytes:
+    encoded = value.encode()
+    return LENGTH.pack(len(encoded)) + encoded
+
+
+def _unpack_string(data: bytes, offset: int):
+    (length,) = LENGTH.unpack_from(data, offset)
+    offset += LENGTH.size
+    if offset + length > len(data):
+        raise struct.error("truncated string")
+    return data[offset : offset + length].decode(), offset + length
+
+
+class Journal:
+    # append-only binary log of accepted exchange commands
+    # records are buffered and written with one flush and fsync per group of sync_every records
+    # or after sync_interval seconds, a timer syncs a group that stays open because the exchange went idle
+    # a crash loses at most the records of the open group, close syncs what is left
+    def __init__(self, path: str, sync_every: int = 1024, sync_interval: float = 0.01, fsync: bool = True):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.fsync = fsync
+        self.fixed_point = None
+        self.buffer = bytearray()
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.file = None
+        # appends come from the exchange and syncs also from the idle timer
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def open(self, fixed_point: bool):
+        # start a new log or continue an existing one written in the same mode
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, "rb") as f:
+                magic, version, flags = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or bool(flags) != fixed_point:
+                raise ValueError(f"journal {self.path} does not match this exchange")
+            self.file = open(self.path, "ab")
+        else:
+            self.file = open(self.path, "wb")
+            self.file.write(HEADER.pack(MAGIC, VERSION, int(fixed_point)))
+            self._sync()
+        self.fixed_point = fixed_point
+
+    def _append(self, record: bytes):
+        with self.lock:
+            self.buffer += record
+            self.pending += 1
+            if self.pending >= self.sync_every or time.monotonic() - self.last_sync >= self.sync_interval:
+                self._flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.sync_interval, self._idle)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def _idle(self):
+        with self.lock:
+            self.timer = None
+            if self.file is not None and self.buffer:
+                self._flush()
+
+    def _sync(self):
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+    def _flush(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+            self.pending = 0
+        self._sync()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.file is not None:
+                self._flush()
+                self.file.close()
+                self.file = None
+
+    def register_symbol(self, symbol: str, unit_decimals: int):
+        self._append(OPCODE.pack(REGISTER_SYMBOL) + _pack_string(symbol) + BYTE.pack(unit_decimals))
+
+    def register_market(self, base: str, qoute: str, retention=None):
+        limits = (-1, -1, -1, 0)
+        path = ""
+        if retention is not None:
+            limits = tuple(
+                -1 if value is None else value
+                for value in (retention.max_closed_orders, retention.max_trades, retention.max_age, retention.chunk)
+            )
+            path = retention.path or ""
+        self._append(
+            OPCODE.pack(REGISTER_MARKET)
+            + _pack_string(base)
+            + _pack_string(qoute)
+            + RETENTION.pack(*limits)
+            + _pack_string(path)
+        )
+
+    def register_account(self, name: str):
+        self._append(OPCODE.pack(REGISTER_ACCOUNT) + _pack_string(name))
+
+    def deposit(self, account_id: int, symbol: str, units: int):
+        self._append(OPCODE.pack(DEPOSIT) + INTEGER.pack(account_id) + _pack_string(symbol) + INTEGER.pack(units))
+
+    def withdraw(self, account_id: int, symbol: str, units: int):
+        self._append(OPCODE.pack(WITHDRAW) + INTEGER.pack(account_id) + _pack_string(symbol) + INTEGER.pack(units))
+
+    def order(
+        self,
+        account_id: int,
+        market: str,
+        side: str,
+        quantity: int,
+        price: int,
+        created: int,
+        time_in_force: int = 0,
+        expires: int = 0,
+    ):
+        # time_in_force is an index in models.TIME_IN_FORCE, good till canceled orders keep the short record
+        if time_in_force:
+            fields = TIMED_ORDER_FIELDS.pack(0 if side == "BUY" else 1, quantity, price, created, time_in_force, expires)
+            opcode = TIMED_ORDER
+        else:
+            fields = ORDER_FIELDS.pack(0 if side == "BUY" else 1, quantity, price, created)
+            opcode = ORDER
+        self._append(OPCODE.pack(opcode) + INTEGER.pack(account_id) + _pack_string(market) + fields)
+
+    def stop(self, account_id: int, market: str, side: str, quantity: int, price: int, stop: int, created: int):
+        self._append(
+            OPCODE.pack(STOP)
+            + INTEGER.pack(account_id)
+            + _pack_string(market)
+            + STOP_FIELDS.pack(0 if side == "BUY" else 1, quantity, price, stop, created)
+        )
+
+    def cancel(self, account_id: int, market: str, order_id: int, now: int):
+        self._append(
+            OPCODE.pack(CANCEL) + INTEGER.pack(account_id) + _pack_string(market) + INTEGER.pack(order_id) + INTEGER.pack(now)
+        )
+
+    def cancel_all(self, account_id: int, market: str, side: int, low: int, high: int, now: int):
+        self._append(
+            OPCODE.pack(CANCEL_ALL)
+            + INTEGER.pack(account_id)
+            + _pack_string(market)
+            + CANCEL_ALL_FIELDS.pack(side, low, high)
+            + INTEGER.pack(now)
+        )
+
+    def amend(self, account_id: int, market: str, order_id: int, quantity: int, price: int, created: int):
+        self._append(
+            OPCODE.pack(AMEND)
+            + INTEGER.pack(account_id)
+            + _pack_string(market)
+            + AMEND_FIELDS.pack(order_id, quantity, price, created)
+        )
+
+    def expire(self, market: str, now: int):
+        self._append(OPCODE.pack(EXPIRE) + _pack_string(market) + INTEGER.pack(now))
+
+    def __repr__(self):
+        return f"Journal(path={self.path})"
+
+
+def read_journal(path: str):
+    # returns the mode flag of a journal and a generator of its records as tuples
+    # a record cut short by a crash ends the log
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, flags = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version not in VERSIONS:
+        raise ValueError(f"{path} is not a journal")
+
+    def time_field(offset: int):
+        # time of a cancel, None in version 1 journals
+        if version < 2:
+            return None, offset
+        return INTEGER.unpack_from(data, offset)[0], offset + INTEGER.size
+
+    def records():
+        offset = HEADER.size
+        try:
+            while offset < len(data):
+                (opcode,) = OPCODE.unpack_from(data, offset)
+                offset += OPCODE.size
+                if opcode == REGISTER_SYMBOL:
+                    symbol, offset = _unpack_string(data, offset)
+                    (unit_decimals,) = BYTE.unpack_from(data, offset)
+                    offset += BYTE.size
+                    yield opcode, symbol, unit_decimals
+                elif opcode == REGISTER_MARKET:
+                    base, offset = _unpack_string(data, offset)
+                    qoute, offset = _unpack_string(data, offset)
+                    limits = RETENTION.unpack_from(data, offset)
+                    offset += RETENTION.size
+                    path, offset = _unpack_string(data, offset)
+                    yield opcode, base, qoute, limits, path
+                elif opcode == REGISTER_ACCOUNT:
+                    name, offset = _unpack_string(data, offset)
+                    yield opcode, name
+                elif opcode in (DEPOSIT, WITHDRAW):
+                    (account_id,) = INTEGER.unpack_from(data, offset)
+                    symbol, offset = _unpack_string(data, offset + INTEGER.size)
+                    (units,) = INTEGER.unpack_from(data, offset)
+                    offset += INTEGER.size
+                    yield opcode, account_id, symbol, units
+                elif opcode == ORDER:
+                    (account_id,) = INTEGER.unpack_from(data, offset)
+                    market, offset = _unpack_string(data, offset + INTEGER.size)
+                    side, quantity, price, created = ORDER_FIELDS.unpack_from(data, offset)
+                    offset += ORDER_FIELDS.size
+                    yield opcode, account_id, market, "BUY" if side == 0 else "SELL", quantity, price, created
+                elif opcode == TIMED_ORDER:
+                    (account_id,) = INTEGER.unpack_from(data, offset)
+                    market, offset = _unpack_string(data, offset + INTEGER.size)
+                    side, quantity, price, created, time_in_force, expires = TIMED_ORDER_FIELDS.unpack_from(data, offset)
+                    offset += TIMED_ORDER_FIELDS.size
+                    side = "BUY" if side == 0 else "SELL"
+                    yield opcode, account_id, market, side, quantity, price, created, time_in_force, expires
+                elif opcode == STOP:
+                    (account_id,) = INTEGER.unpack_from(data, offset)
+                    market, offset = _unpack_string(data, offset + INTEGER.size)
+                    side, quantity, price, stop, created = STOP_FIELDS.unpack_from(data, offset)
+                    offset += STOP_FIELDS.size
+                    yield opcode, account_id, market, "BUY" if side == 0 else "SELL", quantity, price, stop, created
+                elif opcode == CANCEL:
+                    (account_id,) = INTEGER.unpack_from(data, offset)
+                    market, offset = _unpack_string(data, offset + INTEGER.size)
+                    (order_id,) = INTEGER.unpack_from(data, offset)
+                    now, offset = time_field(offset + INTEGER.size)
+                    yield opcode, account_id, market, order_id, now
+                elif opcode == CANCEL_ALL:
+                    (account_id,) = INTEGER.unpack_from(data, offset)
+                    market, offset = _unpack_string(data, offset + INTEGER.size)
+                    side, low, high = CANCEL_ALL_FIELDS.unpack_from(data, offset)
+                    now, offset = time_field(offset + CANCEL_ALL_FIELDS.size)
+                    yield opcode, account_id, market, side, low, high, now
+                elif opcode == AMEND:
+                    (account_id,) = INTEGER.unpack_from(data, offset)
+                    market, offset = _unpack_string(data, offset + INTEGER.size)
+                    order_id, quantity, price, created = AMEND_FIELDS.unpack_from(data, offset)
+                    offset += AMEND_FIELDS.size
+                    yield opcode, account_id, market, order_id, quantity, price, created
+                elif opcode == EXPIRE:
+                    market, offset = _unpack_string(data, offset)
+                    (now,) = INTEGER.unpack_from(data, offset)
+                    offset += INTEGER.size
+                    yield opcode, market, now
+                else:
+                    return
+        except (struct.error, UnicodeDecodeError):
+            return
+
+    return bool(flags), records()
+
+
+# position of the time in the records that carry one
+TIMES = {ORDER: 6, TIMED_ORDER: 6, STOP: 7, AMEND: 6, EXPIRE: 2, CANCEL: 4, CANCEL_ALL: 6}
+
+
+def record_time(record: tuple):
+    # time of a journal record, None for records without one
+    index = TIMES.get(record[0])
+    return None if index is None else record[index]
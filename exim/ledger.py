@@ -0,0 +1,55 @@
+from .models import Asset
+import numpy as np
+
+
+class Ledger:
+    # balances of every account and symbol in dense accounts x symbols matrices of unlocked and locked amounts
+    # rows are account ids and columns follow the order symbols were added in, the matrices hold python
+    # objects so decimals and integers of any size stay exact, numpy still adds them one element at a time
+    def __init__(self, zero, capacity: int = 1024):
+        self.zero = zero
+        self.columns = dict()
+        self.capacity = capacity
+        self.unlocked = self._matrix(capacity, 0)
+        self.locked = self._matrix(capacity, 0)
+
+    def _matrix(self, rows: int, columns: int):
+        return np.full((rows, columns), self.zero, dtype=object)
+
+    def add_symbol(self, symbol: str):
+        self.columns[symbol] = len(self.columns)
+        for name in ("unlocked", "locked"):
+            matrix = self._matrix(self.capacity, len(self.columns))
+            matrix[:, :-1] = getattr(self, name)
+            setattr(self, name, matrix)
+
+    def reserve(self, row: int):
+        # make room for a row, growing by doubling
+        if row < self.capacity:
+            return
+        while self.capacity <= row:
+            self.capacity *= 2
+        for name in ("unlocked", "locked"):
+            matrix = self._matrix(self.capacity, len(self.columns))
+            matrix[: len(getattr(self, name))] = getattr(self, name)
+            setattr(self, name, matrix)
+
+    def asset(self, row: int, symbol: str) -> Asset:
+        return Asset(self, row, self.columns[symbol])
+
+    def scale(self, symbol: str, factor: int):
+        # multiply every balance of symbol
+        column = self.columns[symbol]
+        self.unlocked[:, column] *= factor
+        self.locked[:, column] *= factor
+
+    def credit(self, rows, symbol: str, amounts):
+        # add amounts to the unlocked balances of rows, repeated rows add up
+        np.add.at(self.unlocked[:, self.columns[symbol]], np.asarray(rows, dtype=np.int64), amounts)
+
+    def totals(self, rows):
+        # total balances of rows, one column per symbol
+        return self.unlocked[rows] + self.locked[rows]
+
+    def __repr__(self):
+        return f"Ledger(symbols={list(self.columns)}, capacity={self.capacity})"
@@ -1,136 +1,289 @@
-from .orderbook import OrderBook
+from .orderbook import OrderBook, StopBook
 from .models import Order, Trade
+from .tape import TradeTape
+from .archive import Archive, Retention, ORDER_DTYPE, STATUSES
+from .feed import Feed
+from .bars import Bars
+from .stats import timed
+from .units import to_decimal, to_units, from_units
+import numpy as np
 import itertools
-import time
 
 
 class Market:
-    def __init__(self, base: str, qoute: str):
+    def __init__(
+        self,
+        base: str,
+        qoute: str,
+        base_decimals: int = 0,
+        qoute_decimals: int = 0,
+        fixed_point: bool = False,
+        retention: Retention = None,
+    ):
         self.base = base
         self.qoute = qoute
         self.symbol = f"{self.base}{self.qoute}"
-        self.orderbook = OrderBook()
+        self.base_decimals = base_decimals
+        self.qoute_decimals = qoute_decimals
+        self.fixed_point = fixed_point
+        # multipliers from order units (quantity, quantity * price) to ledger units of base and qoute
+        self.base_factor = 1
+        self.qoute_factor = 1
+        self.orderbook = OrderBook(price_scale=1 if fixed_point else 10**qoute_decimals)
+        self.stops = StopBook()
+        # heap of (expiry time, id, order) of good till time orders, closed orders leave it when they are due
+        self.expiries = []
         self.orders = dict()
-        self.trades = dict()
-        self.trades_history = []
+        self.trades = TradeTape()
         self.order_id_counter = itertools.count()
         self.trade_id_counter = itertools.count()
+        # closed orders in closing order, tracked only when history is retained
+        self.retention = retention
+        self.archive = Archive(retention.path, self.symbol) if retention and retention.path else None
+        self.closed_orders = dict()
+        self.operations = 0
+        # market data feed, created by the first subscription
+        self.feed = None
+        # bars and rolling vwap updated with every trade once tracked
+        self.bars = None
+        # stats of the exchange while they are enabled
+        self.stats = None
+
+    def price_units(self, price):
+        # convert a price to its internal representation
+        if self.fixed_point:
+            return to_units(price, self.qoute_decimals)
+        return to_decimal(price, self.qoute_decimals)
+
+    def quantity_units(self, quantity):
+        # convert a quantity to its internal representation
+        if self.fixed_point:
+            return to_units(quantity, self.base_decimals)
+        return to_decimal(quantity, self.base_decimals)
+
+    def price_value(self, price):
+        # convert an internal price to decimal
+        if self.fixed_point and price is not None:
+            return from_units(price, self.qoute_decimals)
+        return price
+
+    def quantity_value(self, quantity):
+        # convert an internal quantity to decimal
+        if self.fixed_point:
+            return from_units(quantity, self.base_decimals)
+        return quantity
+
+    def to_units(self, value, decimals: int) -> int:
+        # integer units of an internal price or quantity
+        if value is None:
+            return 0
+        return value if self.fixed_point else int(value.scaleb(decimals))
+
+    def close(self, order: Order, now: int):
+        order.close_time = now
+        if self.retention is not None:
+            self.closed_orders[order.id] = order
+
+    def enforce_retention(self, now: int):
+        # evict closed orders and trades beyond the retention limits, once every chunk operations
+        # returns the evicted orders so their owners can forget them
+        self.operations += 1
+        retention = self.retention
+        if self.operations % retention.chunk:
+            return []
+        evicted = []
+        count = 0
+        if retention.max_closed_orders is not None:
+            count = max(0, len(self.closed_orders) - retention.max_closed_orders)
+        if retention.max_age is not None:
+            # closed orders are kept in closing order, so their close times only grow
+            for order in itertools.islice(self.closed_orders.values(), count, None):
+                if now - order.close_time <= retention.max_age:
+                    break
+                count += 1
+        for order_id in list(itertools.islice(self.closed_orders.keys(), count)):
+            order = self.closed_orders.pop(order_id)
+            self.orders.pop(order_id)
+            evicted.append(order)
+        if evicted and self.archive is not None:
+            records = np.empty(len(evicted), dtype=ORDER_DTYPE)
+            records["id"] = [order.id for order in evicted]
+            records["time"] = [order.time for order in evicted]
+            records["owner"] = [order.owner for order in evicted]
+            records["side"] = [0 if order.side == "BUY" else 1 for order in evicted]
+            records["quantity"] = [self.to_units(order.initial_quantity, self.base_decimals) for order in evicted]
+            records["price"] = [self.to_units(order.price, self.qoute_decimals) for order in evicted]
+            records["status"] = [STATUSES.index(order.status) for order in evicted]
+            self.archive.append_orders(records)
+        count = 0
+        if retention.max_trades is not None:
+            count = max(0, len(self.trades) - retention.max_trades)
+        if retention.max_age is not None:
+            count = max(count, self.trades.select(since=now - retention.max_age)[0])
+        if count:
+            records = self.trades.evict(count)
+            if self.archive is not None:
+                self.archive.append_trades(records)
+        return evicted
+
+    def archived_orders(self, owner: int, status: str = None):
+        # archived order records of an owner, optionally of one status
+        if self.archive is None:
+            return np.empty(0, dtype=ORDER_DTYPE)
+        records = self.archive.orders()
+        selected = records["owner"] == owner
+        if status is not None:
+            if status not in STATUSES:
+                return records[:0]
+            selected &= records["status"] == STATUSES.index(status)
+        return records[selected]
+
+    def trade_columns(self, since: int = None, last_n: int = None):
+        # trade columns of the archive and the tape, views of the tape when no archived rows are needed
+        start, stop = self.trades.select(since=since, last_n=last_n)
+        columns = {name: self.trades.column(name, start, stop) for name, _ in TradeTape.columns}
+        if self.archive is None or start > 0 or (last_n is not None and stop - start >= last_n):
+            return columns
+        archived = self.archive.trades()
+        if since is not None:
+            archived = archived[int(np.searchsorted(archived["time"], since, side="left")) :]
+        if last_n is not None:
+            archived = archived[max(0, len(archived) - (last_n - (stop - start))) :]
+        if not len(archived):
+            return columns
+        return {name: np.concatenate((archived[name], columns[name])) for name in columns}
 
     @property
     def best_bid(self):
-        return self.orderbook.bids.top.price if self.orderbook.bids.top else None
+        return self.price_value(self.orderbook.bids.top.price) if self.orderbook.bids.top else None
 
     @property
     def best_ask(self):
-        return self.orderbook.asks.top.price if self.orderbook.asks.top else None
+        return self.price_value(self.orderbook.asks.top.price) if self.orderbook.asks.top else None
 
     @property
     def last_price(self):
-        return self.trades_history[-1]["price"] if self.trades else None
+        return float(self.trades.last("price")) if self.trades else None
 
     @property
     def mid_price(self):
         return (self.best_bid + self.best_ask) / 2 if self.best_bid and self.best_ask else None
 
-    def process_order(self, order: Order):
+    def cost_to_fill(self, side: str, quantity: float, limit_price: float = None):
+        # qoute amount paid (BUY) or received (SELL) for quantity against the current book
+        # a limit remainder is valued at the limit price, None if a market order can not be filled
+        tree = self.orderbook.asks if side.upper() == "BUY" else self.orderbook.bids
+        quantity = self.quantity_units(quantity)
+        limit_price = self.price_units(limit_price) if limit_price else None
+        cost = tree.sweep(quantity, limit_price)
+        if cost is not None and self.fixed_point:
+            return from_units(cost, self.base_decimals + self.qoute_decimals)
+        return cost
+
+    def subscribe(self, callback, level: int = 2, snapshot_interval: int = None):
+        # call back with book events of the given level, starting with a snapshot
+        if self.feed is None:
+            self.feed = Feed(self)
+            self.orderbook.bids.feed = self.orderbook.asks.feed = self.feed
+        self.feed.subscribe(callback, level, snapshot_interval)
+
+    def unsubscribe(self, callback):
+        if self.feed is None:
+            return
+        self.feed.unsubscribe(callback)
+        if not self.feed:
+            self.feed = self.orderbook.bids.feed = self.orderbook.asks.feed = None
+
+    def track_bars(self, intervals, capacity: int = 1024, windows=()):
+        # start bars of the given intervals and rolling vwap windows (nanoseconds) from the trades in memory
+        self.bars = Bars(intervals, capacity, windows)
+        for created, price, quantity in zip(
+            self.trades.column("time").tolist(),
+            self.trades.column("price").tolist(),
+            self.trades.column("quantity").tolist(),
+        ):
+            self.bars.update(created, price, quantity)
+
+    @timed("market.process_order")
+    def process_order(self, order: Order, now: int = None, rest: bool = True):
+        # trades happen at now, at the time of the order by default, so matching reads no clock
+        # without rest the unfilled quantity of a limit order stays out of the book
+        now = order.time if now is None else now
+        feed = self.feed
+        bars = self.bars
+
         def trade(maker: Order, taker: Order):
             # trades maker and taker orders against each other
             amount = min(maker.quantity, taker.quantity)
             maker.quantity -= amount
             taker.quantity -= amount
             _trade = Trade(
-                time=time.time_ns(),
+                time=now,
                 side=maker.side,
                 quantity=amount,
                 price=maker.price,
                 maker=maker.owner,
                 taker=taker.owner,
+                maker_order=maker.id,
+                taker_order=taker.id,
             )
             _trade.id = next(self.trade_id_counter)
-            self.trades[_trade.id] = _trade
-            self.trades_history.append(
-                dict(time=_trade.time, price=float(_trade.price), quantity=float(_trade.quantity))
+            if self.fixed_point:
+                price = _trade.price / 10**self.qoute_decimals
+                quantity = _trade.quantity / 10**self.base_decimals
+            else:
+                price = float(_trade.price)
+                quantity = float(_trade.quantity)
+            self.trades.append(
+                _trade.id, _trade.time, price, quantity, _trade.side, _trade.maker, _trade.taker, maker.id, taker.id
             )
-            trades.append(_trade.id)
+            if bars is not None:
+                bars.update(_trade.time, price, quantity)
+            trades.append(_trade)
             maker.trades.append(_trade.id)
             taker.trades.append(_trade.id)
+            if feed is not None:
+                feed.executed(maker, amount)
             return amount
 
-        def _recursive_process(order: Order):
-            # recursively trades orders against each other
-            if order.side == "BUY":
-                if order.price is not None:  # process limit order
-                    maker = self.orderbook.asks.top
-                    if not maker or order.price < maker.price:
-                        self.orderbook.bids.push(order)
-                        return
-                    else:
-                        amount = trade(maker, order)
-                        self.orderbook.asks.depth[maker.price] -= amount
-                        self.orderbook.asks.volume -= amount
-                        if maker.quantity == 0:
-                            self.orderbook.asks.pop(maker)
-                            self.orders[maker.id].status = "FILLED"
-                            filled_orders.append(maker.id)
-                        if order.quantity > 0:
-                            _recursive_process(order)
-                        else:
-                            self.orders[order.id].status = "FILLED"
-                            filled_orders.append(order.id)
-                            return
-                else:  # process market order
-                    maker = self.orderbook.asks.top
-                    amount = trade(maker, order)
-                    self.orderbook.asks.depth[maker.price] -= amount
-                    self.orderbook.asks.volume -= amount
-                    if maker.quantity == 0:
-                        self.orderbook.asks.pop(maker)
-                        self.orders[maker.id].status = "FILLED"
-                        filled_orders.append(maker.id)
-                    if order.quantity > 0:
-                        _recursive_process(order)
-                    else:
-                        self.orders[order.id].status = "FILLED"
-                        filled_orders.append(order.id)
-                        return
-
-            if order.side == "SELL":
-                if order.price is not None:  # process limit order
-                    maker = self.orderbook.bids.top
-                    if not maker or order.price > maker.price:
-                        self.orderbook.asks.push(order)
-                        return
-                    else:
-                        amount = trade(maker, order)
-                        self.orderbook.bids.depth[maker.price] -= amount
-                        self.orderbook.bids.volume -= amount
-                        if maker.quantity == 0:
-                            self.orderbook.bids.pop(maker)
-                            self.orders[maker.id].status = "FILLED"
-                            filled_orders.append(maker.id)
-                        if order.quantity > 0:
-                            _recursive_process(order)
-                        else:
-                            self.orders[order.id].status = "FILLED"
-                            filled_orders.append(order.id)
-                            return
-                else:  # process market order
-                    maker = self.orderbook.bids.top
-                    amount = trade(maker, order)
-                    self.orderbook.bids.depth[maker.price] -= amount
-                    self.orderbook.bids.volume -= amount
-                    if maker.quantity == 0:
-                        self.orderbook.bids.pop(maker)
-                        self.orders[maker.id].status = "FILLED"
-                        filled_orders.append(maker.id)
-                    if order.quantity > 0:
-                        _recursive_process(order)
-                    else:
-                        self.orders[order.id].status = "FILLED"
-                        filled_orders.append(order.id)
-                        return
-
+        # sweeps the opposite side level by level until the order is filled or its limit is reached
+        if order.side == "BUY":
+            book, opposite = self.orderbook.bids, self.orderbook.asks
+        else:
+            book, opposite = self.orderbook.asks, self.orderbook.bids
         trades = []
         filled_orders = []
-        _recursive_process(order)
+        while order.quantity > 0 and opposite.tree:
+            maker = opposite.top
+            price = maker.price
+            if order.price is not None:
+                if (order.side == "BUY" and order.price < price) or (order.side == "SELL" and order.price > price):
+                    break
+            if order.quantity >= opposite.depth[price]:
+                # take the whole level and drop its queue at once
+                while maker is not None:
+                    trade(maker, order)
+                    maker.status = "FILLED"
+                    filled_orders.append(maker.id)
+                    next_maker = maker.next
+                    maker.prev = maker.next = None
+                    maker = next_maker
+                opposite.drop(price)
+            else:
+                # take the front of the level and leave the rest queued
+                queue = opposite.tree[price]
+                taken = 0
+                while order.quantity > 0:
+                    taken += trade(maker, order)
+                    if maker.quantity == 0:
+                        maker.status = "FILLED"
+                        filled_orders.append(maker.id)
+                        queue.remove(maker)
+                        maker = queue.head
+                opposite.consume(price, taken)
+        if order.quantity == 0:
+            order.status = "FILLED"
+            filled_orders.append(order.id)
+        elif order.price is not None and rest:
+            book.push(order)
         return trades, filled_orders
@@ -2,28 +2,31 @@ from decimal import Decimal
 
 
 class Asset:
-    def __init__(self, quantity: Decimal):
-        assert quantity >= 0.0
-        self._unlocked = quantity
-        self._locked = Decimal("0.00")
+    # balance of one symbol of one account, a view of a cell of the ledger
+    __slots__ = ("ledger", "row", "column")
+
+    def __init__(self, ledger, row: int, column: int):
+        self.ledger = ledger
+        self.row = row
+        self.column = column
 
     @property
     def unlocked(self) -> Decimal:
-        return self._unlocked
+        return self.ledger.unlocked[self.row, self.column]
 
     @property
     def locked(self) -> Decimal:
-        return self._locked
+        return self.ledger.locked[self.row, self.column]
 
     @unlocked.setter
     def unlocked(self, quantity: Decimal):
         assert quantity >= 0.0
-        self._unlocked = quantity
+        self.ledger.unlocked[self.row, self.column] = quantity
 
     @locked.setter
     def locked(self, quantity: Decimal):
         assert quantity >= 0.0
-        self._locked = quantity
+        self.ledger.locked[self.row, self.column] = quantity
 
     @property
     def total(self) -> Decimal:
@@ -44,6 +47,42 @@ class Account:
         return f"Account(id={self.id}, name={self.name})"
 
 
+class OrderRegistry:
+    def __init__(self):
+        # orders of an account in one market keyed by order id, in insertion order
+        self.open = dict()
+        self.closed = dict()
+        self.status = dict(OPEN=self.open, FILLED=dict(), CANCELED=dict())
+        # open orders per side
+        self.side = dict(BUY=dict(), SELL=dict())
+
+    def add(self, order: "Order"):
+        self.open[order.id] = order
+        self.side[order.side][order.id] = order
+
+    def close(self, order: "Order"):
+        # move an order that was filled or canceled out of the open views
+        del self.open[order.id]
+        del self.side[order.side][order.id]
+        self.closed[order.id] = order
+        self.status[order.status][order.id] = order
+
+    def forget(self, order: "Order"):
+        # drop a closed order that was evicted from memory
+        del self.closed[order.id]
+        del self.status[order.status][order.id]
+
+    def __getitem__(self, key: str):
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"OrderRegistry(open={len(self.open)}, closed={len(self.closed)})"
+
+
+# good till canceled, immediate or cancel, fill or kill and good till time
+TIME_IN_FORCE = ("GTC", "IOC", "FOK", "GTT")
+
+
 class Order:
     def __init__(self, time: int, owner: int, side: str, quantity: Decimal, price: Decimal = None):
         assert time >= 0
@@ -56,6 +95,12 @@ class Order:
         self._quantity = quantity
         self.initial_quantity = quantity
         self.price = price
+        # trigger price of a stop order, it waits in the stop book until a trade reaches it
+        self.stop = None
+        # expiry time of a good till time order
+        self.expires = None
+        # time the order was filled or canceled
+        self.close_time = None
         self.status = None
         self.trades = []
         self.next = None
@@ -75,7 +120,17 @@ class Order:
 
 
 class Trade:
-    def __init__(self, time: int, side: str, quantity: Decimal, price: Decimal, maker: int, taker: int):
+    def __init__(
+        self,
+        time: int,
+        side: str,
+        quantity: Decimal,
+        price: Decimal,
+        maker: int,
+        taker: int,
+        maker_order: int = None,
+        taker_order: int = None,
+    ):
         assert quantity > 0.0
         assert price > 0.0
         self.id = None
@@ -85,6 +140,8 @@ class Trade:
         self.price = price
         self.maker = maker
         self.taker = taker
+        self.maker_order = maker_order
+        self.taker_order = taker_order
 
     def __repr__(self):
         return f"Trade(id={self.id}, time={self.time}, side={self.side}, quantity={self.quantity},  price={self.price})"
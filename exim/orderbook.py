@@ -1,5 +1,7 @@
 from .models import Order
 from sortedcontainers import SortedDict
+from decimal import Decimal
+import heapq
 
 
 class OrderQueue:
@@ -38,12 +40,89 @@ class OrderQueue:
         return True
 
 
+class DepthIndex:
+    # fenwick tree of volume and notional over integer price ticks, grown by doubling
+    def __init__(self):
+        self.size = 1
+        self.volumes = dict()
+        self.notionals = dict()
+        self.volume = 0
+        self.notional = 0
+
+    def add(self, tick: int, volume, notional):
+        while tick > self.size:
+            # the new root covers every tick indexed so far
+            self.size *= 2
+            self._set(self.size, self.volume, self.notional)
+        self.volume += volume
+        self.notional += notional
+        volumes, notionals, size = self.volumes, self.notionals, self.size
+        while tick <= size:
+            node_volume = volumes.get(tick, 0) + volume
+            if node_volume:
+                volumes[tick] = node_volume
+                notionals[tick] = notionals.get(tick, 0) + notional
+            else:
+                # an empty range has no notional either, drop the node
+                volumes.pop(tick, None)
+                notionals.pop(tick, None)
+            tick += tick & -tick
+
+    def _set(self, node: int, volume, notional):
+        # keep only non-empty nodes so memory follows the populated price range
+        if volume:
+            self.volumes[node] = volume
+            self.notionals[node] = notional
+        elif node in self.volumes:
+            del self.volumes[node]
+            del self.notionals[node]
+
+    def prefix(self, tick: int):
+        # volume and notional of all ticks up to and including tick
+        volume = notional = 0
+        tick = min(tick, self.size)
+        while tick > 0:
+            volume += self.volumes.get(tick, 0)
+            notional += self.notionals.get(tick, 0)
+            tick -= tick & -tick
+        return volume, notional
+
+    def search(self, quantity, inclusive=False):
+        # largest tick whose prefix volume is below quantity (or equal to it when inclusive)
+        tick = 0
+        volume = notional = 0
+        step = self.size
+        while step:
+            node = tick + step
+            if node > self.size:
+                step //= 2
+                continue
+            node_volume = self.volumes.get(node, 0)
+            if volume + node_volume < quantity or (inclusive and volume + node_volume == quantity):
+                tick = node
+                volume += node_volume
+                notional += self.notionals.get(node, 0)
+            step //= 2
+        return tick, volume, notional
+
+
 class OrderTree:
-    def __init__(self, ascending=False):
+    def __init__(self, ascending=False, price_scale=1):
         self.ascending = ascending
+        # prices times price_scale are the integer ticks of the depth index
+        self.price_scale = price_scale
         self.tree = SortedDict()
         self.depth = SortedDict()
+        self.index = DepthIndex()
         self.volume = 0
+        # market data feed notified of every change while it has subscribers
+        self.feed = None
+
+    def tick(self, price) -> int:
+        return int(price * self.price_scale)
+
+    def price(self, tick: int):
+        return tick if self.price_scale == 1 else Decimal(tick) / self.price_scale
 
     def push(self, order: Order):
         if self.tree.get(order.price) is None:
@@ -52,14 +131,105 @@ class OrderTree:
         self.tree[order.price].append(order)
         self.depth[order.price] += order.quantity
         self.volume += order.quantity
+        self.index.add(self.tick(order.price), order.quantity, order.quantity * order.price)
+        if self.feed is not None:
+            self.feed.added(self, order)
+
+    def push_levels(self, levels):
+        # restore whole levels of linked orders given as (price, head, tail, quantity), one depth update per level
+        for price, head, tail, quantity in levels:
+            queue = self.tree[price] = OrderQueue()
+            queue.head, queue.tail = head, tail
+            self.depth[price] = quantity
+            self.volume += quantity
+            self.index.add(self.tick(price), quantity, quantity * price)
 
     def pop(self, order: Order):
         self.tree[order.price].remove(order)
         self.depth[order.price] -= order.quantity
         self.volume -= order.quantity
+        self.index.add(self.tick(order.price), -order.quantity, -order.quantity * order.price)
         if self.tree[order.price].empty():
             self.tree.pop(order.price)
             self.depth.pop(order.price)
+        if self.feed is not None:
+            self.feed.removed(self, order)
+
+    def pop_many(self, orders: list):
+        # take orders off the tree without trading, each level and the depth index are updated once
+        removed = dict()
+        for order in orders:
+            self.tree[order.price].remove(order)
+            removed[order.price] = removed.get(order.price, 0) + order.quantity
+        for price, quantity in removed.items():
+            self.volume -= quantity
+            self.index.add(self.tick(price), -quantity, -quantity * price)
+            if self.tree[price].empty():
+                self.tree.pop(price)
+                self.depth.pop(price)
+            else:
+                self.depth[price] -= quantity
+        if self.feed is not None:
+            self.feed.removed_many(self, orders, removed)
+
+    def reduce(self, order: Order, amount):
+        # take amount off a resting order in place, it keeps its position in the queue
+        order.quantity -= amount
+        self.depth[order.price] -= amount
+        self.volume -= amount
+        self.index.add(self.tick(order.price), -amount, -amount * order.price)
+        if self.feed is not None:
+            self.feed.reduced(self, order, amount)
+
+    def consume(self, price, amount):
+        # reduce the volume of a level after its front orders were traded
+        self.depth[price] -= amount
+        self.volume -= amount
+        self.index.add(self.tick(price), -amount, -amount * price)
+        if self.feed is not None:
+            self.feed.changed(self, price)
+
+    def drop(self, price):
+        # remove a whole level and return its queue
+        volume = self.depth.pop(price)
+        self.volume -= volume
+        self.index.add(self.tick(price), -volume, -volume * price)
+        queue = self.tree.pop(price)
+        if self.feed is not None:
+            self.feed.changed(self, price)
+        return queue
+
+    def available(self, limit_price=None):
+        # volume a taker can take from the tree up to a limit price, read from the depth index
+        if limit_price is None:
+            return self.volume
+        if self.ascending:
+            return self.index.prefix(self.tick(limit_price))[0]
+        return self.index.volume - self.index.prefix(self.tick(limit_price) - 1)[0]
+
+    def sweep(self, quantity, limit_price=None):
+        # notional of taking quantity from the top of the tree, the remainder beyond a limit is priced at the limit
+        # returns None when a market order can not be filled
+        index = self.index
+        if self.ascending:
+            if limit_price is not None:
+                volume, notional = index.prefix(self.tick(limit_price) - 1)
+                if volume < quantity:
+                    return notional + (quantity - volume) * limit_price
+            elif index.volume < quantity:
+                return None
+            # levels below tick are taken whole, the level at tick + 1 is taken partially
+            tick, volume, notional = index.search(quantity)
+            return notional + (quantity - volume) * self.price(tick + 1)
+        if limit_price is not None:
+            volume, notional = index.prefix(self.tick(limit_price))
+            if index.volume - volume < quantity:
+                return index.notional - notional + (quantity - index.volume + volume) * limit_price
+        elif index.volume < quantity:
+            return None
+        # levels above tick are taken whole, the excess is given back at the level at tick + 1
+        tick, volume, notional = index.search(index.volume - quantity, inclusive=True)
+        return index.notional - notional - (index.volume - volume - quantity) * self.price(tick + 1)
 
     @property
     def top(self):
@@ -73,6 +243,53 @@ class OrderTree:
 
 
 class OrderBook:
+    def __init__(self, price_scale=1):
+        self.bids = OrderTree(ascending=False, price_scale=price_scale)
+        self.asks = OrderTree(ascending=True, price_scale=price_scale)
+
+
+class StopBook:
+    # resting stop orders of a market by trigger price, apart from the order book
+    # buy stops trigger when a trade reaches their stop from below, sell stops when one reaches it from above
+    # each trigger price keeps its orders by id, so triggered orders come out in time order
     def __init__(self):
-        self.bids = OrderTree(ascending=False)
-        self.asks = OrderTree(ascending=True)
+        self.buys = SortedDict()
+        self.sells = SortedDict()
+        self.count = 0
+        # triggered orders waiting to be matched as (time, id, order)
+        self.pending = []
+        # set while pending orders are matched, stops they trigger join pending
+        self.draining = False
+
+    def __len__(self):
+        return self.count
+
+    def push(self, order: Order):
+        tree = self.buys if order.side == "BUY" else self.sells
+        level = tree.get(order.stop)
+        if level is None:
+            level = tree[order.stop] = dict()
+        level[order.id] = order
+        self.count += 1
+
+    def remove(self, order: Order) -> bool:
+        # take a stop out before it triggers, False when it is not waiting here
+        tree = self.buys if order.side == "BUY" else self.sells
+        level = tree.get(order.stop)
+        if level is None or level.pop(order.id, None) is None:
+            return False
+        if not level:
+            del tree[order.stop]
+        self.count -= 1
+        return True
+
+    def trigger(self, low, high):
+        # move the stops reached by trades between low and high to pending, only triggered levels are visited
+        for tree, prices in ((self.buys, self.buys.irange(maximum=high)), (self.sells, self.sells.irange(minimum=low))):
+            for price in list(prices):
+                for order in tree.pop(price).values():
+                    heapq.heappush(self.pending, (order.time, order.id, order))
+                    self.count -= 1
+
+    def __repr__(self):
+        return f"StopBook(buys={len(self.buys)}, sells={len(self.sells)}, stops={self.count})"
@@ -0,0 +1,125 @@
+from .exchange import Exchange
+from .snapshot import _next_value, read_snapshot, load_exchange
+import numpy as np
+import multiprocessing
+import tempfile
+import queue
+import time
+import os
+
+# state of a pool worker, set once by its initializer
+_worker = dict()
+
+
+class ScenarioResult:
+    # summary of one run: trades made and last trade price per market, account totals per symbol as floats
+    # in account id order and whatever the scenario returned
+    def __init__(self, index: int, param, trades: dict, prices: dict, account_ids, totals: dict, metrics, elapsed: float):
+        # index of the run in params and its wall time in seconds
+        self.index = index
+        self.param = param
+        self.trades = trades
+        self.prices = prices
+        self.account_ids = account_ids
+        self.totals = totals
+        self.metrics = metrics
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return f"ScenarioResult(index={self.index}, param={self.param}, trades={sum(self.trades.values())})"
+
+
+def _init(path: str, scenario):
+    # the template is read once per worker, its arrays are copied out of the snapshot file
+    meta, array = read_snapshot(path)
+    arrays = {name: np.array(array(name)) for name in meta["arrays"]}
+    _worker["template"] = (meta, arrays.__getitem__)
+    _worker["scenario"] = scenario
+
+
+def _run(task: tuple) -> ScenarioResult:
+    # every run starts from its own exchange, built from the template of its worker
+    index, param = task
+    started = time.perf_counter()
+    exchange = load_exchange(Exchange, *_worker["template"])
+    first_trade = {symbol: _next_value(market, "trade_id_counter") for symbol, market in exchange.markets.items()}
+    metrics = _worker["scenario"](exchange, param)
+    accounts = exchange.get_accounts(as_="arrays")
+    return ScenarioResult(
+        index,
+        param,
+        {symbol: _next_value(market, "trade_id_counter") - first_trade[symbol] for symbol, market in exchange.markets.items()},
+        {symbol: market.last_price for symbol, market in exchange.markets.items()},
+        accounts["id"],
+        {symbol: np.asarray(accounts[symbol], dtype=np.float64) for symbol in exchange.symbols},
+        metrics,
+        time.perf_counter() - started,
+    )
+
+
+def run_scenarios(
+    template, scenario, params, processes: int = None, ordered: bool = False, context=None, max_pending: int = None
+):
+    # run scenario(exchange, param) once per param, each time on a fresh copy of the template exchange
+    # (or of a snapshot file), and yield a ScenarioResult per run as runs finish, in params order when ordered
+    # the template is written once as a snapshot that every worker reads once, runs go to a pool of
+    # processes (all cores by default, 1 runs them here) and only finished results reach this process
+    # at most max_pending runs (twice the processes by default) are queued, running or waiting to be
+    # yielded, so a slow consumer holds back the runs instead of buffering their results
+    # with a spawn context scenario has to be importable, a module level function
+    # markets of the template must not archive to files, parallel runs would append to the same ones
+    params = list(params)
+    with tempfile.TemporaryDirectory() as directory:
+        if isinstance(template, Exchange):
+            path = os.path.join(directory, "template.snapshot")
+            template.save_snapshot(path)
+        else:
+            path = template
+        archived = [
+            f"{spec['base']}{spec['qoute']}"
+            for spec in read_snapshot(path)[0]["markets"]
+            if spec["retention"] is not None and spec["retention"]["path"] is not None
+        ]
+        if archived:
+            raise ValueError(f"markets of a scenario template can not archive to files: {', '.join(archived)}")
+        tasks = enumerate(params)
+        processes = min(processes or os.cpu_count(), max(1, len(params)))
+        if processes == 1:
+            _init(path, scenario)
+            for task in tasks:
+                yield _run(task)
+            return
+        context = context or multiprocessing.get_context()
+        with context.Pool(processes, initializer=_init, initargs=(path, scenario)) as pool:
+            yield from _bounded(pool, tasks, ordered, max_pending or 2 * processes)
+
+
+def _bounded(pool, tasks, ordered: bool, max_pending: int):
+    # submit a new run each time a result is yielded, in order results wait until the runs before them finish
+    finished = queue.Queue()
+    ready = dict()
+    pending = 0
+    following = 0
+
+    def submit():
+        task = next(tasks, None)
+        if task is None:
+            return 0
+        pool.apply_async(_run, (task,), callback=finished.put, error_callback=finished.put)
+        return 1
+
+    for _ in range(max_pending):
+        pending += submit()
+    while pending:
+        result = finished.get()
+        if isinstance(result, BaseException):
+            raise result
+        ready[result.index] = result
+        while ready:
+            index = following if ordered else next(iter(ready))
+            if index not in ready:
+                break
+            pending -= 1
+            following += 1
+            yield ready.pop(index)
+            pending += submit()
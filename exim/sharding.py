@@ -0,0 +1,645 @@
+from .exchange import Exchange
+from .models import Account, Order
+from .codes import Code
+from .stats import timed
+from .archive import Retention
+from .events import REJECTED, TRIGGERED, CANCELED
+from .snapshot import read_snapshot, load_clock, load_accounts, load_market, market_state
+from functools import wraps
+import multiprocessing
+import heapq
+import os
+
+
+class ShardExchange(Exchange):
+    # exchange hosted by a shard process, its wallets only hold funds locked by resting orders between
+    # commands, every unlocked amount is returned to the central ledger after each group of commands
+    def __init__(self, fixed_point: bool = False):
+        super().__init__(verbose=False, fixed_point=fixed_point)
+        # account and symbol pairs whose balances changed since the last release
+        self.touched = set()
+        # locked balances last reported to the central ledger
+        self.reported = dict()
+        # time of the trades that triggered the stops pending in each market
+        self.triggered = dict()
+        # market, owner, id and side of the orders expired since the last group of commands
+        self.expired = []
+
+    def account(self, account_id: int):
+        # accounts are known to a shard from their first order on it
+        account = self.accounts.get(account_id)
+        if account is None:
+            account = Account(name=None)
+            account.id = account_id
+            self._add_account(account)
+        return account
+
+    def rescale(self, ledger_decimals: dict):
+        # follow the ledger decimals of the central ledger in fixed point mode
+        for symbol, decimals in ledger_decimals.items():
+            self._rescale_ledger(symbol, decimals)
+
+    def _touch(self, account_id: int, market):
+        self.touched.add((account_id, market.base))
+        self.touched.add((account_id, market.qoute))
+
+    def _unlock(self, account: Account, market, order: Order):
+        # expiries unlock the funds of accounts other than the one of the command
+        self._touch(account.id, market)
+        super()._unlock(account, market, order)
+
+    @staticmethod
+    def _state(code: Code, order: Order):
+        # result of a command, with the fields the central exchange needs to describe the order
+        if order is None:
+            return code, None
+        return code, (
+            order.id,
+            order.time,
+            order.owner,
+            order.status,
+            order.side,
+            order.quantity,
+            order.price,
+            order.initial_quantity,
+            order.stop,
+        )
+
+    def _settle(self, taker: Account, market, side: str, trades: list):
+        for trade in trades:
+            self.touched.add((trade.maker, market.base))
+            self.touched.add((trade.maker, market.qoute))
+        super()._settle(taker, market, side, trades)
+
+    def _trigger(self, market, trades: list):
+        # triggered stops wait in the pending queue of their market until the central ledger funds them
+        prices = [trade.price for trade in trades]
+        market.stops.trigger(min(prices), max(prices))
+        if market.stops.pending and market.symbol not in self.triggered:
+            self.triggered[market.symbol] = trades[-1].time
+
+    def _expire(self, market, now: int) -> list:
+        expired = super()._expire(market, now)
+        self.expired.extend((market.symbol, order.owner, order.id, order.side) for order in expired)
+        return expired
+
+    def place(
+        self,
+        account_id: int,
+        symbol: str,
+        side: str,
+        quantity,
+        price,
+        budget,
+        created: int,
+        time_in_force: str = "GTC",
+        expires: int = None,
+    ):
+        # fund the order with the budget reserved for it and place it as the exchange would
+        market = self.markets[symbol]
+        account = self.account(account_id)
+        account.wallet[market.qoute if side == "BUY" else market.base].unlocked += budget
+        self._touch(account_id, market)
+        return self._state(*self._place(account, market, side, quantity, price, created, time_in_force, expires))
+
+    def expire(self, symbol: str, now: int):
+        market = self.markets[symbol]
+        if market.expiries and market.expiries[0][0] <= now:
+            return Code.OK, [self._state(Code.OK, order)[1] for order in self._expire(market, now)]
+        return Code.OK, []
+
+    def cancel_all(self, account_id: int, symbol: str, side: str, low, high, created: int):
+        market = self.markets[symbol]
+        self._touch(account_id, market)
+        orders = self._cancel_all(self.account(account_id), market, side, low, high, created)
+        return Code.OK, [self._state(Code.OK, order)[1] for order in orders]
+
+    def amend(self, account_id: int, symbol: str, order_id: int, quantity, price, budgets: tuple, created: int):
+        # the budgets of base and qoute cover a requeue whatever the side of the order
+        market = self.markets[symbol]
+        account = self.account(account_id)
+        account.wallet[market.base].unlocked += budgets[0]
+        account.wallet[market.qoute].unlocked += budgets[1]
+        self._touch(account_id, market)
+        return self._state(*self._amend(account, market, order_id, quantity, price, created))
+
+    def stop(self, account_id: int, symbol: str, side: str, quantity, price, stop, created: int):
+        market = self.markets[symbol]
+        return self._state(*self._place_stop(self.account(account_id), market, side, quantity, price, stop, created))
+
+    def activate(self, symbol: str, budget):
+        # fund the first pending stop of a market and match it at the time of the trades that triggered it
+        market = self.markets[symbol]
+        _, _, order = heapq.heappop(market.stops.pending)
+        account = self.accounts[order.owner]
+        account.wallet[market.qoute if order.side == "BUY" else market.base].unlocked += budget
+        self._touch(order.owner, market)
+        code = self._activate(market, order, self.triggered[symbol])
+        if not market.stops.pending:
+            del self.triggered[symbol]
+        return self._state(code, order)
+
+    def cancel(self, account_id: int, symbol: str, order_id: int, created: int):
+        market = self.markets[symbol]
+        self._touch(account_id, market)
+        return self._cancel(self.account(account_id), market, order_id, created), None
+
+    def release(self):
+        # empty the unlocked balances of the touched accounts and report them with the change of their locked balances
+        transfers = []
+        for account_id, symbol in self.touched:
+            asset = self.accounts[account_id].wallet[symbol]
+            locked = asset.locked - self.reported.get((account_id, symbol), 0)
+            if asset.unlocked or locked:
+                transfers.append((account_id, symbol, asset.unlocked, locked))
+                asset.unlocked = self._zero()
+                self.reported[(account_id, symbol)] = asset.locked
+        self.touched.clear()
+        return transfers
+
+    def run(self, commands: list):
+        # run a group of commands in order and release the balances they changed, a command that triggers
+        # stops ends the group early, the first pending stop is returned so the central ledger can fund it
+        results = []
+        for command in commands:
+            results.append(getattr(self, command[0])(*command[1:]))
+            if self.triggered:
+                break
+        expired, self.expired = self.expired, []
+        return results, self.release(), self._pending(), expired
+
+    def _pending(self):
+        # owner, side, quantity and price of the next stop to activate
+        if not self.triggered:
+            return None
+        symbol = next(iter(self.triggered))
+        order = self.markets[symbol].stops.pending[0][2]
+        return symbol, order.owner, order.side, order.quantity, order.price
+
+    def get_orders(self, account_id: int, market: str, status: str = None, as_: str = "frame"):
+        self.account(account_id)
+        return super().get_orders(account_id, market, status, as_)
+
+    def market_state(self, symbol: str):
+        return market_state(self.markets[symbol])
+
+    def restore(self, path: str, spec: dict, ledger_decimals: dict):
+        # load a market of a snapshot, the funds locked by its resting orders are already in the central ledger
+        # so they count as reported
+        if self.fixed_point:
+            self.rescale(ledger_decimals)
+        meta, array = read_snapshot(path)
+        symbol = f"{spec['base']}{spec['qoute']}"
+        for account_id in set(array(f"{symbol}/owner").tolist()):
+            self.account(account_id)
+        market = load_market(self, spec, array)
+        if self.fixed_point:
+            self._update_factors()
+        for tree in (market.orderbook.bids, market.orderbook.asks):
+            for queue in tree.tree.values():
+                order = queue.head
+                while order is not None:
+                    if order.side == "BUY":
+                        amount = order.quantity * order.price * market.qoute_factor
+                        asset = self.accounts[order.owner].wallet[market.qoute]
+                    else:
+                        amount = order.quantity * market.base_factor
+                        asset = self.accounts[order.owner].wallet[market.base]
+                    asset.locked += amount
+                    order = order.next
+        for account in self.accounts.values():
+            for symbol in (market.base, market.qoute):
+                self.reported[(account.id, symbol)] = account.wallet[symbol].locked
+        return True
+
+
+def serve(connection, fixed_point: bool):
+    # command loop of a shard process, errors are sent back to be raised by the caller
+    exchange = ShardExchange(fixed_point=fixed_point)
+    while True:
+        command, args = connection.recv()
+        if command == "close":
+            break
+        try:
+            result = getattr(exchange, command)(*args)
+        except Exception as error:
+            result = error
+        connection.send(result)
+    connection.close()
+
+
+class Shard:
+    # worker process matching a group of markets
+    def __init__(self, fixed_point: bool = False, context=None):
+        context = context or multiprocessing.get_context()
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=serve, args=(child, fixed_point), daemon=True)
+        self.process.start()
+        child.close()
+        self.markets = []
+
+    def send(self, command: str, *args):
+        self.connection.send((command, args))
+
+    def receive(self):
+        result = self.connection.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def call(self, command: str, *args):
+        self.send(command, *args)
+        return self.receive()
+
+    def close(self):
+        if self.process.is_alive():
+            self.send("close")
+            self.process.join()
+        self.connection.close()
+
+    def __repr__(self):
+        return f"Shard(pid={self.process.pid}, markets={self.markets})"
+
+
+def flushed(method):
+    # run the queued commands before method
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.flush()
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class ShardedExchange(Exchange):
+    # markets are matched in shard processes while balances stay in the central ledger of this exchange
+    # an order reserves the most it may lock (never more than the unlocked balance) before it is routed
+    # and is settled from the balance changes its shard returns, so codes and locked funds are the same
+    # as with Exchange; markets here only describe symbols and units, their books live in the shards
+    # with a batch_size above 1, buy, sell and cancel queue their command once it is validated and return
+    # True, queued commands are sent to the shards together as batch_size of them are queued, on flush and
+    # before anything else reads or changes the exchange, their outcome is reported by events
+    def __init__(self, shards: int = None, verbose=True, fixed_point=False, clock=None, batch_size: int = 1):
+        super().__init__(verbose=verbose, fixed_point=fixed_point, clock=clock)
+        self.shards = [Shard(fixed_point) for _ in range(shards or os.cpu_count())]
+        # shard of each market
+        self.placement = dict()
+        self.batch_size = batch_size
+        # place and cancel commands waiting to be sent
+        self.queue = []
+
+    def _enqueue(self, command: tuple):
+        self.queue.append(command)
+        if len(self.queue) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> list:
+        # run the queued commands in rounds like process_orders, returns a code and an order id per command
+        commands, self.queue = self.queue, []
+        if not commands:
+            return []
+        results = list(self._execute(commands))
+        if self.observers:
+            for command, (code, order_id) in zip(commands, results):
+                self._executed(command, code, order_id)
+        return results
+
+    deposit = flushed(Exchange.deposit)
+    deposit_many = flushed(Exchange.deposit_many)
+    withdraw = flushed(Exchange.withdraw)
+    get_wallet = flushed(Exchange.get_wallet)
+    get_accounts = flushed(Exchange.get_accounts)
+    get_supply = flushed(Exchange.get_supply)
+    process_orders = flushed(Exchange.process_orders)
+    save_snapshot = flushed(Exchange.save_snapshot)
+
+    def _broadcast(self, command: str, *args):
+        for shard in self.shards:
+            shard.send(command, *args)
+        return [shard.receive() for shard in self.shards]
+
+    @flushed
+    def register_symbol(self, symbol: str, unit_decimals: int = 0):
+        super().register_symbol(symbol, unit_decimals)
+        self._broadcast("register_symbol", symbol, unit_decimals)
+        return True
+
+    @flushed
+    def register_market(self, base: str, qoute: str, retention: Retention = None, shard: int = None):
+        # markets go to the given shard or to the shard with the fewest markets
+        if not super().register_market(base, qoute):
+            return False
+        symbol = f"{base.upper()}{qoute.upper()}"
+        shard = self.shards[shard] if shard is not None else min(self.shards, key=lambda shard: len(shard.markets))
+        shard.call("register_market", base, qoute, retention)
+        shard.markets.append(symbol)
+        self.placement[symbol] = shard
+        if self.fixed_point:
+            self._broadcast("rescale", self.ledger_decimals)
+        return True
+
+    def _reserve(self, account: Account, market, side: str, quantity, price):
+        # budget of an order, what it may lock at most without going beyond the unlocked balance
+        if side == "BUY":
+            asset = account.wallet[market.qoute]
+            need = asset.unlocked if price is None else quantity * price * market.qoute_factor
+        else:
+            asset = account.wallet[market.base]
+            need = quantity * market.base_factor
+        budget = min(asset.unlocked, need)
+        asset.unlocked -= budget
+        asset.locked += budget
+        return asset, budget
+
+    def _execute(self, commands: list):
+        # commands run in rounds in which every account appears once, so each command of an account sees
+        # the outcome of its previous ones; a round also ends before the command of an account with funds
+        # locked in a symbol of a market another shard runs in the round, since its resting orders there
+        # may be traded and their proceeds are only settled once the round is over. fills of the stops a
+        # round triggers are available from the next round on
+        group = []
+        accounts = set()
+        # shard of each market of the round
+        markets = dict()
+        for command in commands:
+            account, shard = command[1], self.placement[command[2].symbol]
+            if account.id in accounts or any(
+                other is not shard and self._exposed(account, market) for market, other in markets.values()
+            ):
+                for code, state in self._run(group):
+                    yield code, None if state is None else state[0]
+                group = []
+                accounts.clear()
+                markets.clear()
+            group.append(command)
+            accounts.add(account.id)
+            markets[command[2].symbol] = (command[2], shard)
+        if group:
+            for code, state in self._run(group):
+                yield code, None if state is None else state[0]
+
+    @staticmethod
+    def _exposed(account: Account, market) -> bool:
+        # whether the account may have resting orders a command in market can trade against
+        return bool(account.wallet[market.base].locked or account.wallet[market.qoute].locked)
+
+    def _message(self, command: tuple, reserved: list) -> tuple:
+        # shard command of a command, commands take their time from the clock of this exchange, not from the shards
+        name, account, market, *args = command
+        if name == "place":
+            side, quantity, price, created, *time_in_force = args
+            reserved.append(self._reserve(account, market, side, quantity, price))
+            budget = reserved[-1][1]
+            return (name, account.id, market.symbol, side, quantity, price, budget, self._now(created), *time_in_force)
+        if name == "expire":
+            return name, market.symbol, args[0]
+        if name == "amend":
+            order_id, quantity, price, created = args
+            budgets = []
+            for symbol in (market.base, market.qoute):
+                asset = account.wallet[symbol]
+                reserved.append((asset, asset.unlocked))
+                budgets.append(asset.unlocked)
+                asset.locked += asset.unlocked
+                asset.unlocked = self._zero()
+            return name, account.id, market.symbol, order_id, quantity, price, tuple(budgets), self._now(created)
+        *args, created = args
+        return (name, account.id, market.symbol, *args, self._now(created))
+
+    def _now(self, created: int = None) -> int:
+        return self.clock.now() if created is None else created
+
+    @flushed
+    def _run(self, commands: list):
+        # reserve funds in command order, run the commands of every shard in parallel and settle the results
+        # a shard stops at a command that triggered stops, they are funded and activated one at a time as
+        # Exchange would before the rest of its commands are sent again
+        routed = dict()
+        reserved = []
+        for command in commands:
+            message = self._message(command, reserved)
+            routed.setdefault(self.placement[command[2].symbol], []).append(message)
+        results = {shard: [] for shard in routed}
+        while routed:
+            for shard, messages in routed.items():
+                shard.send("run", messages)
+            pending = dict()
+            for shard, messages in routed.items():
+                done, transfers, stop, expired = shard.receive()
+                self._transfer(transfers)
+                self._expired(expired)
+                results[shard].extend(done)
+                if stop is not None:
+                    pending[shard] = stop
+                    messages[: len(done)] = []
+            for shard, stop in pending.items():
+                self._activate_stops(shard, stop)
+            routed = {shard: routed[shard] for shard in pending if routed[shard]}
+        for asset, budget in reserved:
+            asset.locked -= budget
+        results = {shard: iter(done) for shard, done in results.items()}
+        return [next(results[self.placement[command[2].symbol]]) for command in commands]
+
+    def _transfer(self, transfers: list):
+        # apply the balance changes released by a shard
+        for account_id, symbol, unlocked, locked in transfers:
+            asset = self.accounts[account_id].wallet[symbol]
+            asset.unlocked += unlocked
+            asset.locked += locked
+
+    def _expired(self, expired: list):
+        # events of the orders the shard expired while it ran its commands
+        if self.observers:
+            for symbol, owner, order_id, side in expired:
+                self._emit(CANCELED, account_id=owner, market=symbol, order_id=order_id, side=side)
+
+    def _activate_stops(self, shard: Shard, stop: tuple):
+        # each pending stop reserves what it may lock before its shard activates it
+        while stop is not None:
+            symbol, owner, side, quantity, price = stop
+            market, account = self.markets[symbol], self.accounts[owner]
+            asset, budget = self._reserve(account, market, side, quantity, price)
+            ((code, state),), transfers, stop, _ = shard.call("run", [("activate", symbol, budget)])
+            self._transfer(transfers)
+            asset.locked -= budget
+            if self.observers and code:
+                self._emit(REJECTED, code, account_id=owner, market=symbol, order_id=state[0], side=side)
+            elif self.observers:
+                self._emit(
+                    TRIGGERED,
+                    account_id=owner,
+                    market=symbol,
+                    order_id=state[0],
+                    side=side,
+                    price=market.price_value(price),
+                    quantity=market.quantity_value(quantity),
+                )
+
+    @staticmethod
+    def _detached(state: tuple) -> Order:
+        # copy of an order of a shard as it was when the command ran
+        id, time, owner, status, side, quantity, price, initial_quantity, stop = state
+        order = Order(time=time, owner=owner, side=side, quantity=initial_quantity, price=price)
+        order.id = id
+        order.quantity = quantity
+        order.status = status
+        order.stop = stop
+        return order
+
+    def _place(
+        self,
+        account: Account,
+        market,
+        side: str,
+        quantity,
+        price,
+        created: int = None,
+        time_in_force: str = "GTC",
+        expires: int = None,
+    ):
+        command = ("place", account, market, side, quantity, price, created, time_in_force, expires)
+        if self.batch_size > 1:
+            # the order takes its time when it is queued
+            self._enqueue(command[:6] + (self._now(created),) + command[7:])
+            return Code.OK, None
+        ((code, state),) = self._run([command])
+        return code, None if state is None else self._detached(state)
+
+    def _accepted(self, market, order: Order, message: bool = True):
+        # queued orders are reported when they run
+        if order is not None:
+            super()._accepted(market, order, message)
+
+    @timed()
+    def cancel(self, account_id: int, market: str, order_id: int):
+        if self.batch_size == 1 or account_id not in self.accounts.keys() or market not in self.markets.keys():
+            return super().cancel(account_id, market, order_id)
+        self._enqueue(("cancel", self.accounts[account_id], self.markets[market.upper()], order_id, self.clock.now()))
+        return True
+
+    def _amend(self, account: Account, market, order_id: int, quantity=None, price=None, created: int = None):
+        # the side of the order is only known to its shard, so the whole unlocked balance of both symbols
+        # is reserved and what the amend does not lock comes back with the result
+        ((code, state),) = self._run([("amend", account, market, order_id, quantity, price, created)])
+        return code, None if state is None else self._detached(state)
+
+    def _place_stop(self, account: Account, market, side: str, quantity, price, stop, created: int = None):
+        # a stop holds no funds while it waits in its shard, it reserves them once it triggers
+        ((code, state),) = self._run([("stop", account, market, side, quantity, price, stop, created)])
+        return code, None if state is None else self._detached(state)
+
+    @timed()
+    def expire(self, market: str = None) -> int:
+        # the shards expire their markets in parallel
+        if market is not None and market not in self.markets.keys():
+            return self._failed(Code.INVALID_MARKET, market=market)
+        now = self.clock.now()
+        markets = self.markets.values() if market is None else (self.markets[market.upper()],)
+        return sum(len(states) for _, states in self._run([("expire", None, _market, now) for _market in markets]))
+
+    def _expire(self, market, now: int) -> list:
+        ((_, states),) = self._run([("expire", None, market, now)])
+        return [self._detached(state) for state in states]
+
+    def _cancel(self, account: Account, market, order_id: int, created: int = None):
+        ((code, _),) = self._run([("cancel", account, market, order_id, created)])
+        return code
+
+    def _cancel_markets(self, account: Account, side: str, ranges: list) -> list:
+        # the shards cancel their markets in parallel
+        commands = [("cancel_all", account, market, side, low, high, None) for market, low, high in ranges]
+        return [[self._detached(state) for state in states] for _, states in self._run(commands)]
+
+    def _cancel_all(self, account: Account, market, side: str = None, low=None, high=None, created: int = None):
+        ((_, states),) = self._run([("cancel_all", account, market, side, low, high, created)])
+        return [self._detached(state) for state in states]
+
+    @flushed
+    def _query(self, command: str, market: str, *args):
+        if market not in self.markets.keys():
+            self._failed(Code.INVALID_MARKET, market=market)
+            return None
+        return self.placement[market.upper()].call(command, *args)
+
+    @timed()
+    def get_trades(self, market: str, since: int = None, last_n: int = None, as_: str = "frame"):
+        return self._query("get_trades", market, market, since, last_n, as_)
+
+    @timed()
+    def get_orderbook(self, market: str, as_: str = "frame"):
+        return self._query("get_orderbook", market, market, as_)
+
+    @timed()
+    def get_orders(self, account_id: int, market: str, status: str = None, as_: str = "frame"):
+        if account_id not in self.accounts.keys():
+            self._failed(Code.INVALID_ACCOUNT, account_id=account_id)
+            return None
+        return self._query("get_orders", market, account_id, market, status, as_)
+
+    def subscribe(self, market: str, callback, level: int = 2, snapshot_interval: int = None):
+        # callbacks can not be called from the shard processes
+        return self._failed(Code.NOT_SUPPORTED, market=market)
+
+    def unsubscribe(self, market: str, callback):
+        return self._failed(Code.NOT_SUPPORTED, market=market)
+
+    def track_bars(
+        self,
+        market: str,
+        intervals=(10**9, 60 * 10**9, 300 * 10**9),
+        capacity: int = 1024,
+        windows=(60 * 10**9,),
+    ):
+        # bars are kept by the shard of the market from its trades
+        if market not in self.markets.keys():
+            return self._failed(Code.INVALID_MARKET, market=market)
+        return self._query("track_bars", market, market, intervals, capacity, windows)
+
+    @timed()
+    def get_bars(self, market: str, interval: int, last_n: int = None, as_: str = "frame"):
+        bars = self._query("get_bars", market, market, interval, last_n, as_)
+        if bars is None and market in self.markets.keys():
+            self._failed(Code.NOT_TRACKED, "Failed: interval not tracked", market=market)
+        return bars
+
+    @timed()
+    def get_vwap(self, market: str, window: int, now: int = None):
+        vwap = self._query("get_vwap", market, market, window, now)
+        if vwap is None and market in self.markets.keys():
+            self._failed(Code.NOT_TRACKED, "Failed: window not tracked", market=market)
+        return vwap
+
+    @flushed
+    def _market_states(self):
+        # gathered from the shards in parallel, in the order the markets were registered
+        for shard in self.shards:
+            shard.send("run", [("market_state", symbol) for symbol in shard.markets])
+        states = dict()
+        for shard in self.shards:
+            results, _, _, _ = shard.receive()
+            states.update(zip(shard.markets, results))
+        return [states[symbol] for symbol in self.markets.keys()]
+
+    @classmethod
+    def load_snapshot(cls, path: str, shards: int = None):
+        # markets are placed as register_market would place them and each shard loads its markets from the file
+        meta, array = read_snapshot(path)
+        exchange = cls(shards, verbose=False, fixed_point=meta["fixed_point"], clock=load_clock(meta))
+        for symbol in meta["symbols"]:
+            exchange.register_symbol(symbol, meta["unit_decimals"][symbol])
+        for spec in meta["markets"]:
+            Exchange.register_market(exchange, spec["base"], spec["qoute"])
+            symbol = f"{spec['base']}{spec['qoute']}"
+            shard = min(exchange.shards, key=lambda shard: len(shard.markets))
+            shard.call("restore", path, spec, meta["ledger_decimals"])
+            shard.markets.append(symbol)
+            exchange.placement[symbol] = shard
+        load_accounts(exchange, meta, array)
+        return exchange
+
+    def close(self):
+        # run the queued commands, stop the shard processes and close the journal
+        self.flush()
+        for shard in self.shards:
+            shard.close()
+        super().close()
@@ -0,0 +1,123 @@
+from .clock import VirtualClock
+import itertools
+import random
+import heapq
+import math
+
+
+class Agent:
+    # a market participant woken up by a scheduler, wakeup trades through the exchange and returns
+    # the delay in nanoseconds to its next wakeup, None when it is done
+    def __init__(self, account_id: int):
+        self.account_id = account_id
+
+    def wakeup(self, exchange, now: int):
+        return None
+
+    def __repr__(self):
+        return f"{type(self).__name__}(account_id={self.account_id})"
+
+
+class RandomTrader(Agent):
+    # zero intelligence trader, limit orders around the last trade price and now and then a market order,
+    # woken up at exponentially distributed intervals with a mean of interval nanoseconds
+    def __init__(
+        self,
+        account_id: int,
+        market: str,
+        price: float,
+        seed: int = None,
+        interval: int = 10**9,
+        quantity: tuple = (0.01, 1.0),
+        spread: float = 0.005,
+        market_orders: float = 0.1,
+    ):
+        super().__init__(account_id)
+        self.market = market.upper()
+        # price used until the market has traded
+        self.price = price
+        self.rng = random.Random(seed)
+        self.interval = interval
+        self.quantity = quantity
+        self.spread = spread
+        self.market_orders = market_orders
+
+    def wakeup(self, exchange, now: int):
+        market = exchange.markets[self.market]
+        last = market.trades.last("price")
+        reference = self.price if last is None else float(last)
+        rng = self.rng
+        side = rng.choice(("BUY", "SELL"))
+        quantity = round(rng.uniform(*self.quantity), market.base_decimals)
+        if rng.random() < self.market_orders:
+            exchange.process_order_qoute(dict(account_id=self.account_id, market=self.market, side=side, quantity=quantity))
+        else:
+            offset = rng.uniform(-self.spread, self.spread)
+            price = round(reference * (1 - offset if side == "BUY" else 1 + offset), market.qoute_decimals)
+            exchange.process_order_qoute(
+                dict(account_id=self.account_id, market=self.market, side=side, quantity=quantity, price=price)
+            )
+        return 1 + int(-math.log(1.0 - rng.random()) * self.interval)
+
+
+class Scheduler:
+    # discrete event loop over the virtual clock of an exchange, events wait in a heap ordered by time and
+    # by scheduling order for equal times, so the same agents with the same seeds always give the same run
+    def __init__(self, exchange):
+        assert isinstance(exchange.clock, VirtualClock), "the exchange needs a VirtualClock"
+        self.exchange = exchange
+        self.clock = exchange.clock
+        self.queue = []
+        self.sequence = itertools.count()
+        # events processed so far
+        self.processed = 0
+
+    def __len__(self):
+        return len(self.queue)
+
+    def at(self, time: int, callback, *args):
+        # call callback(*args) at a virtual time
+        assert time >= self.clock.now(), "events can not be scheduled in the past"
+        heapq.heappush(self.queue, (time, next(self.sequence), callback, args))
+
+    def after(self, delay: int, callback, *args):
+        self.at(self.clock.now() + delay, callback, *args)
+
+    def add_agent(self, agent: Agent, start: int = None):
+        # first wakeup of an agent, now unless a start time is given
+        self.at(self.clock.now() if start is None else start, self._wakeup, agent)
+
+    def _wakeup(self, agent: Agent):
+        delay = agent.wakeup(self.exchange, self.clock.now())
+        if delay is not None:
+            self.after(delay, self._wakeup, agent)
+
+    def submit(self, time: int, qoute: dict):
+        # an order qoute arriving at a virtual time
+        self.at(time, self.exchange.process_order_qoute, qoute)
+
+    def _advance(self, time: int):
+        # good till time orders that expired by the new time leave the books before anything else happens
+        if time > self.clock.now():
+            self.clock.set(time)
+            self.exchange.expire()
+
+    def run(self, until: int = None, max_events: int = None) -> int:
+        # process events in time order up to and including until, returns the number processed
+        # the clock ends at until when every event before it was processed
+        queue = self.queue
+        count = 0
+        while queue and (until is None or queue[0][0] <= until):
+            if max_events is not None and count >= max_events:
+                break
+            time, _, callback, args = heapq.heappop(queue)
+            self._advance(time)
+            callback(*args)
+            count += 1
+        self.processed += count
+        if until is not None and not (queue and queue[0][0] <= until):
+            self._advance(until)
+        return count
+
+    def __repr__(self):
+        return f"Scheduler(time={self.clock.now()}, pending={len(self.queue)}, processed={self.processed})"
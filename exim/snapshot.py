@@ -0,0 +1,363 @@
+from .models import Account, Order, OrderRegistry
+from .market import Market
+from .archive import Retention, STATUSES
+from .tape import TradeTape, SIDES
+from .units import from_units
+from .clock import VirtualClock
+from decimal import Decimal
+import numpy as np
+import itertools
+import heapq
+import gc
+import struct
+import json
+
+MAGIC = b"EXIMSNAP"
+VERSION = 5
+# magic, version and length of the json metadata that precedes the array data
+PREFIX = struct.Struct("<8sHQ")
+ALIGNMENT = 64
+
+ORDER_COLUMNS = (
+    ("id", np.int64),
+    ("time", np.int64),
+    ("owner", np.int64),
+    ("side", np.int8),
+    ("price", np.int64),
+    ("quantity", np.int64),
+    ("initial_quantity", np.int64),
+    ("status", np.int8),
+    ("trade_count", np.int64),
+    ("stop", np.int64),
+    ("expires", np.int64),
+    ("close_time", np.int64),
+)
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _next_value(counter_owner, name: str) -> int:
+    # read the next value of an itertools.count attribute without consuming it
+    value = next(getattr(counter_owner, name))
+    setattr(counter_owner, name, itertools.count(value))
+    return value
+
+
+def _market_arrays(market: Market):
+    # order columns with resting orders first, in queue order per level, then every other order by id
+    resting = []
+    for tree in (market.orderbook.bids, market.orderbook.asks):
+        for queue in tree.tree.values():
+            order = queue.head
+            while order is not None:
+                resting.append(order)
+                order = order.next
+    queued = set(id(order) for order in resting)
+    orders = resting + [order for order in market.orders.values() if id(order) not in queued]
+    arrays = {
+        "id": [order.id for order in orders],
+        "time": [order.time for order in orders],
+        "owner": [order.owner for order in orders],
+        "side": [0 if order.side == "BUY" else 1 for order in orders],
+        "price": [market.to_units(order.price, market.qoute_decimals) for order in orders],
+        "quantity": [market.to_units(order.quantity, market.base_decimals) for order in orders],
+        "initial_quantity": [market.to_units(order.initial_quantity, market.base_decimals) for order in orders],
+        "status": [STATUSES.index(order.status) for order in orders],
+        "trade_count": [len(order.trades) for order in orders],
+        "stop": [market.to_units(order.stop, market.qoute_decimals) for order in orders],
+        "expires": [order.expires or 0 for order in orders],
+        "close_time": [order.close_time or 0 for order in orders],
+    }
+    arrays = {name: np.array(arrays[name], dtype=dtype) for name, dtype in ORDER_COLUMNS}
+    arrays["trade_ids"] = np.fromiter(
+        itertools.chain.from_iterable(order.trades for order in orders), dtype=np.int64
+    )
+    arrays["resting"] = np.array([len(resting)], dtype=np.int64)
+    arrays["closed"] = np.fromiter(market.closed_orders.keys(), dtype=np.int64)
+    for name, _ in TradeTape.columns:
+        arrays[f"tape_{name}"] = market.trades.column(name)
+    return arrays
+
+
+def market_state(market: Market):
+    # spec and arrays of one market, as they are written to a snapshot
+    retention = market.retention
+    archived = (0, 0)
+    if market.archive is not None:
+        archived = (len(market.archive.orders()), len(market.archive.trades()))
+    spec = dict(
+        base=market.base,
+        qoute=market.qoute,
+        next_order_id=_next_value(market, "order_id_counter"),
+        next_trade_id=_next_value(market, "trade_id_counter"),
+        retention=None if retention is None else vars(retention),
+        operations=market.operations,
+        archived=archived,
+    )
+    return spec, _market_arrays(market)
+
+
+def save_snapshot(exchange, path: str):
+    # market states come from the exchange, a sharded exchange gathers them from its shards
+    arrays = dict()
+    account_ids = list(exchange.accounts.keys())
+    arrays["account_ids"] = np.array(account_ids, dtype=np.int64)
+    # balances are written as text so decimals of any precision and unbounded integers survive
+    for field in ("unlocked", "locked"):
+        arrays[f"wallet_{field}"] = np.array(
+            [
+                [
+                    str(getattr(account.wallet[symbol], field)) if symbol in account.wallet else ""
+                    for symbol in exchange.symbols
+                ]
+                for account in exchange.accounts.values()
+            ],
+            dtype=bytes,
+        ).reshape(len(account_ids), len(exchange.symbols))
+    markets = []
+    for spec, market_arrays in exchange._market_states():
+        markets.append(spec)
+        for name, array in market_arrays.items():
+            arrays[f"{spec['base']}{spec['qoute']}/{name}"] = array
+    meta = dict(
+        fixed_point=exchange.fixed_point,
+        # time of a virtual clock, a wall clock has no state to keep
+        clock=exchange.clock.time if isinstance(exchange.clock, VirtualClock) else None,
+        symbols=exchange.symbols,
+        unit_decimals=exchange.unit_decimals,
+        ledger_decimals=exchange.ledger_decimals,
+        names=[account.name for account in exchange.accounts.values()],
+        next_account_id=_next_value(exchange, "account_id_counter"),
+        markets=markets,
+        arrays=dict(),
+    )
+    # array offsets are relative to the aligned end of the metadata
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        meta["arrays"][name] = dict(offset=offset, dtype=array.dtype.str, shape=array.shape)
+        offset = _aligned(offset + array.nbytes)
+    encoded = json.dumps(meta).encode()
+    start = _aligned(PREFIX.size + len(encoded))
+    with open(path, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, len(encoded)))
+        f.write(encoded)
+        for name, array in arrays.items():
+            f.seek(start + meta["arrays"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(start + offset)
+
+
+def read_snapshot(path: str):
+    # metadata of a snapshot and a function returning its arrays by name
+    with open(path, "rb") as f:
+        magic, version, length = PREFIX.unpack(f.read(PREFIX.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a snapshot")
+        meta = json.loads(f.read(length))
+    start = _aligned(PREFIX.size + length)
+
+    def array(name: str):
+        # arrays are memory-mapped straight from the file
+        spec = meta["arrays"][name]
+        if not np.prod(spec["shape"]):
+            return np.empty(spec["shape"], dtype=spec["dtype"])
+        return np.memmap(path, dtype=spec["dtype"], mode="r", offset=start + spec["offset"], shape=tuple(spec["shape"]))
+
+    return meta, array
+
+
+def load_snapshot(cls, path: str):
+    return load_exchange(cls, *read_snapshot(path))
+
+
+def load_exchange(cls, meta: dict, array):
+    # build an exchange of class cls from the metadata and arrays of a snapshot
+    exchange = cls(verbose=False, fixed_point=meta["fixed_point"], clock=load_clock(meta))
+    exchange.symbols = meta["symbols"]
+    for symbol in exchange.symbols:
+        exchange.ledger.add_symbol(symbol)
+    exchange.unit_decimals = meta["unit_decimals"]
+    exchange.ledger_decimals = meta["ledger_decimals"]
+    load_accounts(exchange, meta, array)
+    for spec in meta["markets"]:
+        load_market(exchange, spec, array)
+    if exchange.fixed_point:
+        exchange._update_factors()
+    return exchange
+
+
+def load_clock(meta: dict):
+    return None if meta["clock"] is None else VirtualClock(meta["clock"])
+
+
+def load_accounts(exchange, meta: dict, array):
+    # accounts and balances of a snapshot, balances are in the ledger decimals of the snapshot
+    exchange.account_id_counter = itertools.count(meta["next_account_id"])
+    number = int if exchange.fixed_point else Decimal
+    unlocked, locked = array("wallet_unlocked").tolist(), array("wallet_locked").tolist()
+    for row, (account_id, name) in enumerate(zip(array("account_ids").tolist(), meta["names"])):
+        account = Account(name=name)
+        account.id = account_id
+        exchange._add_account(account)
+        for column, symbol in enumerate(exchange.symbols):
+            if unlocked[row][column]:
+                account.wallet[symbol].unlocked = number(unlocked[row][column].decode())
+                account.wallet[symbol].locked = number(locked[row][column].decode())
+
+
+def load_market(exchange, spec: dict, array) -> Market:
+    # restore a market of a snapshot into exchange, the owners of its orders must be accounts of exchange
+    base, qoute = spec["base"], spec["qoute"]
+    market = Market(
+        base,
+        qoute,
+        base_decimals=exchange.unit_decimals[base],
+        qoute_decimals=exchange.unit_decimals[qoute],
+        fixed_point=exchange.fixed_point,
+        retention=None if spec["retention"] is None else Retention(**spec["retention"]),
+    )
+    market.order_id_counter = itertools.count(spec["next_order_id"])
+    market.trade_id_counter = itertools.count(spec["next_trade_id"])
+    market.operations = spec["operations"]
+    if market.archive is not None:
+        market.archive.truncate(*spec["archived"])
+    exchange.markets[market.symbol] = market
+    for account in exchange.accounts.values():
+        account.orders[market.symbol] = OrderRegistry()
+    # every object made while loading stays alive, so the cycle collector is paused instead of scanning them repeatedly
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        registry = lambda owner: exchange.accounts[owner].orders[market.symbol]
+        _load_market(market, lambda name: array(f"{market.symbol}/{name}"), registry)
+    finally:
+        if collecting:
+            gc.enable()
+    return market
+
+
+def _objects(column, convert):
+    # convert each distinct value of a column once and spread the results over its rows
+    unique, inverse = np.unique(column, return_inverse=True)
+    values = np.empty(len(unique), dtype=object)
+    values[:] = [convert(value) for value in unique.tolist()]
+    return values[inverse]
+
+
+def _groups(rows, keys):
+    # rows split by key as (key, rows) pairs, rows of a key keep their order
+    rows = rows[np.argsort(keys[rows], kind="stable")]
+    keys = keys[rows]
+    starts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    return zip(keys[np.r_[0, starts]].tolist() if len(rows) else [], np.split(rows, starts))
+
+
+def _load_market(market: Market, array, registry):
+    # book, registries and indexes are built from the columns, an order object is made once per row
+    columns = {name: np.asarray(array(name)) for name, _ in ORDER_COLUMNS}
+    ids, owners, sides, statuses = columns["id"], columns["owner"], columns["side"], columns["status"]
+    size = len(ids)
+    resting = int(array("resting")[0])
+    if market.fixed_point:
+        price_of = lambda units: units or None
+        quantity_of = lambda units: units
+    else:
+        price_of = lambda units: from_units(units, market.qoute_decimals) if units else None
+        quantity_of = lambda units: from_units(units, market.base_decimals)
+    prices, stops = _objects(columns["price"], price_of), _objects(columns["stop"], price_of)
+    quantities = _objects(columns["quantity"], quantity_of)
+    initials = _objects(columns["initial_quantity"], quantity_of)
+    expires = columns["expires"].astype(object)
+    expires[columns["expires"] == 0] = None
+    closed = columns["close_time"].astype(object)
+    closed[statuses == STATUSES.index("OPEN")] = None
+    ends = np.cumsum(columns["trade_count"]).tolist()
+    trade_ids = array("trade_ids").tolist()
+    orders = np.empty(size, dtype=object)
+    new = object.__new__
+    records = zip(
+        ids.tolist(),
+        columns["time"].tolist(),
+        owners.tolist(),
+        np.array(SIDES, dtype=object)[sides].tolist(),
+        prices.tolist(),
+        quantities.tolist(),
+        initials.tolist(),
+        np.array(STATUSES, dtype=object)[statuses].tolist(),
+        stops.tolist(),
+        expires.tolist(),
+        closed.tolist(),
+        [0] + ends[:-1],
+        ends,
+    )
+    for row, (id, created, owner, side, price, quantity, initial, status, stop, expiry, close, start, end) in enumerate(
+        records
+    ):
+        order = orders[row] = new(Order)
+        order.__dict__ = {
+            "id": id,
+            "time": created,
+            "owner": owner,
+            "side": side,
+            "_quantity": quantity,
+            "initial_quantity": initial,
+            "price": price,
+            "stop": stop,
+            "expires": expiry,
+            "close_time": close,
+            "status": status,
+            "trades": trade_ids[start:end],
+            "next": None,
+            "prev": None,
+        }
+    # resting rows are in queue order per level, each links to the next row of the same level
+    levels, books = columns["price"][:resting], sides[:resting]
+    linked = np.flatnonzero((levels[1:] == levels[:-1]) & (books[1:] == books[:-1]))
+    for order, after in zip(orders[linked].tolist(), orders[linked + 1].tolist()):
+        order.next, after.prev = after, order
+    by_id = np.argsort(ids, kind="stable")
+    market.orders.update(zip(ids[by_id].tolist(), orders[by_id].tolist()))
+    for side, tree in ((0, market.orderbook.bids), (1, market.orderbook.asks)):
+        rows = np.flatnonzero(sides[:resting] == side)
+        if not len(rows):
+            continue
+        starts = np.r_[0, np.flatnonzero(columns["price"][rows][1:] != columns["price"][rows][:-1]) + 1]
+        volumes = np.add.reduceat(columns["quantity"][rows], starts).tolist()
+        tree.push_levels(
+            zip(
+                prices[rows[starts]].tolist(),
+                orders[rows[starts]].tolist(),
+                orders[rows[np.r_[starts[1:], len(rows)] - 1]].tolist(),
+                map(quantity_of, volumes),
+            )
+        )
+    # open orders with a stop price outside the book are stops that did not trigger yet, in id order
+    for order in orders[resting:][(statuses[resting:] == STATUSES.index("OPEN")) & (columns["stop"][resting:] != 0)]:
+        market.stops.push(order)
+    expiring = orders[:resting][columns["expires"][:resting] != 0]
+    market.expiries = [(order.expires, order.id, order) for order in expiring]
+    heapq.heapify(market.expiries)
+    # registries list open orders by id and closed orders in closing order when it is tracked, by id otherwise
+    opened = by_id[statuses[by_id] == STATUSES.index("OPEN")]
+    if market.retention is None:
+        closing = by_id[statuses[by_id] != STATUSES.index("OPEN")]
+    else:
+        closing = by_id[np.searchsorted(ids[by_id], array("closed"))]
+        market.closed_orders.update(zip(ids[closing].tolist(), orders[closing].tolist()))
+    for owner, rows in _groups(opened, owners):
+        registry(owner).open.update(zip(ids[rows].tolist(), orders[rows].tolist()))
+        for side, rows in _groups(rows, sides):
+            registry(owner).side[SIDES[side]].update(zip(ids[rows].tolist(), orders[rows].tolist()))
+    for owner, rows in _groups(closing, owners):
+        registry(owner).closed.update(zip(ids[rows].tolist(), orders[rows].tolist()))
+        for status, rows in _groups(rows, statuses):
+            registry(owner).status[STATUSES[status]].update(zip(ids[rows].tolist(), orders[rows].tolist()))
+    size = len(array("tape_id"))
+    market.trades = TradeTape(capacity=max(1024, size))
+    for name, _ in TradeTape.columns:
+        market.trades.arrays[name][:size] = array(f"tape_{name}")
+    market.trades.size = size
@@ -0,0 +1,107 @@
+from .events import Event, REJECTED
+from functools import wraps
+import time
+
+
+class Histogram:
+    # log-linear histogram of non-negative integers, values below 2 * 2**sub_bits are counted exactly and
+    # larger ones in buckets of 2**sub_bits per power of two, so a recorded value is off by at most 1 / 2**sub_bits
+    def __init__(self, sub_bits: int = 5):
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.counts = [0] * ((64 - sub_bits) * self.sub_count)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int):
+        shift = value.bit_length() - self.sub_bits - 1
+        if shift < 0:
+            shift = 0
+        self.counts[shift * self.sub_count + (value >> shift)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def _value(self, index: int) -> int:
+        # highest value counted in a bucket
+        shift = max(0, index // self.sub_count - 1)
+        return ((index - shift * self.sub_count + 1) << shift) - 1
+
+    def percentiles(self, *quantiles) -> list:
+        # values at the given quantiles in [0, 1], bucket upper bounds capped by the largest value recorded
+        ranks = [max(1, round(quantile * self.count)) for quantile in quantiles]
+        values = [0] * len(ranks)
+        seen = 0
+        pending = sorted(range(len(ranks)), key=lambda i: ranks[i])
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            seen += count
+            while pending and ranks[pending[0]] <= seen:
+                values[pending.pop(0)] = min(self._value(index), self.max)
+            if not pending:
+                break
+        return values
+
+    def __repr__(self):
+        return f"Histogram(count={self.count}, max={self.max})"
+
+
+class Stats:
+    # counters of exchange events by kind and reason code and latency histograms in nanoseconds per operation
+    # it observes the exchange it is enabled on, latencies are recorded by the methods decorated with timed
+    def __init__(self):
+        self.counters = dict()
+        self.histograms = dict()
+
+    def __call__(self, event: Event):
+        key = f"{event.kind}.{event.code.name}" if event.kind == REJECTED else event.kind
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+    def record(self, operation: str, elapsed: int):
+        histogram = self.histograms.get(operation)
+        if histogram is None:
+            histogram = self.histograms[operation] = Histogram()
+        histogram.record(elapsed)
+
+    def snapshot(self) -> dict:
+        # counters and, per operation, count, mean, percentiles and max latency in microseconds
+        latency = dict()
+        for operation, histogram in sorted(self.histograms.items()):
+            p50, p90, p99, p999 = histogram.percentiles(0.5, 0.9, 0.99, 0.999)
+            latency[operation] = dict(
+                count=histogram.count,
+                mean=histogram.total / histogram.count / 1e3,
+                p50=p50 / 1e3,
+                p90=p90 / 1e3,
+                p99=p99 / 1e3,
+                p999=p999 / 1e3,
+                max=histogram.max / 1e3,
+            )
+        return dict(counters=dict(sorted(self.counters.items())), latency=latency)
+
+    def __repr__(self):
+        return f"Stats(events={sum(self.counters.values())}, operations={len(self.histograms)})"
+
+
+def timed(operation: str = None):
+    # record the latency of a method of an object with a stats attribute, while stats is set
+    def decorate(method):
+        name = operation or method.__name__
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = self.stats
+            if stats is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                stats.record(name, time.perf_counter_ns() - start)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,95 @@
+import numpy as np
+
+SIDES = ("BUY", "SELL")
+
+
+class TradeTape:
+    # growable columnar store of trades, one contiguous numpy array per column
+    columns = (
+        ("id", np.int64),
+        ("time", np.int64),
+        ("price", np.float64),
+        ("quantity", np.float64),
+        ("side", np.int8),
+        ("maker", np.int64),
+        ("taker", np.int64),
+        ("maker_order", np.int64),
+        ("taker_order", np.int64),
+    )
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.capacity = capacity
+        self.arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in self.columns}
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        # reallocate instead of resizing in place so views handed out earlier stay valid
+        self.capacity *= 2
+        for name, dtype in self.columns:
+            array = np.empty(self.capacity, dtype=dtype)
+            array[: self.size] = self.arrays[name][: self.size]
+            self.arrays[name] = array
+
+    def append(
+        self,
+        id: int,
+        time: int,
+        price: float,
+        quantity: float,
+        side: str,
+        maker: int,
+        taker: int,
+        maker_order: int,
+        taker_order: int,
+    ):
+        if self.size == self.capacity:
+            self._grow()
+        i = self.size
+        arrays = self.arrays
+        arrays["id"][i] = id
+        arrays["time"][i] = time
+        arrays["price"][i] = price
+        arrays["quantity"][i] = quantity
+        arrays["side"][i] = 0 if side == "BUY" else 1
+        arrays["maker"][i] = maker
+        arrays["taker"][i] = taker
+        arrays["maker_order"][i] = maker_order
+        arrays["taker_order"][i] = taker_order
+        self.size += 1
+
+    def evict(self, count: int):
+        # remove the oldest count trades and return them as records
+        count = min(count, self.size)
+        records = np.empty(count, dtype=list(self.columns))
+        for name, dtype in self.columns:
+            records[name] = self.arrays[name][:count]
+        # copy the remaining rows to new arrays so views handed out earlier stay valid
+        self.size -= count
+        for name, dtype in self.columns:
+            array = np.empty(self.capacity, dtype=dtype)
+            array[: self.size] = self.arrays[name][count : count + self.size]
+            self.arrays[name] = array
+        return records
+
+    def column(self, name: str, start: int = 0, stop: int = None):
+        # view of a column without copying
+        stop = self.size if stop is None else min(stop, self.size)
+        return self.arrays[name][start:stop]
+
+    def last(self, name: str):
+        return self.arrays[name][self.size - 1] if self.size else None
+
+    def select(self, since: int = None, last_n: int = None):
+        # row range of trades at or after since, limited to the last_n most recent
+        start = 0
+        if since is not None:
+            start = int(np.searchsorted(self.column("time"), since, side="left"))
+        if last_n is not None:
+            start = max(start, self.size - last_n)
+        return start, self.size
+
+    def __repr__(self):
+        return f"TradeTape(size={self.size})"
@@ -0,0 +1,56 @@
+from decimal import Decimal
+import numpy as np
+import math
+
+# floats below this magnitude survive scaling by a power of ten with an error smaller than half a unit
+EXACT_FLOAT_LIMIT = 2**51
+
+
+def to_decimal(value: float, decimals: int) -> Decimal:
+    # round value to the given number of decimals and convert it to decimal
+    return Decimal(str(round(value, decimals)))
+
+
+# integer units are stored in signed 64 bit fields of batches, journals and snapshots
+MAX_UNITS = 2**63 - 1
+
+
+def in_range(value, decimals: int) -> bool:
+    # whether value is a finite number whose units fit the 64 bit fields
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return False
+    return math.isfinite(value) and abs(value) * 10**decimals < MAX_UNITS
+
+
+def in_range_array(values, decimals: int):
+    # vectorized in_range, nan and infinities are out of range
+    values = np.asarray(values, dtype=np.float64)
+    return np.isfinite(values) & (np.abs(values) * 10.0**decimals < MAX_UNITS)
+
+
+def to_units(value: float, decimals: int) -> int:
+    # round value to the given number of decimals and return it as an integer count of units
+    scaled = round(value, decimals) * 10**decimals
+    if isinstance(scaled, float) and abs(scaled) >= EXACT_FLOAT_LIMIT:
+        return int(to_decimal(value, decimals).scaleb(decimals))
+    return round(scaled)
+
+
+def from_units(value: int, decimals: int) -> Decimal:
+    # convert an integer count of units back to decimal
+    return Decimal(value).scaleb(-decimals)
+
+
+def to_units_array(values, decimals: int):
+    # vectorized to_units, values too close to a rounding tie are rounded one by one to stay exact
+    values = np.asarray(values, dtype=np.float64)
+    scaled = values * 10.0**decimals
+    units = np.rint(scaled)
+    tolerance = np.abs(scaled) * 2.0**-50 + 1e-9
+    suspect = (np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) <= tolerance) | (np.abs(scaled) >= EXACT_FLOAT_LIMIT)
+    units = units.astype(np.int64)
+    for i in np.flatnonzero(suspect):
+        units[i] = to_units(float(values[i]), decimals)
+    return units
@@ -20,5 +20,5 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     python_requires=">=3.7",
-    install_requires=["sortedcontainers >= 2", "pandas"],
+    install_requires=["sortedcontainers >= 2", "numpy", "pandas"],
 )
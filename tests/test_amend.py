@@ -0,0 +1,70 @@
+from exim import Exchange, VirtualClock
+import pytest
+
+
+def _exchange(fixed_point):
+    exchange = Exchange(verbose=False, fixed_point=fixed_point, clock=VirtualClock(10))
+    exchange.register_symbol("BTC", 4)
+    exchange.register_symbol("USD", 2)
+    exchange.register_market("BTC", "USD")
+    for i in range(3):
+        exchange.register_account(f"a{i}")
+        exchange.deposit(i, "BTC", 100)
+        exchange.deposit(i, "USD", 1000)
+    return exchange
+
+
+def _queue(market, price):
+    # ids and remaining quantities of the bids at a price in queue order
+    queue, order = [], market.orderbook.bids.tree[market.price_units(price)].head
+    while order is not None:
+        queue.append((order.id, float(market.quantity_value(order.quantity))))
+        order = order.next
+    return queue
+
+
+@pytest.mark.parametrize("fixed_point", [False, True])
+def test_reduction_keeps_priority_and_a_price_change_requeues(fixed_point):
+    exchange = _exchange(fixed_point)
+    market = exchange.markets["BTCUSD"]
+    for account_id in range(3):
+        exchange.buy(account_id, "BTCUSD", 2, 100)
+    # a smaller quantity at the same price stays in place and releases funds
+    assert exchange.amend(0, "BTCUSD", 0, quantity=1)
+    assert _queue(market, 100) == [(0, 1.0), (1, 2.0), (2, 2.0)]
+    assert float(exchange.get_wallet(0).loc["USD", "available"]) == 900
+    # a larger quantity goes to the back of the queue
+    assert exchange.amend(1, "BTCUSD", 1, quantity=3)
+    assert _queue(market, 100) == [(0, 1.0), (2, 2.0), (1, 3.0)]
+    # so does a price change, even back to the same price
+    assert exchange.amend(0, "BTCUSD", 0, price=99)
+    assert exchange.amend(0, "BTCUSD", 0, price=100)
+    assert _queue(market, 100) == [(2, 2.0), (1, 3.0), (0, 1.0)]
+    assert market.orderbook.bids.volume == sum(market.orderbook.bids.depth.values())
+    exchange.sell(2, "BTCUSD", 4)
+    trades = exchange.get_trades("BTCUSD")
+    assert trades["maker"].tolist() == [2, 1] and trades["quantity"].astype(float).tolist() == [2, 2]
+
+
+@pytest.mark.parametrize("fixed_point", [False, True])
+def test_amend_that_crosses_trades(fixed_point):
+    exchange = _exchange(fixed_point)
+    exchange.buy(1, "BTCUSD", 3, 100)
+    exchange.sell(2, "BTCUSD", 1, 150)
+    # 600 a lot would need more than the wallet holds
+    assert not exchange.amend(1, "BTCUSD", 0, price=600)
+    assert exchange.amend(1, "BTCUSD", 0, price=160)
+    wallet = exchange.get_wallet(1)
+    assert float(wallet.loc["USD", "total"]) == 850 and float(wallet.loc["USD", "available"]) == 850 - 320
+    assert exchange.get_trades("BTCUSD")["price"].astype(float).tolist() == [150]
+    assert not exchange.amend(2, "BTCUSD", 1, quantity=1)
+    assert not exchange.amend(2, "BTCUSD", 0, quantity=1)
+
+
+def test_non_finite_values_are_rejected():
+    exchange = _exchange(False)
+    exchange.buy(0, "BTCUSD", 1, 100)
+    for value in (float("nan"), float("inf"), 1e30):
+        assert not exchange.amend(0, "BTCUSD", 0, quantity=value)
+        assert not exchange.amend(0, "BTCUSD", 0, price=value)
+    assert exchange.get_orders(0, "BTCUSD")["price"].astype(float).tolist() == [100]
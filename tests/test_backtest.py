@@ -0,0 +1,92 @@
+from exim import Exchange, VirtualClock
+from exim.backtest import Replay, read_messages, write_messages
+from exim.sharding import ShardedExchange
+import pandas as pd
+import random
+import pytest
+
+
+def _messages(count=600, seed=5):
+    rng = random.Random(seed)
+    rows, resting = [], []
+    for i in range(count):
+        if resting and rng.random() < 0.2:
+            order_id = resting.pop(rng.randrange(len(resting)))
+            rows.append((1000 * i, "CANCEL", order_id, -1, "", 0.0, 0.0))
+            continue
+        side = rng.choice(("BUY", "SELL"))
+        price = 0.0 if rng.random() < 0.05 else round(rng.uniform(95, 105), 2)
+        rows.append((1000 * i, "NEW", 10 + i, -1, side, round(rng.uniform(0.1, 2), 3), price))
+        resting.append(10 + i)
+    # a message with an unknown action and one canceling an unknown order
+    rows.append((1000 * count, "AMEND", 1, -1, "BUY", 1.0, 100.0))
+    rows.append((1000 * count, "CANCEL", 1, -1, "", 0.0, 0.0))
+    return pd.DataFrame(rows, columns=["time", "action", "order_id", "account_id", "side", "quantity", "price"])
+
+
+def _replay(source, chunksize):
+    exchange = Exchange(verbose=False, clock=VirtualClock())
+    exchange.register_symbol("BTC", 8)
+    exchange.register_symbol("USD", 2)
+    exchange.register_market("BTC", "USD")
+    replay = Replay(exchange, "BTCUSD", depth=5)
+    chunks = list(replay.run(source, chunksize=chunksize))
+    return exchange, replay, chunks
+
+
+def test_csv_and_binary_replays_agree(tmp_path):
+    messages = _messages()
+    csv, binary = str(tmp_path / "flow.csv"), str(tmp_path / "flow.bin")
+    messages.to_csv(csv, index=False)
+    assert write_messages(binary, read_messages(csv, chunksize=64)) == len(messages)
+    whole = _replay(csv, chunksize=10**6)
+    for source, chunksize in ((csv, 37), (binary, 37), (binary, 10**6)):
+        exchange, replay, chunks = _replay(source, chunksize)
+        assert len(chunks) == -(-len(messages) // chunksize)
+        assert sum(chunk.messages for chunk in chunks) == len(messages)
+        assert sum(chunk.rejected for chunk in chunks) == sum(chunk.rejected for chunk in whole[2]) >= 2
+        trades = pd.concat([chunk.trades for chunk in chunks])
+        assert trades.equals(whole[2][0].trades)
+        assert chunks[-1].book.equals(whole[2][-1].book)
+        assert sorted(replay.orders) == sorted(whole[1].orders)
+        assert exchange.clock.now() == messages["time"].iloc[-1]
+
+
+def test_trades_carry_external_order_ids():
+    _, replay, (chunk,) = _replay([_messages(200)], chunksize=None)
+    messages = _messages(200)
+    new = set(messages.loc[messages["action"] == "NEW", "order_id"])
+    trades = chunk.trades
+    assert len(trades) and set(trades["maker_order"]) <= new and set(trades["taker_order"]) <= new
+    # trades cross at or inside the limit of their taker, side is the side of the maker
+    limits = messages[messages["action"] == "NEW"].set_index("order_id")["price"]
+    for side, taker, price in zip(trades["side"], trades["taker_order"], trades["price"]):
+        limit = limits[taker]
+        assert not limit or (price >= limit if side == "BUY" else price <= limit)
+    assert set(replay.orders) <= new
+
+
+def test_non_finite_messages_are_rejected():
+    inf = float("inf")
+    messages = pd.DataFrame(
+        dict(
+            time=[1, 2, 3, 4, 5],
+            action=["NEW"] * 5,
+            order_id=[1, 2, 3, 4, 5],
+            side=["SELL", "SELL", "SELL", "SELL", "BUY"],
+            quantity=[inf, 1e30, 1.0, 1.0, 1.0],
+            price=[100, 100, inf, 100, float("nan")],
+        )
+    )
+    _, replay, (chunk,) = _replay([messages], chunksize=None)
+    # a missing price is a market order
+    assert chunk.rejected == 3 and chunk.trades["maker_order"].tolist() == [4] and not replay.orders
+
+
+def test_sharded_exchanges_are_rejected():
+    with ShardedExchange(shards=1, verbose=False) as sharded:
+        sharded.register_symbol("BTC", 8)
+        sharded.register_symbol("USD", 2)
+        sharded.register_market("BTC", "USD")
+        with pytest.raises(TypeError):
+            Replay(sharded, "BTCUSD")
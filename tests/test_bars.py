@@ -0,0 +1,96 @@
+from exim import Exchange
+from exim.bars import BarSeries, RollingVWAP
+import numpy as np
+import random
+import pytest
+
+
+def _trades(seed: int, count: int = 2000):
+    # increasing times with gaps longer than an interval now and then
+    rng = random.Random(seed)
+    time = 0
+    trades = []
+    for _ in range(count):
+        time += rng.choice([rng.randrange(1, 10**8), rng.randrange(10**9, 5 * 10**9)])
+        trades.append((time, 100 + rng.randrange(-500, 500) / 100, rng.randrange(1, 1000) / 100))
+    return trades
+
+
+def _expected(trades, interval: int) -> dict:
+    # ohlcv of every interval with trades, computed from scratch
+    bars = dict()
+    for time, price, quantity in trades:
+        start = time - time % interval
+        if start not in bars:
+            bars[start] = [price, price, price, price, 0.0, 0.0, 0]
+        bar = bars[start]
+        bar[1] = max(bar[1], price)
+        bar[2] = min(bar[2], price)
+        bar[3] = price
+        bar[4] += quantity
+        bar[5] += price * quantity
+        bar[6] += 1
+    return bars
+
+
+@pytest.mark.parametrize("capacity", [1, 7, 4096])
+def test_bar_series_matches_a_full_aggregation(capacity):
+    trades = _trades(seed=1)
+    interval = 10**9
+    series = BarSeries(interval, capacity)
+    for trade in trades:
+        series.update(*trade)
+    expected = _expected(trades, interval)
+    columns = series.last()
+    assert len(series) == min(len(expected), capacity + 1)
+    starts = sorted(expected)[-len(series) :]
+    assert columns["time"].tolist() == starts
+    for i, start in enumerate(starts):
+        open_, high, low, close, volume, notional, count = expected[start]
+        assert (columns["open"][i], columns["high"][i], columns["low"][i], columns["close"][i]) == (open_, high, low, close)
+        assert columns["volume"][i] == pytest.approx(volume)
+        assert columns["notional"][i] == pytest.approx(notional)
+        assert columns["trades"][i] == count
+    assert series.last(3)["time"].tolist() == starts[-3:]
+
+
+def test_rolling_vwap_matches_the_window():
+    trades = _trades(seed=2)
+    window = 3 * 10**9
+    vwap = RollingVWAP(window)
+    for i, (time, price, quantity) in enumerate(trades):
+        vwap.update(time, price, quantity)
+        if i % 50:
+            continue
+        inside = [(p, q) for t, p, q in trades[: i + 1] if t > time - window]
+        volume, value = vwap.value()
+        assert volume == pytest.approx(sum(q for _, q in inside))
+        assert value == pytest.approx(sum(p * q for p, q in inside) / sum(q for _, q in inside))
+    assert vwap.value(trades[-1][0] + window) == (0.0, None)
+
+
+def test_exchange_bars_follow_its_trades():
+    exchange = Exchange(verbose=False)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    exchange.register_market(base="btc", qoute="usd")
+    for i in range(2):
+        exchange.register_account(name=f"a{i}")
+        exchange.deposit(i, "usd", 10**6)
+        exchange.deposit(i, "btc", 10**3)
+    assert exchange.track_bars("BTCUSD", intervals=(10**6,), capacity=10**4, windows=(10**12,))
+    rng = random.Random(3)
+    for _ in range(300):
+        exchange.sell(0, "BTCUSD", 1, rng.randrange(9900, 10100) / 100)
+        exchange.buy(1, "BTCUSD", rng.randrange(1, 1000) / 1000)
+    trades = exchange.get_trades("BTCUSD")
+    expected = _expected(zip(trades["time"], trades["price"], trades["quantity"]), 10**6)
+    bars = exchange.get_bars("BTCUSD", 10**6)
+    assert bars.index.tolist() == sorted(expected)
+    assert bars["trades"].sum() == len(trades)
+    assert bars["vwap"].to_numpy() == pytest.approx([bar[5] / bar[4] for _, bar in sorted(expected.items())])
+    volume, vwap = exchange.get_vwap("BTCUSD", 10**12)
+    assert volume == pytest.approx(trades["quantity"].sum())
+    assert vwap == pytest.approx(np.dot(trades["price"], trades["quantity"]) / trades["quantity"].sum())
+    assert exchange.get_bars("BTCUSD", 10**9) is None
+    assert exchange.get_vwap("BTCUSD", 1) is None
@@ -0,0 +1,123 @@
+from exim import Exchange
+from exim.codes import Code
+import pandas as pd
+import random
+import pytest
+
+
+def _exchange(fixed_point: bool = False):
+    exchange = Exchange(verbose=False, fixed_point=fixed_point)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    exchange.register_market(base="btc", qoute="usd")
+    for i in range(3):
+        exchange.register_account(name=f"a{i}")
+        exchange.deposit(i, "usd", 10**5)
+        exchange.deposit(i, "btc", 100)
+    return exchange
+
+
+def _qoutes(seed: int, count: int):
+    # limit and market orders around 100 and cancels of earlier order ids
+    rng = random.Random(seed)
+    qoutes = []
+    for i in range(count):
+        account_id = rng.randrange(3)
+        if i > 1 and rng.random() < 0.15:
+            qoutes.append(dict(account_id=account_id, market="BTCUSD", order_id=rng.randrange(1, i)))
+            continue
+        side = rng.choice(["BUY", "sell"])
+        price = None if rng.random() < 0.2 else rng.randrange(9500, 10500) / 100
+        qoutes.append(dict(account_id=account_id, market="BTCUSD", side=side, quantity=rng.randrange(1, 3000) / 1000, price=price))
+    return qoutes
+
+
+def _state(exchange) -> tuple:
+    tape = exchange.markets["BTCUSD"].trades
+    trades = [tape.column(name).tolist() for name in ("id", "price", "quantity", "side", "maker", "taker")]
+    wallets = [exchange.get_wallet(i).to_dict() for i in exchange.accounts]
+    orders = [exchange.get_orders(i, "BTCUSD").drop(columns="time").to_dict() for i in exchange.accounts]
+    return trades, wallets, orders
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+@pytest.mark.parametrize("form", ["qoutes", "frame", "arrays"])
+def test_batch_matches_qoute_loop(fixed_point, form):
+    qoutes = _qoutes(seed=1, count=400)
+    looped = _exchange(fixed_point)
+    for qoute in qoutes:
+        looped.process_order_qoute(qoute)
+    batched = _exchange(fixed_point)
+    for start in range(0, len(qoutes), 50):
+        chunk = qoutes[start : start + 50]
+        if form == "frame":
+            chunk = pd.DataFrame(chunk)
+        elif form == "arrays":
+            chunk = {name: [qoute.get(name) for qoute in chunk] for name in pd.DataFrame(chunk).columns}
+        codes, order_ids = batched.process_orders(chunk)
+        assert len(codes) == len(order_ids) == 50
+    assert _state(batched) == _state(looped)
+
+
+def test_codes_and_order_ids():
+    exchange = _exchange()
+    codes, order_ids = exchange.process_orders(
+        [
+            dict(account_id=0, market="BTCUSD", side="SELL", quantity=1, price=100),
+            dict(account_id=9, market="BTCUSD", side="BUY", quantity=1, price=100),
+            dict(account_id=1, market="ETHUSD", side="BUY", quantity=1, price=100),
+            dict(account_id=1, market="BTCUSD", side="HOLD", quantity=1, price=100),
+            dict(account_id=1, market="BTCUSD", side="BUY", quantity=0, price=100),
+            dict(account_id=1, market="BTCUSD", side="BUY", quantity=1, price=-5),
+            dict(account_id=1, market="BTCUSD", side="BUY", quantity=10**4, price=100),
+            dict(account_id=1, market="BTCUSD", side="BUY", quantity=0.4),
+            dict(account_id=1, market="BTCUSD", order_id=42),
+            dict(account_id=0, market="BTCUSD", order_id=1),
+            dict(account_id=2, market="BTCUSD", side="BUY", quantity=0.2, price=99),
+        ]
+    )
+    assert codes.tolist() == [
+        Code.OK,
+        Code.INVALID_ACCOUNT,
+        Code.INVALID_MARKET,
+        Code.INVALID_SIDE,
+        Code.INVALID_QUANTITY,
+        Code.INVALID_PRICE,
+        Code.NOT_ENOUGH_BALANCE,
+        Code.OK,
+        Code.ORDER_NOT_FOUND,
+        Code.ORDER_NOT_FOUND,
+        Code.OK,
+    ]
+    assert order_ids.tolist() == [0, -1, -1, -1, -1, -1, -1, 1, 42, 1, 2]
+    assert exchange.get_orders(0, "BTCUSD").loc[0, "status"] == "OPEN"
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_non_finite_and_huge_values_are_rejected(fixed_point):
+    exchange = _exchange(fixed_point)
+    inf, nan = float("inf"), float("nan")
+    codes, order_ids = exchange.process_orders(
+        dict(
+            account_id=[0] * 7,
+            market=["BTCUSD"] * 7,
+            side=["SELL"] * 7,
+            quantity=[inf, nan, 1e30, 1.0, 1.0, 1.0, -inf],
+            price=[100, 100, 100, inf, 1e30, 100, 100],
+        )
+    )
+    assert codes.tolist() == [Code.INVALID_QUANTITY] * 3 + [Code.INVALID_PRICE] * 2 + [Code.OK, Code.INVALID_QUANTITY]
+    assert order_ids.tolist() == [-1] * 5 + [0, -1]
+    assert not any(exchange.buy(0, "BTCUSD", 1.0, price) for price in (nan, inf, 1e30))
+    assert not exchange.buy(0, "BTCUSD", nan, 100)
+
+
+def test_order_id_0_is_a_cancel_in_both_paths():
+    cancel = dict(account_id=0, market="BTCUSD", order_id=0)
+    looped, batched = _exchange(), _exchange()
+    for exchange in (looped, batched):
+        exchange.sell(0, "BTCUSD", 1, 100)
+    looped.process_order_qoute(cancel)
+    codes, order_ids = batched.process_orders([cancel])
+    assert codes.tolist() == [Code.OK] and order_ids.tolist() == [0]
+    assert looped.get_orders(0, "BTCUSD").loc[0, "status"] == batched.get_orders(0, "BTCUSD").loc[0, "status"] == "CANCELED"
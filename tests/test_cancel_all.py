@@ -0,0 +1,72 @@
+from exim import Exchange, VirtualClock
+from exim.codes import Code
+import random
+import pytest
+
+
+def _exchange(fixed_point):
+    exchange = Exchange(verbose=False, fixed_point=fixed_point, clock=VirtualClock(10))
+    for symbol, decimals in (("BTC", 4), ("USD", 2), ("ETH", 3)):
+        exchange.register_symbol(symbol, decimals)
+    exchange.register_market("BTC", "USD")
+    exchange.register_market("ETH", "USD")
+    for i in range(2):
+        exchange.register_account(f"a{i}")
+        for symbol in ("BTC", "USD", "ETH"):
+            exchange.deposit(i, symbol, 10**6)
+    rng = random.Random(1)
+    for _ in range(400):
+        market, account_id = rng.choice(["BTCUSD", "ETHUSD"]), rng.randrange(2)
+        quantity = round(rng.uniform(0.1, 2), 3)
+        if rng.random() < 0.5:
+            exchange.buy(account_id, market, quantity, round(rng.uniform(90, 100), 2))
+        else:
+            exchange.sell(account_id, market, quantity, round(rng.uniform(100.5, 110), 2))
+    return exchange
+
+
+def _cancel_each(exchange, account_id, markets=("BTCUSD", "ETHUSD"), side=None, low=None, high=None):
+    # the same cancels one order at a time
+    count = 0
+    for market in markets:
+        orders = exchange.get_orders(account_id, market, "OPEN")
+        for order_id, order in orders.iterrows():
+            price = float(order["price"])
+            if (side is None or order["side"] == side) and (low is None or price >= low) and (high is None or price <= high):
+                exchange.cancel(account_id, market, order_id)
+                count += 1
+    return count
+
+
+def _state(exchange):
+    orders = [exchange.get_orders(a, m)["status"].tolist() for a in range(2) for m in ("BTCUSD", "ETHUSD")]
+    wallets = [exchange.get_wallet(a).astype(float).values.tolist() for a in range(2)]
+    books = [
+        sorted(tree.depth.items())
+        for m in ("BTCUSD", "ETHUSD")
+        for tree in (exchange.markets[m].orderbook.bids, exchange.markets[m].orderbook.asks)
+    ]
+    return orders, wallets, books
+
+
+@pytest.mark.parametrize("fixed_point", [False, True])
+def test_matches_single_cancels(fixed_point):
+    exchange, reference = _exchange(fixed_point), _exchange(fixed_point)
+    code, count = exchange.cancel_all(0, "BTCUSD", side="BUY", price_range=(92, None))
+    assert code == Code.OK and count == _cancel_each(reference, 0, ("BTCUSD",), "BUY", 92) > 0
+    assert _state(exchange) == _state(reference)
+    code, count = exchange.cancel_all(1, price_range=(95, 105))
+    assert code == Code.OK and count == _cancel_each(reference, 1, low=95, high=105) > 0
+    assert _state(exchange) == _state(reference)
+    assert exchange.cancel_all(0) == (Code.OK, _cancel_each(reference, 0))
+    assert _state(exchange) == _state(reference)
+    assert exchange.cancel_all(0) == (Code.OK, 0)
+    for tree in (exchange.markets["BTCUSD"].orderbook.bids, exchange.markets["BTCUSD"].orderbook.asks):
+        assert tree.volume == sum(tree.depth.values()) and set(tree.depth) == set(tree.tree)
+
+
+def test_invalid_arguments():
+    exchange = _exchange(False)
+    assert exchange.cancel_all(7) == (Code.INVALID_ACCOUNT, 0)
+    assert exchange.cancel_all(0, "XYZ") == (Code.INVALID_MARKET, 0)
+    assert exchange.cancel_all(0, side="X") == (Code.INVALID_SIDE, 0)
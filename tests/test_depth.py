@@ -0,0 +1,64 @@
+from exim import Exchange
+from decimal import Decimal
+import random
+import pytest
+
+
+def _book(fixed_point: bool, seed: int):
+    # resting bids below 100 and asks above it, several orders per level
+    exchange = Exchange(verbose=False, fixed_point=fixed_point)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    exchange.register_market(base="btc", qoute="usd")
+    for name in ("maker", "taker"):
+        exchange.register_account(name=name)
+    for account_id in (0, 1):
+        exchange.deposit(account_id, "usd", 10**6)
+        exchange.deposit(account_id, "btc", 10**4)
+    rng = random.Random(seed)
+    for i in range(300):
+        quantity = rng.randrange(1, 5000) / 1000
+        if i % 10 == 9:
+            # takers partially consume the top levels, the index follows the fills
+            exchange.buy(1, "BTCUSD", quantity) if rng.random() < 0.5 else exchange.sell(1, "BTCUSD", quantity)
+        elif i % 10 == 8:
+            exchange.cancel(0, "BTCUSD", rng.randrange(i))
+        elif rng.random() < 0.5:
+            exchange.buy(0, "BTCUSD", quantity, rng.randrange(9000, 9990) / 100)
+        else:
+            exchange.sell(0, "BTCUSD", quantity, rng.randrange(10010, 11000) / 100)
+    return exchange.markets["BTCUSD"]
+
+
+def _swept(levels, quantity: Decimal, limit: Decimal, better):
+    # cost of taking quantity level by level, the part beyond the limit is valued at the limit
+    cost = Decimal(0)
+    for price, volume in levels:
+        if limit is not None and not better(price, limit):
+            break
+        taken = min(volume, quantity)
+        cost += taken * price
+        quantity -= taken
+        if not quantity:
+            return cost
+    if limit is None:
+        return None
+    return cost + quantity * limit
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_cost_to_fill_matches_a_level_walk(fixed_point):
+    market = _book(fixed_point, seed=1)
+    book = market.orderbook
+    asks = [(market.price_value(price), market.quantity_value(volume)) for price, volume in book.asks.depth.items()]
+    bids = [(market.price_value(price), market.quantity_value(volume)) for price, volume in reversed(book.bids.depth.items())]
+    rng = random.Random(2)
+    for _ in range(300):
+        quantity = Decimal(rng.randrange(1, 400000)) / 1000
+        buy_limit = rng.choice([None, Decimal(rng.randrange(10000, 11100)) / 100])
+        sell_limit = rng.choice([None, Decimal(rng.randrange(8900, 10000)) / 100])
+        expected = _swept(asks, quantity, buy_limit, lambda price, limit: price <= limit)
+        assert market.cost_to_fill("BUY", quantity, buy_limit) == expected
+        expected = _swept(bids, quantity, sell_limit, lambda price, limit: price >= limit)
+        assert market.cost_to_fill("SELL", quantity, sell_limit) == expected
+
@@ -0,0 +1,105 @@
+from exim import Exchange
+from exim.codes import Code
+from exim.events import Observer
+from exim.stats import Histogram
+import random
+
+
+class Recorder(Observer):
+    def __init__(self):
+        self.events = []
+        self.fills = []
+
+    def __call__(self, event):
+        self.events.append(event)
+        super().__call__(event)
+
+    def on_filled(self, event):
+        self.fills.append(event)
+
+
+def _exchange(**kwargs):
+    exchange = Exchange(verbose=False, **kwargs)
+    exchange.register_symbol("BTC", 8)
+    exchange.register_symbol("USD", 2)
+    exchange.register_market("BTC", "USD")
+    return exchange
+
+
+def test_observer_events():
+    exchange = _exchange()
+    recorder = Recorder()
+    exchange.add_observer(recorder)
+    exchange.register_account("maker")
+    exchange.register_account("taker")
+    maker, taker = 0, 1
+    exchange.deposit(maker, "BTC", 2)
+    exchange.deposit(taker, "USD", 1000)
+    exchange.sell(maker, "BTCUSD", 1, 100)
+    exchange.sell(maker, "BTCUSD", 1, 101)
+    exchange.buy(taker, "BTCUSD", 1, 100)
+    exchange.cancel(maker, "BTCUSD", 1)
+    exchange.buy(taker, "BTCUSD", 100, 101)
+    kinds = [event.kind for event in recorder.events]
+    assert kinds == ["REGISTERED"] * 2 + ["DEPOSITED"] * 2 + ["ACCEPTED"] * 2 + ["FILLED"] * 2 + ["ACCEPTED", "CANCELED", "REJECTED"]
+    assert all(event.code == Code.OK for event in recorder.events[:-1])
+    assert recorder.events[-1].code == Code.NOT_ENOUGH_BALANCE
+    # each trade is reported for its maker and its taker
+    maker_fill, taker_fill = recorder.fills
+    assert (maker_fill.account_id, maker_fill.order_id, maker_fill.side, maker_fill.liquidity) == (maker, 0, "SELL", "MAKER")
+    assert (taker_fill.account_id, taker_fill.order_id, taker_fill.side, taker_fill.liquidity) == (taker, 2, "BUY", "TAKER")
+    assert maker_fill.trade_id == taker_fill.trade_id and maker_fill.price == 100 and maker_fill.quantity == 1
+    exchange.remove_observer(recorder)
+    exchange.deposit(maker, "BTC", 1)
+    assert len(recorder.events) == 11
+
+
+def test_verbose_prints_messages(capsys):
+    exchange = _exchange()
+    exchange.verbose = True
+    exchange.register_account("a")
+    account = 0
+    exchange.deposit(account, "BTC", 1)
+    exchange.withdraw(account, "BTC", 2)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "Account registered with id: 0" and lines[1] == "Deposit successful"
+    assert lines[2].startswith("Withdraw failed")
+    exchange.verbose = False
+    exchange.deposit(account, "BTC", 1)
+    assert capsys.readouterr().out == ""
+
+
+def test_stats():
+    exchange = _exchange()
+    exchange.register_account("a")
+    account = 0
+    # nothing is timed nor counted before stats are enabled
+    exchange.deposit(account, "USD", 1000)
+    assert exchange.get_stats() is None
+    exchange.enable_stats()
+    for _ in range(3):
+        exchange.buy(account, "BTCUSD", 1, 100)
+    exchange.buy(account, "BTCUSD", 100, 100)
+    exchange.buy(account, "BTCUSD", 1, -1)
+    stats = exchange.get_stats()
+    assert stats["counters"] == {"ACCEPTED": 3, "REJECTED.INVALID_PRICE": 1, "REJECTED.NOT_ENOUGH_BALANCE": 1}
+    buy = stats["latency"]["buy"]
+    assert buy["count"] == 5 and "deposit" not in stats["latency"]
+    assert 0 < buy["p50"] <= buy["p99"] <= buy["max"]
+    exchange.disable_stats()
+    exchange.deposit(account, "USD", 1)
+    assert exchange.stats is None and all(market.stats is None for market in exchange.markets.values())
+
+
+def test_histogram_percentiles():
+    generator = random.Random(3)
+    values = [int(generator.lognormvariate(10, 2)) for _ in range(20000)]
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+    values.sort()
+    quantiles = [0.01, 0.5, 0.9, 0.99, 0.999, 1.0]
+    for quantile, estimate in zip(quantiles, histogram.percentiles(*quantiles)):
+        exact = values[max(1, round(quantile * len(values))) - 1]
+        assert exact <= estimate <= exact + exact / 32
+    assert histogram.count == len(values) and histogram.max == values[-1]
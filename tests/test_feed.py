@@ -0,0 +1,101 @@
+from exim import Exchange
+from exim.feed import ADD, REMOVE, EXECUTE, LEVEL, TOP, SNAPSHOT
+import random
+
+
+def _exchange():
+    exchange = Exchange(verbose=False)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    exchange.register_market(base="btc", qoute="usd")
+    for i in range(3):
+        exchange.register_account(name=f"a{i}")
+        exchange.deposit(i, "usd", 10**6)
+        exchange.deposit(i, "btc", 10**3)
+    return exchange
+
+
+def _trade(exchange, seed: int, count: int = 500):
+    rng = random.Random(seed)
+    for _ in range(count):
+        account_id = rng.randrange(3)
+        if rng.random() < 0.2:
+            open_orders = list(exchange.accounts[account_id].orders["BTCUSD"].open)
+            if open_orders:
+                exchange.cancel(account_id, "BTCUSD", rng.choice(open_orders))
+            continue
+        quantity = rng.randrange(1, 3000) / 1000
+        price = None if rng.random() < 0.1 else rng.randrange(9900, 10100) / 100
+        (exchange.buy if rng.random() < 0.5 else exchange.sell)(account_id, "BTCUSD", quantity, price)
+
+
+def test_level2_events_rebuild_the_book():
+    exchange = _exchange()
+    _trade(exchange, seed=1, count=100)
+    events = []
+    exchange.subscribe("BTCUSD", events.append, level=2)
+    _trade(exchange, seed=2)
+    assert events[0].kind == SNAPSHOT
+    levels = {side: dict(levels) for side, levels in events[0].book.items()}
+    tops = dict()
+    sequence = events[0].sequence
+    for event in events[1:]:
+        assert event.sequence == sequence + 1
+        sequence = event.sequence
+        if event.kind == LEVEL:
+            if event.quantity:
+                levels[event.side][event.price] = event.quantity
+            else:
+                levels[event.side].pop(event.price)
+        else:
+            assert event.kind == TOP
+            tops[event.side] = (event.price, event.quantity)
+    book = exchange.get_orderbook("BTCUSD")
+    for side, kind in (("BUY", "BID"), ("SELL", "ASK")):
+        rows = book[book["type"] == kind]
+        assert sorted(levels[side].items()) == sorted(zip(rows.index, rows["volume"]))
+    assert tops["BUY"] == (exchange.markets["BTCUSD"].best_bid, levels["BUY"][exchange.markets["BTCUSD"].best_bid])
+    assert tops["SELL"][0] == exchange.markets["BTCUSD"].best_ask
+
+
+def test_level3_events_rebuild_the_queues():
+    exchange = _exchange()
+    _trade(exchange, seed=3, count=100)
+    events = []
+    exchange.subscribe("BTCUSD", events.append, level=3)
+    _trade(exchange, seed=4)
+    orders = {side: {order_id: (price, quantity) for order_id, price, quantity in book} for side, book in events[0].book.items()}
+    kinds = set()
+    for event in events[1:]:
+        kinds.add(event.kind)
+        if event.kind == ADD:
+            orders[event.side][event.order_id] = (event.price, event.quantity)
+        elif event.kind == REMOVE:
+            orders[event.side].pop(event.order_id)
+        elif event.kind == EXECUTE:
+            if event.remaining:
+                orders[event.side][event.order_id] = (event.price, event.remaining)
+            else:
+                orders[event.side].pop(event.order_id)
+    assert kinds == {ADD, REMOVE, EXECUTE, TOP}
+    snapshot = exchange.markets["BTCUSD"].feed.snapshot(3)
+    # dicts keep insertion order, so queue order within a level is compared too
+    for side, book in snapshot.book.items():
+        rebuilt = sorted(orders[side].items(), key=lambda item: item[1][0], reverse=side == "BUY")
+        assert [(order_id, price, quantity) for order_id, (price, quantity) in rebuilt] == book
+
+
+def test_periodic_snapshots_and_unsubscribe():
+    exchange = _exchange()
+    events = []
+    exchange.subscribe("BTCUSD", events.append, level=2, snapshot_interval=5)
+    _trade(exchange, seed=5, count=50)
+    kinds = [event.kind for event in events]
+    assert kinds[0] == SNAPSHOT
+    between = [len(run) for run in "".join("S" if kind == SNAPSHOT else "." for kind in kinds[1:]).split("S")[:-1]]
+    assert between and all(count == 5 for count in between)
+    count = len(events)
+    exchange.unsubscribe("BTCUSD", events.append)
+    _trade(exchange, seed=6, count=50)
+    assert len(events) == count
+    assert not exchange.subscribe("XYZ", events.append)
@@ -0,0 +1,193 @@
+from exim import Exchange
+from exim.codes import Code
+from exim.gateway import (
+    Gateway,
+    GatewayClient,
+    HEADER,
+    NEW,
+    CANCEL,
+    LOGIN,
+    ACK,
+    FILL,
+    decode,
+    encode_new,
+    encode_cancel,
+    encode_login,
+)
+import asyncio
+import math
+import pytest
+
+
+def _payload(frame: bytes):
+    length, kind = HEADER.unpack_from(frame)
+    assert len(frame) == HEADER.size + length
+    return kind, frame[HEADER.size :]
+
+
+def test_frames_round_trip():
+    assert decode(*_payload(encode_new(7, 3, "BTCUSD", "sell", 0.5, 16200.5))) == (7, 3, "SELL", 0.5, 16200.5, "BTCUSD")
+    assert decode(*_payload(encode_new(8, 3, "BTCUSD", "buy", 0.5))) == (8, 3, "BUY", 0.5, 0.0, "BTCUSD")
+    assert decode(*_payload(encode_new(9, 3, "BTCUSD", "hold", 0.5))) == (9, 3, "", 0.5, 0.0, "BTCUSD")
+    assert decode(*_payload(encode_cancel(10, 3, "ETHUSD", 42))) == (10, 3, 42, "ETHUSD")
+    assert decode(*_payload(encode_login(11, 3))) == (11, 3)
+    frames = (encode_new(0, 0, "A", "BUY", 1), encode_cancel(0, 0, "A", 0), encode_login(0, 0))
+    assert [_payload(frame)[0] for frame in frames] == [NEW, CANCEL, LOGIN]
+
+
+def test_malformed_frames_raise():
+    kind, payload = _payload(encode_cancel(1, 2, "BTCUSD", 3))
+    with pytest.raises(ValueError):
+        decode(kind, payload + b"x")
+    with pytest.raises(ValueError):
+        decode(99, payload)
+
+
+def _exchange():
+    exchange = Exchange(verbose=False)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    exchange.register_market(base="btc", qoute="usd")
+    for i in range(2):
+        exchange.register_account(name=f"a{i}")
+        exchange.deposit(i, "usd", 10**5)
+        exchange.deposit(i, "btc", 100)
+    return exchange
+
+
+async def _session(tmp_path, steps):
+    exchange = _exchange()
+    gateway = Gateway(exchange)
+    path = str(tmp_path / "exim.sock")
+    await gateway.start(path=path)
+    clients = [await GatewayClient.connect(path=path) for _ in range(2)]
+    try:
+        await steps(exchange, *clients)
+    finally:
+        for client in clients:
+            await client.close()
+        await gateway.close()
+
+
+async def _ack(client, ref):
+    kind, fields = await client.receive()
+    assert kind == ACK and fields[0] == ref
+    return fields
+
+
+async def _login(client, account_id):
+    ref = client.login(account_id)
+    await client.drain()
+    return (await _ack(client, ref))[2]
+
+
+def test_login_binds_one_account(tmp_path):
+    async def steps(exchange, client, _):
+        ref = client.new_order(0, "BTCUSD", "BUY", 1, 100)
+        await client.drain()
+        assert await _ack(client, ref) == (ref, -1, Code.INVALID_ACCOUNT)
+        for account_id, code in ((99, Code.INVALID_ACCOUNT), (0, Code.OK), (0, Code.OK), (1, Code.INVALID_ACCOUNT)):
+            assert await _login(client, account_id) == code
+        ref = client.new_order(1, "BTCUSD", "BUY", 1, 100)
+        await client.drain()
+        assert await _ack(client, ref) == (ref, -1, Code.INVALID_ACCOUNT)
+
+    asyncio.run(_session(tmp_path, steps))
+
+
+def test_acks_and_fills(tmp_path):
+    async def steps(exchange, maker, taker):
+        assert await _login(maker, 0) == await _login(taker, 1) == Code.OK
+        ref = maker.new_order(0, "BTCUSD", "SELL", 1, 100)
+        await maker.drain()
+        _, order_id, code = await _ack(maker, ref)
+        assert code == Code.OK and order_id == 0
+        ref = taker.new_order(1, "BTCUSD", "BUY", 0.5, 100)
+        await taker.drain()
+        messages = sorted([await taker.receive() for _ in range(2)], key=lambda message: message[0])
+        assert [kind for kind, _ in messages] == [ACK, FILL]
+        assert messages[1][1][2:6] == (1, 1, "BUY", "TAKER")
+        kind, fields = await maker.receive()
+        assert kind == FILL and fields[2:6] == (0, 0, "SELL", "MAKER")
+        assert fields[6:] == (100.0, 0.5, "BTCUSD")
+        ref = maker.cancel(0, "BTCUSD", 0)
+        await maker.drain()
+        assert await _ack(maker, ref) == (ref, 0, Code.OK)
+        assert exchange.get_orders(0, "BTCUSD").loc[0, "status"] == "CANCELED"
+
+    asyncio.run(_session(tmp_path, steps))
+
+
+def test_rejected_orders_are_acked_with_their_code(tmp_path):
+    async def steps(exchange, client, _):
+        await _login(client, 0)
+        refs = [
+            client.new_order(0, "XYZ", "BUY", 1, 100),
+            client.new_order(0, "BTCUSD", "HOLD", 1, 100),
+            client.new_order(0, "BTCUSD", "BUY", 10**6, 100),
+            client.cancel(0, "BTCUSD", 42),
+        ]
+        await client.drain()
+        codes = [Code.INVALID_MARKET, Code.INVALID_SIDE, Code.NOT_ENOUGH_BALANCE, Code.ORDER_NOT_FOUND]
+        for ref, code in zip(refs, codes):
+            assert (await _ack(client, ref))[2] == code
+
+    asyncio.run(_session(tmp_path, steps))
+
+
+def test_many_messages_pass_the_inflight_limit(tmp_path):
+    async def steps(exchange, client, _):
+        await _login(client, 0)
+        refs = [client.new_order(0, "BTCUSD", "BUY", 0.001, 50 + i % 10) for i in range(3000)]
+        await client.drain()
+        for ref in refs:
+            assert (await _ack(client, ref))[2] == Code.OK
+        assert len(exchange.markets["BTCUSD"].orders) == 3000
+
+    asyncio.run(_session(tmp_path, steps))
+
+
+def test_out_of_range_values_are_rejected(tmp_path):
+    async def steps(exchange, client, _):
+        await _login(client, 0)
+        for quantity, price, code in (
+            (math.nan, 100, Code.INVALID_QUANTITY),
+            (math.inf, 100, Code.INVALID_QUANTITY),
+            (1e17, 100, Code.INVALID_QUANTITY),
+            (1, math.nan, Code.INVALID_PRICE),
+            (1, -math.inf, Code.INVALID_PRICE),
+            (1, 1e17, Code.INVALID_PRICE),
+        ):
+            ref = client.new_order(0, "BTCUSD", "BUY", quantity, price)
+            await client.drain()
+            assert await _ack(client, ref) == (ref, -1, code)
+        assert len(exchange.markets["BTCUSD"].orders) == 0
+
+    asyncio.run(_session(tmp_path, steps))
+
+
+def test_failed_batch_acks_each_frame_with_its_own_result(tmp_path):
+    async def steps(exchange, client, _):
+        await _login(client, 0)
+        place = exchange._place
+
+        def failing(account, market, side, quantity, *args):
+            if quantity == 2:
+                raise RuntimeError("failed order")
+            return place(account, market, side, quantity, *args)
+
+        exchange._place = failing
+        refs = [client.new_order(0, "BTCUSD", "BUY", quantity, 100) for quantity in (1, 2, 3)]
+        await client.drain()
+        acks = [await _ack(client, ref) for ref in refs]
+        # frames that ran before the failure are acked as they ran, the failed one with INTERNAL_ERROR
+        assert acks[0] == (refs[0], 0, Code.OK) and acks[1] == (refs[1], -1, Code.INTERNAL_ERROR)
+        placed = [order_id for _, order_id, code in acks if code == Code.OK]
+        assert placed == sorted(exchange.markets["BTCUSD"].orders)
+        exchange._place = place
+        ref = client.new_order(0, "BTCUSD", "BUY", 1, 100)
+        await client.drain()
+        _, order_id, code = await _ack(client, ref)
+        assert code == Code.OK and order_id >= 0
+
+    asyncio.run(_session(tmp_path, steps))
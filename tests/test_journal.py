@@ -0,0 +1,112 @@
+from exim import Exchange, VirtualClock
+from exim.archive import Retention
+from exim.journal import Journal
+import random
+import pytest
+import time
+import os
+
+
+def _trade(exchange, seed: int, count: int = 400):
+    rng = random.Random(seed)
+    for i in range(count):
+        account_id = rng.randrange(3)
+        if i and rng.random() < 0.15:
+            exchange.cancel(account_id, "BTCUSD", rng.randrange(i))
+        elif rng.random() < 0.5:
+            price = None if rng.random() < 0.2 else rng.randrange(9900, 10100) / 100
+            exchange.buy(account_id, "BTCUSD", rng.randrange(1, 2000) / 1000, price)
+        else:
+            exchange.sell(account_id, "BTCUSD", rng.randrange(1, 2000) / 1000, rng.randrange(9900, 10100) / 100)
+
+
+def _journaled(path: str, fixed_point: bool = False):
+    exchange = Exchange(verbose=False, fixed_point=fixed_point, journal=path)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    exchange.register_market(base="btc", qoute="usd")
+    for i in range(3):
+        exchange.register_account(name=f"a{i}")
+        exchange.deposit(i, "usd", 10**5)
+        exchange.deposit(i, "btc", 100)
+    return exchange
+
+
+def _state(exchange) -> tuple:
+    tape = exchange.markets["BTCUSD"].trades
+    trades = [tape.column(name).tolist() for name in ("id", "price", "quantity", "side", "maker", "taker")]
+    wallets = [exchange.get_wallet(i).to_dict() for i in exchange.accounts]
+    orders = [exchange.get_orders(i, "BTCUSD").to_dict() for i in exchange.accounts]
+    book = exchange.markets["BTCUSD"].orderbook
+    return trades, wallets, orders, list(book.bids.depth.items()), list(book.asks.depth.items())
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_replay_reproduces_state(tmp_path, fixed_point):
+    path = str(tmp_path / "exim.journal")
+    exchange = _journaled(path, fixed_point)
+    with exchange:
+        exchange.withdraw(0, "usd", 10.5)
+        _trade(exchange, seed=1)
+    # leaving the block flushed and closed the journal
+    assert exchange.journal.file is None
+    assert _state(Exchange.replay(path)) == _state(exchange)
+
+
+def test_replay_ignores_a_truncated_tail(tmp_path):
+    path = str(tmp_path / "exim.journal")
+    exchange = _journaled(path)
+    _trade(exchange, seed=2)
+    exchange.close()
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:-7])
+    replayed = Exchange.replay(path)
+    assert 0 < len(replayed.markets["BTCUSD"].orders) <= len(exchange.markets["BTCUSD"].orders)
+
+
+def test_journal_continues_in_its_own_mode_only(tmp_path):
+    path = str(tmp_path / "exim.journal")
+    _journaled(path).close()
+    with Exchange(verbose=False, journal=path) as exchange:
+        exchange.register_account(name="late")
+    assert len(Exchange.replay(path).accounts) == 4
+    with pytest.raises(ValueError):
+        Exchange(verbose=False, fixed_point=True, journal=path)
+
+
+def test_idle_journal_is_synced(tmp_path):
+    path = str(tmp_path / "exim.journal")
+    journal = Journal(path, sync_every=10**6, sync_interval=0.01, fsync=False)
+    exchange = _journaled(journal)
+    size = os.path.getsize(path)
+    exchange.deposit(0, "usd", 1)
+    deadline = time.monotonic() + 2
+    while os.path.getsize(path) == size and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert os.path.getsize(path) > size
+    journal.close()
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_replay_evicts_by_record_time(tmp_path, fixed_point):
+    path = str(tmp_path / "exim.journal")
+    clock = VirtualClock(10**18)
+    exchange = Exchange(verbose=False, fixed_point=fixed_point, journal=path, clock=clock)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    exchange.register_market(base="btc", qoute="usd", retention=Retention(max_age=50_000, chunk=8))
+    for i in range(3):
+        exchange.register_account(name=f"a{i}")
+        exchange.deposit(i, "usd", 10**5)
+        exchange.deposit(i, "btc", 100)
+    rng = random.Random(1)
+    for _ in range(20):
+        clock.advance(rng.randrange(1, 3000))
+        _trade(exchange, rng.randrange(10**6), count=40)
+    exchange.journal.close()
+    # the replay happens long after the records, eviction still follows their times
+    replayed = Exchange.replay(path)
+    assert sorted(replayed.markets["BTCUSD"].orders) == sorted(exchange.markets["BTCUSD"].orders)
+    assert replayed.get_accounts().equals(exchange.get_accounts())
@@ -0,0 +1,37 @@
+from exim import Exchange
+import pytest
+import math
+
+
+def _exchange(fixed_point):
+    exchange = Exchange(verbose=False, fixed_point=fixed_point)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=8)
+    exchange.register_market(base="btc", qoute="usd")
+    exchange.register_account(name="a")
+    return exchange
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_withdraw_takes_from_the_unlocked_balance(fixed_point):
+    exchange = _exchange(fixed_point)
+    exchange.deposit(0, "usd", 1000)
+    exchange.buy(0, "BTCUSD", 1, 600)
+    # 600 are locked by the order
+    assert exchange.withdraw(0, "usd", 300)
+    assert not exchange.withdraw(0, "usd", 300)
+    wallet = exchange.get_wallet(0).astype(float)
+    assert wallet.loc["USD", "total"] == 700 and wallet.loc["USD", "available"] == 100
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_deposit_and_deposit_many_share_their_checks(fixed_point):
+    exchange = _exchange(fixed_point)
+    # an unknown account, an unknown symbol and quantities that are negative or not finite
+    invalid = ((7, "usd", 1), (0, "eth", 1), (0, "usd", -1), (0, "usd", math.nan), (0, "usd", math.inf))
+    for account_id, symbol, quantity in invalid:
+        assert exchange.deposit(account_id, symbol, quantity) is False
+        assert exchange.deposit_many([0, account_id], symbol, [1, quantity]) is False
+    assert float(exchange.get_wallet(0).loc["USD", "total"]) == 0
+    assert exchange.deposit(0, "usd", 10) and exchange.deposit_many([0, 0], "usd", [1, 2])
+    assert float(exchange.get_wallet(0).loc["USD", "total"]) == 13
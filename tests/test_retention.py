@@ -0,0 +1,111 @@
+from exim import Exchange, VirtualClock
+from exim.archive import Retention
+import random
+import pytest
+
+
+def _exchange(retention: Retention = None, fixed_point: bool = False):
+    exchange = Exchange(verbose=False, fixed_point=fixed_point)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    exchange.register_market(base="btc", qoute="usd", retention=retention)
+    for i in range(3):
+        exchange.register_account(name=f"a{i}")
+        exchange.deposit(i, "usd", 10**6)
+        exchange.deposit(i, "btc", 10**3)
+    rng = random.Random(1)
+    for i in range(600):
+        account_id = rng.randrange(3)
+        if i and rng.random() < 0.2:
+            exchange.cancel(account_id, "BTCUSD", rng.randrange(i))
+        elif rng.random() < 0.5:
+            exchange.buy(account_id, "BTCUSD", rng.randrange(1, 2000) / 1000, rng.randrange(9900, 10100) / 100)
+        else:
+            exchange.sell(account_id, "BTCUSD", rng.randrange(1, 2000) / 1000, rng.randrange(9900, 10100) / 100)
+    return exchange
+
+
+def _orders(exchange) -> list:
+    return [exchange.get_orders(i, "BTCUSD").drop(columns="time").to_dict() for i in exchange.accounts]
+
+
+def _trades(exchange, **selection) -> dict:
+    trades = exchange.get_trades("BTCUSD", **selection)
+    return dict(id=trades.index.tolist(), **{name: trades[name].tolist() for name in ("price", "quantity", "side", "maker", "taker")})
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_queries_read_through_the_archive(tmp_path, fixed_point):
+    retention = Retention(max_closed_orders=20, max_trades=30, path=str(tmp_path), chunk=8)
+    archived = _exchange(retention, fixed_point)
+    unlimited = _exchange(None, fixed_point)
+    market = archived.markets["BTCUSD"]
+    # the hot tier stays within the limits plus a chunk
+    assert len(market.closed_orders) <= 20 + 8
+    assert len(market.trades) <= 30 + 8
+    assert len(market.archive.orders()) > 0 and len(market.archive.trades()) > 0
+    assert _orders(archived) == _orders(unlimited)
+    assert _trades(archived) == _trades(unlimited)
+    assert _trades(archived, last_n=50) == _trades(unlimited, last_n=50)
+    everything = archived.get_trades("BTCUSD")
+    since = int(everything["time"].iloc[5])
+    assert _trades(archived, since=since)["id"] == everything.index[everything["time"] >= since].tolist()
+    for status in ("OPEN", "FILLED", "CANCELED"):
+        assert archived.get_orders(0, "BTCUSD", status).index.tolist() == unlimited.get_orders(0, "BTCUSD", status).index.tolist()
+
+
+def test_evicted_history_is_dropped_without_a_path():
+    exchange = _exchange(Retention(max_closed_orders=10, max_trades=10, chunk=1))
+    market = exchange.markets["BTCUSD"]
+    assert len(market.closed_orders) == 10
+    assert len(exchange.get_trades("BTCUSD")) == 10
+    assert all(order.id in market.orders for order in market.closed_orders.values())
+    for account in exchange.accounts.values():
+        assert all(order.status == "OPEN" for order in account.orders["BTCUSD"].open.values())
+
+
+def test_non_empty_archives_are_refused(tmp_path):
+    retention = Retention(max_closed_orders=20, max_trades=30, path=str(tmp_path), chunk=8)
+    market = _exchange(retention).markets["BTCUSD"]
+    orders, trades = len(market.archive.orders()), len(market.archive.trades())
+    exchange = Exchange(verbose=False)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    with pytest.raises(ValueError):
+        exchange.register_market(base="btc", qoute="usd", retention=retention)
+    assert "BTCUSD" not in exchange.markets
+    assert (len(market.archive.orders()), len(market.archive.trades())) == (orders, trades) != (0, 0)
+    # another path starts a new archive
+    assert exchange.register_market(base="btc", qoute="usd", retention=Retention(path=str(tmp_path / "new")))
+
+
+def test_max_age_is_judged_on_close_time(tmp_path):
+    clock = VirtualClock()
+    exchange = Exchange(verbose=False, clock=clock)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    exchange.register_market(base="btc", qoute="usd", retention=Retention(max_age=1000, chunk=1))
+    exchange.register_account(name="a")
+    exchange.deposit(0, "usd", 10**6)
+    market = exchange.markets["BTCUSD"]
+    exchange.buy(0, "BTCUSD", 1, 100)
+    clock.set(50)
+    exchange.buy(0, "BTCUSD", 1, 100)
+    # the older order closes first, the newer one much later
+    clock.set(100)
+    exchange.cancel(0, "BTCUSD", 0)
+    clock.set(5000)
+    exchange.cancel(0, "BTCUSD", 1)
+    assert list(market.closed_orders) == [1]
+    clock.set(5900)
+    exchange.buy(0, "BTCUSD", 1, 90)
+    assert list(market.closed_orders) == [1]
+    # a loaded exchange evicts by the same close times
+    path = str(tmp_path / "snapshot")
+    exchange.save_snapshot(path)
+    loaded = Exchange.load_snapshot(path)
+    assert loaded.markets["BTCUSD"].orders[1].close_time == 5000
+    for current in (exchange, loaded):
+        current.clock = VirtualClock(6001)
+        current.buy(0, "BTCUSD", 1, 90)
+        assert not current.markets["BTCUSD"].closed_orders and 1 not in current.markets["BTCUSD"].orders
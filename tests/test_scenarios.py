@@ -0,0 +1,82 @@
+from exim import Exchange, VirtualClock, Scheduler
+from exim.archive import Retention
+from exim.scenarios import run_scenarios
+from exim.simulation import RandomTrader
+import pytest
+import time
+import os
+
+
+def scenario(exchange, seed):
+    exchange.clock = VirtualClock()
+    scheduler = Scheduler(exchange)
+    for account_id in exchange.accounts:
+        scheduler.add_agent(RandomTrader(account_id, "BTCUSD", 100, seed=seed * 100 + account_id, interval=10**8))
+    scheduler.run(until=5 * 10**9)
+    return scheduler.processed
+
+
+def started(exchange, param):
+    # leave a file behind for every run that started
+    directory, index = param
+    open(os.path.join(directory, str(index)), "w").close()
+    return index
+
+
+def _template():
+    exchange = Exchange(verbose=False)
+    exchange.register_symbol("BTC", 4)
+    exchange.register_symbol("USD", 2)
+    exchange.register_market("BTC", "USD")
+    for i in range(10):
+        exchange.register_account(f"a{i}")
+        exchange.deposit(i, "BTC", 1000)
+        exchange.deposit(i, "USD", 10**6)
+    exchange.sell(0, "BTCUSD", 1, 101)
+    return exchange
+
+
+def _summary(result):
+    return result.param, result.trades, result.prices, result.metrics, {s: t.tolist() for s, t in result.totals.items()}
+
+
+def test_pool_runs_match_serial_runs():
+    template = _template()
+    serial = list(run_scenarios(template, scenario, range(6), processes=1))
+    assert [result.index for result in serial] == list(range(6))
+    assert all(result.trades["BTCUSD"] > 0 for result in serial)
+    # every run starts from the template, which is left as it was
+    assert all(result.totals["BTC"].sum() == 10000 for result in serial)
+    assert len(template.get_trades("BTCUSD")) == 0 and len(template.markets["BTCUSD"].orders) == 1
+    pooled = sorted(run_scenarios(template, scenario, range(6), processes=3), key=lambda result: result.index)
+    assert list(map(_summary, pooled)) == list(map(_summary, serial))
+    ordered = list(run_scenarios(template, scenario, range(6), processes=2, ordered=True))
+    assert [result.index for result in ordered] == list(range(6))
+    assert len({result.trades["BTCUSD"] for result in serial}) > 1
+
+
+def test_snapshot_file_template(tmp_path):
+    path = str(tmp_path / "template")
+    _template().save_snapshot(path)
+    (result,) = run_scenarios(path, scenario, [4], processes=1)
+    (expected,) = run_scenarios(_template(), scenario, [4], processes=1)
+    assert _summary(result) == _summary(expected)
+
+
+def test_runs_in_flight_are_bounded(tmp_path):
+    directory = str(tmp_path)
+    runs = run_scenarios(_template(), started, [(directory, i) for i in range(10)], processes=2, max_pending=3)
+    first = next(runs)
+    time.sleep(0.3)
+    # nothing more starts until the consumer asks for the next result
+    assert first.metrics in range(3) and len(os.listdir(directory)) == 3
+    assert sorted([first.metrics] + [result.metrics for result in runs]) == list(range(10))
+    assert len(os.listdir(directory)) == 10
+
+
+def test_archiving_templates_are_rejected(tmp_path):
+    template = _template()
+    template.register_symbol("ETH", 3)
+    template.register_market("ETH", "USD", retention=Retention(max_trades=10, path=str(tmp_path)))
+    with pytest.raises(ValueError):
+        next(run_scenarios(template, scenario, range(2), processes=1))
@@ -0,0 +1,148 @@
+from exim import Exchange, VirtualClock
+from exim.sharding import ShardedExchange
+import random
+import pytest
+
+MARKETS = ("BTCUSD", "ETHUSD")
+
+
+def _setup(exchange):
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    exchange.register_symbol("eth", unit_decimals=2)
+    exchange.register_market(base="btc", qoute="usd")
+    exchange.register_market(base="eth", qoute="usd")
+    for i in range(3):
+        exchange.register_account(name=f"a{i}")
+        exchange.deposit(i, "usd", 10**5)
+        exchange.deposit(i, "btc", 100)
+        exchange.deposit(i, "eth", 1000)
+    return exchange
+
+
+def _trade(exchange, seed: int, count: int = 300):
+    rng = random.Random(seed)
+    for _ in range(count):
+        account_id = rng.randrange(3)
+        market = rng.choice(MARKETS)
+        mid = 100 if market == "BTCUSD" else 10
+        if rng.random() < 0.15:
+            open_orders = exchange.get_orders(account_id, market, "OPEN").index.tolist()
+            if open_orders:
+                exchange.cancel(account_id, market, rng.choice(open_orders))
+            continue
+        quantity = rng.randrange(1, 3000) / 1000
+        price = None if rng.random() < 0.2 else mid * rng.randrange(98, 103) / 100
+        (exchange.buy if rng.random() < 0.5 else exchange.sell)(account_id, market, quantity, price)
+
+
+def _state(exchange) -> tuple:
+    wallets = [exchange.get_wallet(i).to_dict() for i in exchange.accounts]
+    orders = [exchange.get_orders(i, market).drop(columns="time").to_dict() for i in exchange.accounts for market in MARKETS]
+    trades = [exchange.get_trades(market).drop(columns="time").to_dict() for market in MARKETS]
+    return wallets, orders, trades
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_parity_with_exchange(fixed_point):
+    exchange = _setup(Exchange(verbose=False, fixed_point=fixed_point))
+    _trade(exchange, seed=1)
+    with ShardedExchange(shards=2, verbose=False, fixed_point=fixed_point) as sharded:
+        _setup(sharded)
+        _trade(sharded, seed=1)
+        assert _state(sharded) == _state(exchange)
+
+
+def test_process_orders_parity():
+    rng = random.Random(2)
+    batches = [
+        [
+            dict(
+                account_id=rng.randrange(3),
+                market=market,
+                side=rng.choice(["BUY", "SELL"]),
+                quantity=rng.randrange(1, 2000) / 1000,
+                price=(100 if market == "BTCUSD" else 10) * rng.randrange(98, 103) / 100,
+            )
+            for market in (rng.choice(MARKETS) for _ in range(40))
+        ]
+        for _ in range(8)
+    ]
+    exchange = _setup(Exchange(verbose=False))
+    with ShardedExchange(shards=2, verbose=False) as sharded:
+        _setup(sharded)
+        for batch in batches:
+            codes, order_ids = exchange.process_orders(batch)
+            sharded_codes, sharded_order_ids = sharded.process_orders(batch)
+            assert codes.tolist() == sharded_codes.tolist()
+            assert order_ids.tolist() == sharded_order_ids.tolist()
+        assert _state(sharded) == _state(exchange)
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_snapshots_and_replay_go_through_the_shards(tmp_path, fixed_point):
+    journal, snapshot = str(tmp_path / "exim.journal"), str(tmp_path / "exim.snapshot")
+    exchange = _setup(Exchange(verbose=False, fixed_point=fixed_point, journal=journal, clock=VirtualClock()))
+    _trade(exchange, seed=3)
+    exchange.close()
+    exchange.journal = None
+    exchange.clock.advance(10**9)
+    exchange.save_snapshot(snapshot)
+    with ShardedExchange.load_snapshot(snapshot, shards=2) as sharded:
+        assert sharded.clock.now() == exchange.clock.now() == 10**9
+        assert _state(sharded) == _state(exchange)
+        sharded.save_snapshot(snapshot + ".sharded")
+        assert _state(Exchange.load_snapshot(snapshot + ".sharded")) == _state(exchange)
+        _trade(exchange, seed=4, count=100)
+        _trade(sharded, seed=4, count=100)
+        assert _state(sharded) == _state(exchange)
+    with ShardedExchange.replay(journal) as sharded:
+        assert _state(sharded) == _state(Exchange.replay(journal))
+
+
+def _proceeds(exchange):
+    # account 0 pays for its eth with the usd of its btc sold to account 1 on the other shard in the same batch
+    for symbol in ("usd", "btc", "eth"):
+        exchange.register_symbol(symbol, unit_decimals=2)
+    exchange.register_market(base="btc", qoute="usd")
+    exchange.register_market(base="eth", qoute="usd")
+    for i in range(2):
+        exchange.register_account(name=f"a{i}")
+    exchange.deposit(0, "btc", 1)
+    exchange.deposit(1, "eth", 1)
+    exchange.deposit(1, "usd", 100)
+    exchange.sell(0, "BTCUSD", 1, 100)
+    exchange.sell(1, "ETHUSD", 1, 50)
+    return exchange
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_maker_proceeds_reach_later_orders_on_other_shards(fixed_point):
+    batch = [
+        dict(account_id=1, market="BTCUSD", side="BUY", quantity=1, price=100),
+        dict(account_id=0, market="ETHUSD", side="BUY", quantity=1, price=50),
+    ]
+    exchange = _proceeds(Exchange(verbose=False, fixed_point=fixed_point))
+    codes, order_ids = exchange.process_orders(batch)
+    assert codes.tolist() == [0, 0] and order_ids.tolist() == [1, 1]
+    assert float(exchange.get_wallet(0).loc["ETH", "total"]) == 1
+    with ShardedExchange(shards=2, verbose=False, fixed_point=fixed_point) as sharded:
+        _proceeds(sharded)
+        assert sharded.placement["BTCUSD"] is not sharded.placement["ETHUSD"]
+        sharded_codes, sharded_order_ids = sharded.process_orders(batch)
+        assert sharded_codes.tolist() == codes.tolist() and sharded_order_ids.tolist() == order_ids.tolist()
+        assert _state(sharded)[0] == _state(exchange)[0]
+    with ShardedExchange(shards=2, verbose=False, fixed_point=fixed_point, batch_size=4) as queued:
+        _proceeds(queued)
+        queued.flush()
+        for order in batch:
+            queued.buy(order["account_id"], order["market"], order["quantity"], order["price"])
+        assert queued.flush() == [(0, 1), (0, 1)]
+        assert _state(queued) == _state(exchange)
+
+
+def test_markets_are_spread_over_the_shards():
+    with ShardedExchange(shards=2, verbose=False) as sharded:
+        _setup(sharded)
+        assert sharded.placement["BTCUSD"] is not sharded.placement["ETHUSD"]
+        assert sharded.get_trades("XYZ") is None
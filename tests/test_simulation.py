@@ -0,0 +1,46 @@
+from exim import Exchange, VirtualClock, Scheduler
+from exim.simulation import RandomTrader
+import pytest
+
+
+def _run(seed):
+    exchange = Exchange(verbose=False, clock=VirtualClock())
+    exchange.register_symbol("BTC", 8)
+    exchange.register_symbol("USD", 2)
+    exchange.register_market("BTC", "USD")
+    scheduler = Scheduler(exchange)
+    for account_id in range(10):
+        exchange.register_account(f"trader{account_id}")
+        exchange.deposit(account_id, "BTC", 100)
+        exchange.deposit(account_id, "USD", 10**6)
+        scheduler.add_agent(RandomTrader(account_id, "BTCUSD", price=1000, seed=seed + account_id, interval=10**9))
+    scheduler.submit(30 * 10**9, dict(account_id=0, market="BTCUSD", side="BUY", quantity=5))
+    scheduler.run(until=60 * 10**9)
+    trades = exchange.get_trades("BTCUSD")
+    return scheduler, trades
+
+
+def test_same_seeds_give_the_same_run():
+    scheduler, trades = _run(0)
+    assert scheduler.clock.now() == 60 * 10**9 and scheduler.processed > 500 and len(trades)
+    assert trades["time"].is_monotonic_increasing and trades["time"].iloc[-1] <= 60 * 10**9
+    other, again = _run(0)
+    assert other.processed == scheduler.processed and again.equals(trades)
+    assert not _run(1)[1].equals(trades)
+
+
+def test_events_run_in_time_then_scheduling_order():
+    clock = VirtualClock(start=10)
+    scheduler = Scheduler(Exchange(verbose=False, clock=clock))
+    seen = []
+    scheduler.at(30, seen.append, "c")
+    scheduler.at(20, seen.append, "a")
+    scheduler.at(20, seen.append, "b")
+    scheduler.after(5, lambda: scheduler.after(0, seen.append, "d"))
+    assert scheduler.run(until=20) == 4 and seen == ["d", "a", "b"] and clock.now() == 20
+    assert scheduler.run(until=25) == 0 and clock.now() == 25
+    assert scheduler.run() == 1 and seen[-1] == "c" and clock.now() == 30
+    with pytest.raises(AssertionError):
+        scheduler.at(29, seen.append, "e")
+    with pytest.raises(AssertionError):
+        Scheduler(Exchange(verbose=False))
@@ -0,0 +1,118 @@
+from exim import Exchange, VirtualClock
+from exim.clock import WallClock
+from exim.archive import Retention
+import random
+import pytest
+
+
+def _exchange(fixed_point: bool = False, retention: Retention = None, clock=None):
+    exchange = Exchange(verbose=False, fixed_point=fixed_point, clock=clock)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    exchange.register_market(base="btc", qoute="usd", retention=retention)
+    for i in range(3):
+        exchange.register_account(name=f"a{i}")
+        exchange.deposit(i, "usd", 10**5)
+        exchange.deposit(i, "btc", 100)
+    return exchange
+
+
+def _trade(exchange, seed: int, count: int = 400):
+    rng = random.Random(seed)
+    for _ in range(count):
+        account_id = rng.randrange(3)
+        if rng.random() < 0.15:
+            open_orders = list(exchange.accounts[account_id].orders["BTCUSD"].open)
+            if open_orders:
+                exchange.cancel(account_id, "BTCUSD", rng.choice(open_orders))
+        elif rng.random() < 0.5:
+            price = None if rng.random() < 0.2 else rng.randrange(9900, 10100) / 100
+            exchange.buy(account_id, "BTCUSD", rng.randrange(1, 2000) / 1000, price)
+        else:
+            exchange.sell(account_id, "BTCUSD", rng.randrange(1, 2000) / 1000, rng.randrange(9900, 10100) / 100)
+
+
+def _queue(queue) -> list:
+    ids = []
+    order = queue.head
+    while order is not None:
+        ids.append(order.id)
+        order = order.next
+    return ids
+
+
+def _state(exchange) -> tuple:
+    # everything but the times of trades and orders placed after a snapshot
+    tape = exchange.markets["BTCUSD"].trades
+    trades = [tape.column(name).tolist() for name in ("id", "price", "quantity", "side", "maker", "taker")]
+    wallets = [exchange.get_wallet(i).to_dict() for i in exchange.accounts]
+    orders = [exchange.get_orders(i, "BTCUSD").drop(columns="time").to_dict() for i in exchange.accounts]
+    book = exchange.markets["BTCUSD"].orderbook
+    queues = [_queue(tree.tree[price]) for tree in (book.bids, book.asks) for price in tree.tree]
+    return trades, wallets, orders, queues
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_round_trip(tmp_path, fixed_point):
+    path = str(tmp_path / "exim.snapshot")
+    exchange = _exchange(fixed_point)
+    _trade(exchange, seed=1)
+    exchange.save_snapshot(path)
+    loaded = Exchange.load_snapshot(path)
+    assert loaded.fixed_point == fixed_point
+    assert _state(loaded) == _state(exchange)
+    assert exchange.get_trades("BTCUSD")["time"].tolist() == loaded.get_trades("BTCUSD")["time"].tolist()
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_loaded_exchange_continues_the_same(tmp_path, fixed_point):
+    # ids and queue positions survive, so the same later flow gives the same results
+    path = str(tmp_path / "exim.snapshot")
+    exchange = _exchange(fixed_point)
+    _trade(exchange, seed=2)
+    exchange.save_snapshot(path)
+    loaded = Exchange.load_snapshot(path)
+    _trade(exchange, seed=3)
+    _trade(loaded, seed=3)
+    assert _state(loaded) == _state(exchange)
+
+
+def test_round_trip_with_retention(tmp_path):
+    path = str(tmp_path / "exim.snapshot")
+    exchange = _exchange(retention=Retention(max_closed_orders=20, max_trades=50, chunk=8))
+    _trade(exchange, seed=4)
+    exchange.save_snapshot(path)
+    loaded = Exchange.load_snapshot(path)
+    assert list(loaded.markets["BTCUSD"].closed_orders) == list(exchange.markets["BTCUSD"].closed_orders)
+    assert _state(loaded) == _state(exchange)
+
+
+@pytest.mark.parametrize("fixed_point", [False, True], ids=["float", "fixed_point"])
+def test_clock_stops_and_expiries_are_restored(tmp_path, fixed_point):
+    path = str(tmp_path / "exim.snapshot")
+    exchange = _exchange(fixed_point, clock=VirtualClock(10**9))
+    _trade(exchange, seed=5)
+    for i in range(3):
+        exchange.clock.advance(10)
+        exchange.buy(i, "BTCUSD", 1, 95 + i, time_in_force="GTT", expires=exchange.clock.now() + 100 * (i + 1))
+        exchange.sell(i, "BTCUSD", 1, stop=90 + i)
+    exchange.save_snapshot(path)
+    loaded = Exchange.load_snapshot(path)
+    assert isinstance(loaded.clock, VirtualClock) and loaded.clock.now() == exchange.clock.now()
+    market = loaded.markets["BTCUSD"]
+    expiries = [sorted(entry[:2] for entry in each.markets["BTCUSD"].expiries) for each in (exchange, loaded)]
+    assert len(market.stops) == 3 and expiries[0] == expiries[1] and len(expiries[0]) == 3
+    for tree in (market.orderbook.bids, market.orderbook.asks):
+        assert tree.volume == sum(tree.depth.values()) and list(tree.depth) == list(tree.tree)
+    for i in range(3):
+        registries = (exchange.accounts[i].orders["BTCUSD"], loaded.accounts[i].orders["BTCUSD"])
+        assert list(registries[0].side["BUY"]) == list(registries[1].side["BUY"])
+        assert list(registries[0].side["SELL"]) == list(registries[1].side["SELL"])
+    # the same later flow expires and trades the same in both
+    for each in (exchange, loaded):
+        each.clock.advance(150)
+        assert each.expire("BTCUSD") == 1
+        _trade(each, seed=6)
+    assert _state(loaded) == _state(exchange)
+    _exchange().save_snapshot(path)
+    assert isinstance(Exchange.load_snapshot(path).clock, WallClock)
@@ -0,0 +1,49 @@
+from exim import Exchange
+from exim.codes import Code
+from exim.events import Observer
+import pytest
+
+
+class Recorder(Observer):
+    def __init__(self):
+        self.events = []
+
+    def on_triggered(self, event):
+        self.events.append(("TRIGGERED", event.order_id))
+
+    def on_rejected(self, event):
+        self.events.append(("REJECTED", event.code, event.order_id))
+
+
+@pytest.mark.parametrize("fixed_point", [False, True])
+def test_stops_cascade_in_one_call(fixed_point):
+    exchange = Exchange(verbose=False, fixed_point=fixed_point)
+    exchange.register_symbol("BTC", 4)
+    exchange.register_symbol("USD", 2)
+    exchange.register_market("BTC", "USD")
+    for i in range(4):
+        exchange.register_account(f"a{i}")
+    for i in range(3):
+        exchange.deposit(i, "BTC", 100)
+        exchange.deposit(i, "USD", 100000)
+    exchange.deposit(3, "BTC", 1)
+    for price in (99, 98, 97, 96, 95):
+        exchange.buy(0, "BTCUSD", 1, price)
+    # stops hold no funds, the one of account 3 is larger than its wallet
+    assert exchange.sell(1, "BTCUSD", 1, stop=98.5)
+    assert exchange.sell(2, "BTCUSD", 1, stop=97.5)
+    assert exchange.sell(3, "BTCUSD", 5, stop=99)
+    assert exchange.sell(2, "BTCUSD", 1, 96.5, stop=90)
+    assert exchange.get_wallet(2).loc["BTC", "available"] == 100
+    recorder = Recorder()
+    exchange.add_observer(recorder)
+    # trades at 99 and 98 trigger the stops at 99 and 98.5 in time order, the fill of the 98.5 stop at 97
+    # triggers the 97.5 stop which fills at 96, the stop at 99 finds too little left in the book
+    exchange.sell(0, "BTCUSD", 2)
+    assert recorder.events == [("TRIGGERED", 5), ("TRIGGERED", 6), ("REJECTED", Code.NOT_ENOUGH_ORDERS, 7)]
+    trades = exchange.get_trades("BTCUSD")
+    assert trades["price"].astype(float).tolist() == [99, 98, 97, 96]
+    assert trades["taker"].tolist() == [0, 0, 1, 2]
+    assert exchange.get_orders(3, "BTCUSD")["status"].tolist() == ["CANCELED"]
+    assert exchange.get_orders(2, "BTCUSD")["status"].tolist() == ["OPEN", "FILLED"]
+    assert list(exchange.markets["BTCUSD"].orderbook.bids.depth.keys()) == [exchange.markets["BTCUSD"].price_units(95)]
@@ -0,0 +1,55 @@
+from exim import Exchange
+from exim.tape import TradeTape
+import numpy as np
+
+
+def test_append_grows_and_keeps_views():
+    tape = TradeTape(capacity=2)
+    tape.append(0, 10, 100.0, 1.0, "BUY", 1, 2, 5, 6)
+    view = tape.column("price")
+    for i in range(1, 5):
+        tape.append(i, 10 + i, 100.0 + i, 1.0, "SELL", 2, 1, 5 + i, 6 + i)
+    assert len(tape) == 5 and tape.capacity == 8
+    assert tape.column("id").tolist() == [0, 1, 2, 3, 4]
+    assert tape.column("side").tolist() == [0, 1, 1, 1, 1]
+    assert tape.column("taker_order").tolist() == [6, 7, 8, 9, 10]
+    assert tape.last("price") == 104.0
+    # columns handed out before growing still read what they wrapped
+    assert view.tolist() == [100.0]
+
+
+def test_select():
+    tape = TradeTape()
+    for i in range(6):
+        tape.append(i, 10 * (i // 2), 1.0, 1.0, "BUY", 0, 1, i, i)
+    assert tape.select() == (0, 6)
+    assert tape.select(since=20) == (4, 6)
+    assert tape.select(since=5, last_n=3) == (3, 6)
+    assert tape.select(last_n=10) == (0, 6)
+
+
+def test_get_trades_wraps_the_tape():
+    exchange = Exchange(verbose=False)
+    exchange.register_symbol("usd", unit_decimals=2)
+    exchange.register_symbol("btc", unit_decimals=3)
+    exchange.register_market(base="btc", qoute="usd")
+    for name in ("maker", "taker"):
+        exchange.register_account(name=name)
+        exchange.deposit(len(exchange.accounts) - 1, "usd", 10**6)
+        exchange.deposit(len(exchange.accounts) - 1, "btc", 10**3)
+    for i in range(20):
+        exchange.sell(0, "BTCUSD", 1, 100 + i)
+        exchange.buy(1, "BTCUSD", 0.5)
+    tape = exchange.markets["BTCUSD"].trades
+    trades = exchange.get_trades("BTCUSD")
+    assert trades.index.tolist() == tape.column("id").tolist() == list(range(20))
+    assert np.shares_memory(trades["price"].to_numpy(), tape.column("price"))
+    assert trades["side"].tolist() == ["SELL"] * 20
+    assert trades["maker"].tolist() == [0] * 20 and trades["taker"].tolist() == [1] * 20
+    assert exchange.get_trades("BTCUSD", last_n=3).index.tolist() == [17, 18, 19]
+    since = int(tape.column("time")[10])
+    assert exchange.get_trades("BTCUSD", since=since).index.tolist() == [
+        i for i, time in enumerate(tape.column("time").tolist()) if time >= since
+    ]
+    assert exchange.markets["BTCUSD"].last_price == 109.0
+    assert exchange.get_trades("XYZ") is None
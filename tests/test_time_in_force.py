@@ -0,0 +1,81 @@
+from exim import Exchange, VirtualClock
+from exim.codes import Code
+from exim.events import Observer
+import pytest
+
+
+class Recorder(Observer):
+    def __init__(self):
+        self.events = []
+
+    def on_rejected(self, event):
+        self.events.append(("REJECTED", event.code))
+
+    def on_canceled(self, event):
+        self.events.append(("CANCELED", event.order_id))
+
+
+def _exchange(fixed_point, clock):
+    exchange = Exchange(verbose=False, fixed_point=fixed_point, clock=clock)
+    exchange.register_symbol("BTC", 4)
+    exchange.register_symbol("USD", 2)
+    exchange.register_market("BTC", "USD")
+    for i in range(3):
+        exchange.register_account(f"a{i}")
+        exchange.deposit(i, "BTC", 100)
+        exchange.deposit(i, "USD", 100000)
+    return exchange
+
+
+def _asks(market):
+    # every resting ask as (id, price, remaining quantity) in queue order
+    asks = []
+    for price, queue in market.orderbook.asks.tree.items():
+        order = queue.head
+        while order is not None:
+            asks.append((order.id, price, order.quantity))
+            order = order.next
+    return asks
+
+
+@pytest.mark.parametrize("fixed_point", [False, True])
+def test_fill_or_kill_rejection_leaves_the_book_untouched(fixed_point):
+    exchange = _exchange(fixed_point, VirtualClock(1000))
+    for price in (101, 102, 103):
+        exchange.sell(0, "BTCUSD", 1, price)
+    market = exchange.markets["BTCUSD"]
+    asks, wallet = _asks(market), exchange.get_wallet(1)
+    recorder = Recorder()
+    exchange.add_observer(recorder)
+    # three lots are available up to 103, only two up to 102
+    assert not exchange.buy(1, "BTCUSD", 3, 102, time_in_force="FOK")
+    assert not exchange.buy(1, "BTCUSD", 4, 103, time_in_force="FOK")
+    assert recorder.events == [("REJECTED", Code.NOT_ENOUGH_ORDERS)] * 2
+    assert _asks(market) == asks and exchange.get_wallet(1).equals(wallet)
+    assert not len(exchange.get_trades("BTCUSD")) and not len(exchange.get_orders(1, "BTCUSD"))
+    assert exchange.buy(1, "BTCUSD", 2, 102, time_in_force="FOK")
+    assert _asks(market) == asks[2:]
+
+
+@pytest.mark.parametrize("fixed_point", [False, True])
+def test_good_till_time_orders_expire_in_expiry_order(fixed_point):
+    clock = VirtualClock(1000)
+    exchange = _exchange(fixed_point, clock)
+    assert not exchange.buy(2, "BTCUSD", 1, 90, time_in_force="GTT")
+    assert not exchange.buy(2, "BTCUSD", 1, 90, time_in_force="GTT", expires=1000)
+    assert exchange.buy(2, "BTCUSD", 1, 90, time_in_force="GTT", expires=3000)
+    assert exchange.buy(2, "BTCUSD", 1, 91, time_in_force="GTT", expires=2000)
+    assert exchange.buy(2, "BTCUSD", 1, 89, time_in_force="GTT", expires=2500)
+    assert exchange.buy(2, "BTCUSD", 1, 88, time_in_force="GTT", expires=1500)
+    exchange.cancel(2, "BTCUSD", 3)
+    recorder = Recorder()
+    exchange.add_observer(recorder)
+    clock.set(2500)
+    assert exchange.expire() == 2
+    assert recorder.events == [("CANCELED", 1), ("CANCELED", 2)]
+    # the last one leaves the book before an order arriving at its expiry can trade with it
+    clock.set(3000)
+    exchange.sell(1, "BTCUSD", 1, 90)
+    assert recorder.events[2] == ("CANCELED", 0) and not len(exchange.get_trades("BTCUSD"))
+    assert exchange.get_orders(2, "BTCUSD")["status"].tolist() == ["CANCELED"] * 4
+    assert exchange.get_wallet(2).loc["USD", "available"] == 100000